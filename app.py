@@ -1,5 +1,11 @@
+import os
+import uuid
+
 import streamlit as st
 from core.agent import Agent
+from core.jobs import JobRejected, agent_run
+from core.resources import get_job_queue, measure, start_warmup, tenant_for
+from core.tracing import configure_logging, start_metrics_server
 
 # 1. Page Configuration
 st.set_page_config(
@@ -8,11 +14,23 @@ st.set_page_config(
     layout="wide"
 )
 
+# Write errors and traces to logs/, and serve /metrics when METRICS_PORT is set
+configure_logging()
+start_metrics_server()
+
+# Messages drawn per chat window, and tasks per page of the to-do board
+CHAT_WINDOW = int(os.getenv("CHAT_WINDOW", "20"))
+BOARD_PAGE_SIZE = int(os.getenv("TODO_BOARD_PAGE_SIZE", "10"))
+
 # 2. Sidebar Configuration
 with st.sidebar:
     st.header("⚙️ Settings")
     # Allow the user to change the model on the fly
     model_name = st.text_input("Ollama Model", value="llama3")
+    # An optional small model drafts the tool-selection steps; answers always come from the model above
+    draft_model = st.text_input("Draft Model (optional)", value=os.getenv("OLLAMA_DRAFT_MODEL", ""))
+    race_models = st.checkbox("Race draft and main model", value=os.getenv("MODEL_RACE", "0") == "1",
+                              disabled=not draft_model)
 
     st.header("👤 User Profile")
     user_name = st.text_input("Name", value="User")
@@ -25,16 +43,69 @@ with st.sidebar:
                                       value="You are a grumpy but brilliant coder. Be sarcastic but helpful in your Final Answers.")
 
     if st.button("Clear Chat History"):
+        # A run still in progress would answer into the cleared history
+        if st.session_state.get("active_job"):
+            get_job_queue().cancel(st.session_state.active_job)
+            st.session_state.active_job = None
         st.session_state.messages = []
         st.session_state.agent_history = []
+        st.session_state.chat_window = CHAT_WINDOW
         st.rerun()
 
 # 3. Session State Initialization
 # Streamlit reruns the script on every user interaction.
 # We use session_state to keep the agent and history alive between reruns.
-if "agent" not in st.session_state or st.session_state.get("current_model") != model_name:
-    st.session_state.agent = Agent(model_name=model_name)
-    st.session_state.current_model = model_name
+# Heavy resources (Chroma, embeddings, Ollama client) are shared process-wide and built on first use,
+# so this stays cheap.
+if "agent" not in st.session_state:
+    build = measure(lambda: Agent(model_name=model_name, draft_model=draft_model, race=race_models))
+    st.session_state.agent = build.pop("value")
+    st.session_state.agent_build_stats = build
+
+if "session_id" not in st.session_state:
+    # Owner of this session's background jobs (the per-user concurrency limit applies to it)
+    st.session_state.session_id = uuid.uuid4().hex
+
+job_queue = get_job_queue()
+# A cancelled run may still be winding down; until it has, the agent is still in use
+agent_busy = any(not job.done for job in job_queue.jobs(st.session_state.session_id))
+
+# Switching models only re-points the Brain; the agent, its tools and the loaded models stay warm.
+# Memory and tasks belong to the user named in the sidebar. Both wait until no run is using the agent.
+agent_settings = (model_name, draft_model, race_models, tenant_for(user_name))
+if st.session_state.get("agent_settings") != agent_settings and not agent_busy:
+    st.session_state.agent.set_models(model_name, draft_model, race_models)
+    st.session_state.agent.set_tenant(agent_settings[-1])
+    st.session_state.agent_settings = agent_settings
+todo_owner = st.session_state.agent.tenant
+
+# Load the model, memory and tools in the background while the page renders (once per process)
+warmup = start_warmup(model_name, draft_model, todo_owner)
+
+
+@st.fragment(run_every=1.0 if warmup is not None and not warmup.ready else None)
+def show_readiness():
+    """Shows the warmup progress until the backends are ready, then stops polling."""
+    status = warmup.status()
+    if status["state"] == "warming":
+        running = ", ".join(name for name, stage in status["stages"].items() if stage["status"] == "running")
+        st.caption(f"⏳ Warming up {running}... (you can already ask, the first answer may be slower)")
+        return
+    if status["state"] == "ready":
+        st.caption(f"🟢 Ready (booted in {status['seconds']:.1f}s)")
+    else:
+        errors = [stage["error"] for stage in status["stages"].values() if stage["error"]]
+        st.warning("⚠️ " + " ".join(errors))
+    # Polling started while warming; a full rerun redraws the fragment without it
+    if st.session_state.get("warmup_polling"):
+        st.session_state.warmup_polling = False
+        st.rerun()
+
+
+if warmup is not None:
+    st.session_state.warmup_polling = not warmup.ready
+    with st.sidebar:
+        show_readiness()
 
 if "messages" not in st.session_state:
     # Messages for the UI display
@@ -46,13 +117,14 @@ if "agent_history" not in st.session_state:
 
 # Check if this is the start of a new conversation (only greeting exists)
 if len(st.session_state.messages) == 1:
-    tasks = st.session_state.agent.todo_manager.get_tasks()
-    # Filter only pending tasks
-    pending_tasks = [t for t in tasks if t['status'] == 'pending']
+    # Count the pending tasks and fetch only the first one (served from the status index)
+    todo_manager = st.session_state.agent.todo_manager
+    pending_count = todo_manager.count_tasks(status="pending", owner=todo_owner)
 
     # If there are pending tasks, the agent proactively offers to help
-    if pending_tasks:
-        proactive_msg = f"I see we still have {len(pending_tasks)} unfinished task(s), like '{pending_tasks[0]['task']}'. Shall we work on that?"
+    if pending_count:
+        first_task = todo_manager.get_tasks(status="pending", owner=todo_owner, limit=1)[0]
+        proactive_msg = f"I see we still have {pending_count} unfinished task(s), like '{first_task['task']}'. Shall we work on that?"
         st.session_state.messages.append({"role": "assistant", "content": proactive_msg})
         st.session_state.agent_history.append({"role": "assistant", "content": proactive_msg})
 
@@ -62,11 +134,32 @@ st.write("A local ReAct agent with tools: Search, Memory, To-Do, and Document Re
 
 chat_col, todo_col = st.columns([7, 3])
 
-with todo_col:
-    st.header("📋 Live To-Do Board")
+BOARD_FILTERS = {"All": None, "Pending": "pending", "Done": "done"}
+
 
-    # Fetch tasks directly from the agent's manager
-    current_tasks = st.session_state.agent.todo_manager.get_tasks()
+def turn_page(key: str, step: int = None) -> None:
+    """Moves a paged view forward or back (or, without a step, back to its first page)."""
+    st.session_state[key] = 0 if step is None else max(0, st.session_state.get(key, 0) + step)
+
+
+@st.fragment
+def show_todo_board():
+    """
+    Draws the board, one page at a time. It doesn't poll: it is redrawn with the page, when a running job sees the
+    task list change, or on its refresh button (e.g. for tasks added in another tab).
+    """
+    todo_manager = st.session_state.agent.todo_manager
+    # Read before the tasks, so a change made while they load still counts as new
+    st.session_state.board_version = todo_manager.version()
+    status = BOARD_FILTERS[st.radio("Show", list(BOARD_FILTERS), horizontal=True, key="board_filter",
+                                    label_visibility="collapsed", on_change=turn_page, args=("board_page", None))]
+    total = todo_manager.count_tasks(status=status, owner=todo_owner)
+    pages = max(1, -(-total // BOARD_PAGE_SIZE))
+    # The list may have shrunk since the page was chosen
+    page = st.session_state.board_page = min(st.session_state.get("board_page", 0), pages - 1)
+
+    current_tasks = todo_manager.get_tasks(
+        status=status, owner=todo_owner, limit=BOARD_PAGE_SIZE, offset=page * BOARD_PAGE_SIZE)
 
     if current_tasks:
         for t in current_tasks:
@@ -76,42 +169,108 @@ with todo_col:
             with st.container(border=True):
                 st.markdown(f"**{icon} Task ID: {t['id']}**")
                 st.write(t['task'])
+    elif status == "done":
+        st.info("No finished tasks yet.")
     else:
         st.info("No tasks pending. Add one via chat!")
 
-with chat_col:
-    # Display all previous messages in the chat interface
-    for msg in st.session_state.messages:
-        with st.chat_message(msg["role"]):
-            st.markdown(msg["content"])
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    if pages > 1:
+        prev_col.button("◀", key="board_prev", disabled=page == 0, on_click=turn_page, args=("board_page", -1))
+        page_col.caption(f"Page {page + 1} of {pages} ({total} tasks)")
+        next_col.button("▶", key="board_next", disabled=page >= pages - 1, on_click=turn_page,
+                        args=("board_page", 1))
+    # Reruns only this fragment
+    page_col.button("↻ Refresh", key="board_refresh", use_container_width=True)
 
-    # Chat Input and Processing
-    if prompt := st.chat_input("Ask me anything or give me a task..."):
-        # Show user message in UI immediately
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
 
-        # Trigger the Agent
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking and using tools..."):
-                response = st.session_state.agent.run(
-                    user_query=prompt,
-                    chat_history=st.session_state.agent_history,
-                    user_name=user_name,
-                    user_info=user_info,
-                    agent_name=agent_name,
-                    agent_role=agent_role,
-                    agent_instructions=agent_instructions
-                )
-                st.markdown(response)
+with todo_col:
+    st.header("📋 Live To-Do Board")
+    show_todo_board()
+
 
+def show_message(msg) -> None:
+    with st.chat_message(msg["role"]):
+        st.markdown(msg["content"])
+
+
+@st.fragment(run_every=0.5)
+def show_running_job(job_id: str):
+    """
+    Polls the background run of this session and renders its progress. It is only drawn while the job is
+    queued or running: once it finishes, a full rerun shows the answer with the other messages, refreshes the
+    board and stops the polling.
+    """
+    job = job_queue.get(job_id)
+    if st.session_state.get("active_job") != job_id or job is None:
+        st.session_state.active_job = None
+        st.rerun()
+
+    if job.done:
+        response = job.output or job.error or "Run cancelled."
         # Save assistant response to UI messages
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        st.session_state.messages.append({"role": "assistant", "content": response, "job": job.id})
 
         # Update the internal history for the LLM context
-        st.session_state.agent_history.append({"role": "user", "content": prompt})
+        st.session_state.agent_history.append({"role": "user", "content": job.description})
         st.session_state.agent_history.append({"role": "assistant", "content": response})
+        st.session_state.active_job = None
+        st.rerun()
 
-        # Rerun the app to instantly update the Live To-Do board on the right
-        st.rerun()
\ No newline at end of file
+    # Tasks the agent added or closed show up on the board right away
+    if st.session_state.agent.todo_manager.version() != st.session_state.get("board_version"):
+        st.rerun()
+
+    with st.chat_message("assistant"):
+        steps = [event["text"] for event in job.events if event["kind"] != "token"]
+        label = "Queued..." if job.status == "queued" else f"Thinking and using tools... ({len(steps)} steps)"
+        with st.status(label, expanded=False, state="running"):
+            for step in steps:
+                st.markdown(step)
+        if job.output:
+            st.markdown(job.output)
+        if st.button("Cancel", key=f"cancel-{job.id}"):
+            job.cancel()
+
+
+with chat_col:
+    # Only the latest messages are drawn; long conversations grow the window on demand
+    messages = st.session_state.messages
+    window = st.session_state.setdefault("chat_window", CHAT_WINDOW)
+    if len(messages) > window:
+        st.button(f"Show earlier messages ({len(messages) - window} hidden)", key="chat_earlier",
+                  on_click=lambda: st.session_state.update(chat_window=st.session_state.chat_window + CHAT_WINDOW))
+    for msg in messages[-window:]:
+        show_message(msg)
+
+    # The agent runs on a background worker; this page only polls it, so other interactions stay responsive
+    if st.session_state.get("active_job"):
+        show_running_job(st.session_state.active_job)
+
+    # Chat Input and Processing
+    if prompt := st.chat_input("Ask me anything or give me a task..."):
+        if st.session_state.get("active_job"):
+            st.toast("Still working on the previous question, ask again when it's answered.")
+            st.stop()
+        if agent_busy:
+            # A cleared run hasn't stopped yet; a new one would share the agent with it
+            st.toast("Still stopping the previous run, ask again in a moment.")
+            st.stop()
+        # Trigger the Agent
+        try:
+            job = job_queue.submit(st.session_state.session_id, "agent_run", agent_run(
+                st.session_state.agent,
+                user_query=prompt,
+                chat_history=list(st.session_state.agent_history),
+                user_name=user_name,
+                user_info=user_info,
+                agent_name=agent_name,
+                agent_role=agent_role,
+                agent_instructions=agent_instructions
+            ), description=prompt)
+        except JobRejected as e:
+            st.warning(str(e))
+        else:
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            st.session_state.active_job = job.id
+            st.rerun()
@@ -0,0 +1,211 @@
+"""
+End-to-end load test of the agent, fully offline: concurrent chat sessions against the fake Ollama server,
+fixture search results, hash embeddings and synthetic memory/todo/document corpora.
+
+Usage: python -m bench.agents [--sessions 8] [--queries 10] [--token-rate 200] [--latency 0.02] [--out bench/results]
+
+Results are printed and saved as JSON (named after the commit) for bench.compare.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from bench.corpora import memory_facts, todo_tasks, write_documents
+
+QUERY_TEMPLATES = [
+    "Hello!",
+    "What is the latest {word} version?",
+    "Search the news about {word} {word2}",
+    "Remind me to review the {word} report",
+    "Add a task: {word} {word2} by friday",
+    "Remember that I like {word} and {word2}",
+    "Summarize {document}",
+    "What does {document} say about {word}?",
+    "What do you know about my {word}?",
+    "Explain {word} {word2} to me",
+]
+
+
+def git_revision() -> str:
+    """Short commit hash of the working tree, marked '-dirty' if it has local changes."""
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def session_queries(count: int, documents: List[str], seed: int) -> List[str]:
+    from bench.corpora import WORDS
+    rng = random.Random(seed)
+    return [rng.choice(QUERY_TEMPLATES).format(word=rng.choice(WORDS), word2=rng.choice(WORDS),
+                                               document=rng.choice(documents)) for _ in range(count)]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Count and p50/p95/p99 of a list of millisecond timings."""
+    from tools.search import percentile
+    return {"count": len(values), **{f"p{int(q * 100)}_ms": round(percentile(values, q) or 0.0, 2)
+                                     for q in (0.5, 0.95, 0.99)}}
+
+
+def stage_percentiles(trace_path: str, trace_ids: set) -> Dict[str, Dict[str, float]]:
+    """Latency percentiles per span name, over the spans of the benchmark's runs."""
+    durations = defaultdict(list)
+    with open(trace_path, "r", encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            if span["trace_id"] in trace_ids:
+                durations[span["name"]].append(span["duration_ms"])
+    return {name: summarize(values) for name, values in sorted(durations.items())}
+
+
+class RssSampler:
+    """
+    Samples the resident memory of the process in the background and keeps the peak.
+    """
+    def __init__(self, interval: float = 0.05):
+        from core.resources import current_rss_mb
+        self._read = current_rss_mb
+        self.interval = interval
+        self.start_mb = current_rss_mb()
+        self.peak_mb = self.start_mb
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = self._read()
+            if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+                self.peak_mb = rss
+
+
+def configure_environment(workdir: str) -> None:
+    """Points every store at a scratch directory and every external service at an offline stand-in."""
+    os.environ.update({
+        "CHROMA_DB_PATH": os.path.join(workdir, "chroma_db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite"),
+        "MEMORY_EMBEDDER": "hash",
+        "TODO_FILE_PATH": os.path.join(workdir, "todo.json"),
+        "EXTRACTION_CACHE_DIR": os.path.join(workdir, "extraction_cache"),
+        "SEARCH_BACKEND": "fixture",
+        "SEARCH_CACHE_PATH": os.path.join(workdir, "search_cache.sqlite"),
+        "RESPONSE_CACHE_PATH": os.path.join(workdir, "response_cache.sqlite"),
+        "TRACE_LOG_PATH": os.path.join(workdir, "traces.jsonl"),
+        "LOG_DIR": workdir,
+    })
+    from core.tracing import configure_logging
+    configure_logging()
+
+
+def run_session(agent_factory, queries: List[str]) -> List[Dict[str, Any]]:
+    """One simulated user: asks its queries in order, carrying the chat history along."""
+    agent = agent_factory()
+    history, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        answer = agent.run(query, chat_history=list(history))
+        results.append({"seconds": time.perf_counter() - start, "error": answer.startswith("Error"),
+                        "trace_id": agent.latest_trace_id})
+        history += [{"role": "user", "content": query}, {"role": "assistant", "content": answer}]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent chat sessions")
+    parser.add_argument("--queries", type=int, default=10, help="queries per session")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="fake model tokens per second")
+    parser.add_argument("--prompt-rate", type=float, default=5000.0, help="fake prompt tokens evaluated per second")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake model latency per call in seconds")
+    parser.add_argument("--memories", type=int, default=500, help="facts seeded into long-term memory")
+    parser.add_argument("--tasks", type=int, default=200, help="tasks seeded into the to-do list")
+    parser.add_argument("--documents", type=int, default=4, help="documents available to read_file")
+    parser.add_argument("--model", default="llama3")
+    parser.add_argument("--out", default="bench/results", help="directory for the JSON results ('' to skip)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    configure_environment(workdir)
+
+    # Imported after the environment is set: some modules read their paths at import time
+    from bench.fake_ollama import FakeOllama, start_server
+    from core.agent import Agent
+    from core.resources import get_memory, get_todo_manager, get_response_cache
+    from core.tracing import tracer
+
+    fake = FakeOllama(token_rate=args.token_rate, prompt_rate=args.prompt_rate, latency=args.latency)
+    server = start_server(fake)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        seed_start = time.perf_counter()
+        get_memory().add_memories(memory_facts(args.memories))
+        todo_manager = get_todo_manager()
+        for task in todo_tasks(args.tasks):
+            todo_manager.add_task(task)
+        os.makedirs(os.path.join(workdir, "docs"))
+        documents = write_documents(os.path.join(workdir, "docs"), args.documents)
+        seed_seconds = time.perf_counter() - seed_start
+
+        workload = [session_queries(args.queries, documents, seed) for seed in range(args.sessions)]
+        start = time.perf_counter()
+        with RssSampler() as rss, ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            sessions = list(pool.map(lambda queries: run_session(lambda: Agent(model_name=args.model), queries),
+                                     workload))
+        elapsed = time.perf_counter() - start
+
+        runs = [run for session in sessions for run in session]
+        latencies = [run["seconds"] * 1000 for run in runs]
+        stages = stage_percentiles(tracer.path, {run["trace_id"] for run in runs})
+        results = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args),
+            "queries": len(runs),
+            "errors": sum(run["error"] for run in runs),
+            "seconds": round(elapsed, 3),
+            "seed_seconds": round(seed_seconds, 3),
+            "queries_per_sec": round(len(runs) / elapsed, 2),
+            "latency": summarize(latencies),
+            "llm_calls_per_query": round(stages.get("brain.chat", {}).get("count", 0) / len(runs), 2),
+            "rss_mb": {"start": round(rss.start_mb or 0, 1), "peak": round(rss.peak_mb or 0, 1)},
+            "fake_ollama": dict(fake.counters),
+            "response_cache": get_response_cache().stats() if get_response_cache() is not None else None,
+            "stages": stages,
+        }
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        path = os.path.join(args.out, f"agents-{results['timestamp'].replace(':', '')}-{results['revision']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Memory growth with and without deduplication: store size, duplicate ratio and search latency before and after
+compaction, and how many repeats the insert-time check catches.
+
+Usage: python -m bench.compaction [--size 20000] [--repeats 0.3] [--embedder hash]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from bench.corpora import memory_corpus, with_repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20000, help="distinct memories")
+    parser.add_argument("--repeats", type=float, default=0.3, help="repeated memories, as a share of --size")
+    parser.add_argument("--embedder", default="hash", help="embedder spec, see core.memory.create_embedder")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    os.environ.update({"CHROMA_DB_PATH": os.path.join(workdir, "chroma_db"), "MEMORY_EMBEDDER": args.embedder,
+                       "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite"),
+                       # Compaction is run explicitly below
+                       "MEMORY_COMPACT_EVERY": "0"})
+    from core.memory import Memory
+
+    try:
+        texts, _, _ = memory_corpus(args.size, queries=0)
+        texts = with_repeats(texts, args.repeats)
+
+        # Without the insert-time similarity check; content-hash ids still collapse verbatim repeats
+        memory = Memory(collection_name="bench_undeduplicated")
+        start = time.perf_counter()
+        memory.add_memories(texts, batch_size=500, dedupe=False)
+        ids_only = {"inserted": len(texts), "stored": memory.collection.count(),
+                          "load_seconds": round(time.perf_counter() - start, 1)}
+        compaction = memory.compact()
+
+        deduplicating = Memory(collection_name="bench_deduplicated")
+        start = time.perf_counter()
+        stored = deduplicating.add_memories(texts, batch_size=500)
+        deduplicated = {"inserted": len(texts), "stored": stored, "repeats_caught": deduplicating.stats["deduplicated"],
+                        "load_seconds": round(time.perf_counter() - start, 1)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"size": args.size, "repeats": args.repeats, "embedder": memory.embedder.name,
+                      "ids_only": ids_only, "compaction": compaction,
+                      "with_dedupe": deduplicated}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
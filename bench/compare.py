@@ -0,0 +1,89 @@
+"""
+Compares two bench.agents result files, e.g. before and after a change.
+
+Usage: python -m bench.compare [baseline.json candidate.json] [--fail-over 10]
+
+Without arguments the two most recent files in bench/results are compared.
+With --fail-over, exits with status 1 if any metric got worse by more than that many percent.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+
+# Metric path -> whether a higher value is better
+METRICS = [
+    (("queries_per_sec",), True),
+    (("latency", "p50_ms"), False),
+    (("latency", "p95_ms"), False),
+    (("llm_calls_per_query",), False),
+    (("rss_mb", "peak"), False),
+    (("fake_ollama", "prompt_tokens_evaluated"), False),
+]
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def lookup(results: Dict[str, Any], path: Tuple[str, ...]):
+    for key in path:
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    One row per metric (and per stage p95) with the relative change; 'worse' is signed by metric direction.
+    """
+    metrics = list(METRICS)
+    for stage in sorted(set(baseline.get("stages", {})) | set(candidate.get("stages", {}))):
+        metrics.append((("stages", stage, "p95_ms"), False))
+
+    rows = []
+    for path, higher_is_better in metrics:
+        before, after = lookup(baseline, path), lookup(candidate, path)
+        change = None
+        if before and after is not None:
+            change = (after - before) / before * 100
+        worse = None if change is None else (-change if higher_is_better else change)
+        rows.append({"metric": ".".join(path), "baseline": before, "candidate": after, "change_pct": change,
+                     "worse_pct": worse})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="baseline and candidate result files")
+    parser.add_argument("--results", default="bench/results", help="where to look for the latest results")
+    parser.add_argument("--fail-over", type=float, default=None, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(args.results, "agents-*.json")))[-2:]
+    if len(files) != 2:
+        parser.error("need a baseline and a candidate result file")
+    baseline, candidate = load(files[0]), load(files[1])
+
+    print(f"baseline:  {baseline.get('revision')} ({files[0]})")
+    print(f"candidate: {candidate.get('revision')} ({files[1]})\n")
+    print(f"{'metric':<40} {'baseline':>12} {'candidate':>12} {'change':>9}")
+
+    regressions = []
+    for row in compare(baseline, candidate):
+        change = f"{row['change_pct']:+.1f}%" if row["change_pct"] is not None else "n/a"
+        print(f"{row['metric']:<40} {str(row['baseline']):>12} {str(row['candidate']):>12} {change:>9}")
+        if args.fail_over is not None and row["worse_pct"] is not None and row["worse_pct"] > args.fail_over:
+            regressions.append(row["metric"])
+
+    if regressions:
+        print(f"\nRegressed by more than {args.fail_over}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Synthetic corpora for the benchmarks.
+"""
+import os
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+WORDS = ("python agent memory task search file report meeting budget deadline user likes coffee "
+         "project release version server model token cache vector query answer note contract "
+         "payment clause liability termination invoice schedule delivery warranty party notice").split()
+
+
+def sentence(rng: random.Random, min_words: int = 6, max_words: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + "."
+
+
+def page_texts(count: int, lines_per_page: int = 40, seed: int = 0) -> List[str]:
+    """Pages of random sentences, one sentence per line."""
+    rng = random.Random(seed)
+    return ["\n".join(sentence(rng) for _ in range(lines_per_page)) for _ in range(count)]
+
+
+def memory_facts(count: int, seed: int = 0) -> List[str]:
+    """Facts about users, as the agent would save them with save_memory."""
+    rng = random.Random(seed)
+    return [f"User {rng.randint(1, 50)} {rng.choice(['likes', 'works on', 'asked about', 'hates'])} "
+            f"{rng.choice(WORDS)} {rng.choice(WORDS)}. {sentence(rng)}" for _ in range(count)]
+
+
+def vocabulary(size: int, seed: int = 0) -> List[str]:
+    """Pronounceable made-up words, for corpora with a realistic (long-tailed) vocabulary."""
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def memory_corpus(count: int, queries: int = 300, seed: int = 0) -> Tuple[List[str], List[Dict[str, Any]],
+                                                                          List[Dict[str, Any]]]:
+    """
+    Memories with user/source/timestamp metadata and ground-truth queries for relevance benchmarks.
+    Word frequencies follow Zipf's law; every fifth memory mentions an identifier (invoice, file path, ticket).
+    Returns (texts, metadatas, queries); each query is {"kind", "query", "expected", "filter"}.
+    """
+    rng = random.Random(seed)
+    words = vocabulary(5000, seed)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    now = time.time()
+    texts, metadatas, identifiers = [], [], {}
+    for i in range(count):
+        user = f"user{rng.randint(1, 50)}"
+        text = " ".join(rng.choices(words, weights, k=rng.randint(6, 12)))
+        if i % 5 == 0:
+            identifier = rng.choice([f"INV-{i:06d}", f"/docs/{rng.choice(words)}_{i}.pdf", f"T-{i}"])
+            identifiers[i] = identifier
+            text += f" (reference {identifier})"
+        texts.append(f"{user.capitalize()} {rng.choice(['likes', 'works on', 'asked about', 'noted'])} {text}")
+        metadatas.append({"user": user, "source": rng.choice(["chat", "import", "document"]),
+                          "created_at": now - rng.random() * 90 * 86400})
+
+    cases = []
+    for _ in range(queries):
+        kind = rng.choice(["exact", "keywords", "filtered"])
+        i = rng.choice(list(identifiers)) if kind == "exact" else rng.randrange(count)
+        if kind == "exact":
+            identifier = identifiers[i]
+            query = f"What was {identifier.rsplit('/', 1)[-1]} about?"
+        else:
+            # The memory's rarest words, as someone recalling the gist would use them
+            own = sorted(set(texts[i].split()[2:]) & set(words), key=words.index)[-3:]
+            query = f"What do you know about {' '.join(own)}?"
+        cases.append({"kind": kind, "query": query, "expected": texts[i],
+                      "filter": {"user": metadatas[i]["user"]} if kind == "filtered" else {}})
+    return texts, metadatas, cases
+
+
+def with_repeats(texts: List[str], ratio: float, seed: int = 0) -> List[str]:
+    """
+    Adds ratio * len(texts) repeats of random texts, as a model saving the same fact again would write them:
+    verbatim, in another case and spacing, or with a word added or dropped.
+    """
+    rng = random.Random(seed)
+    repeats = []
+    for _ in range(int(len(texts) * ratio)):
+        words = rng.choice(texts).split()
+        variant = rng.randrange(4)
+        if variant == 1:
+            words = [word.lower() for word in words] + [""]
+        elif variant == 2:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(["really", "still", "indeed", "also"]))
+        elif variant == 3 and len(words) > 6:
+            del words[rng.randrange(len(words))]
+        repeats.append(" ".join(words))
+    combined = texts + repeats
+    rng.shuffle(combined)
+    return combined
+
+
+def todo_tasks(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [f"{rng.choice(['Send', 'Review', 'Fix', 'Prepare', 'Call about'])} the {rng.choice(WORDS)} "
+            f"{rng.choice(WORDS)} by {rng.choice(['monday', 'friday', 'tomorrow', 'next week'])}"
+            for _ in range(count)]
+
+
+def write_documents(directory: str, count: int, pages: int = 8) -> List[str]:
+    """Writes alternating PDF and TXT documents and returns their paths."""
+    paths = []
+    for i in range(count):
+        texts = page_texts(pages, seed=i)
+        if i % 2 == 0:
+            path = os.path.join(directory, f"report_{i}.pdf")
+            write_pdf(path, texts)
+        else:
+            path = os.path.join(directory, f"notes_{i}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(texts))
+        paths.append(path)
+    return paths
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[str]) -> None:
+    """
+    Writes a minimal text-only PDF (Helvetica, one line per text line) without any PDF library.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines = " T* ".join(f"({_pdf_escape(line)}) Tj" for line in text.split("\n"))
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {lines} ET".encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+    with open(path, "wb") as f:
+        f.write(output)
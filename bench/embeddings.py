@@ -0,0 +1,81 @@
+"""
+Embedding throughput and cache benchmark.
+
+Usage: python -m bench.embeddings [--embedder hash] [--size 2000] [--batch-size 64]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from bench.corpora import WORDS
+from core.memory import CachedEmbedder, create_embedder
+
+
+def synthetic_corpus(size: int, seed: int = 0):
+    """Random short facts; a third are near-duplicates that differ only in case and spacing."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        if corpus and rng.random() < 0.33:
+            corpus.append("  " + rng.choice(corpus).upper() + " ")
+        else:
+            corpus.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))))
+    return corpus
+
+
+def rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--embedder", default="hash", help="embedder spec, see core.memory.create_embedder")
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.size)
+    embedder = create_embedder(args.embedder)
+    results = {"embedder": embedder.name, "size": args.size}
+
+    start = time.perf_counter()
+    for text in corpus:
+        embedder.embed([text])
+    results["single_per_sec"] = rate(len(corpus), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, len(corpus), args.batch_size):
+        embedder.embed(corpus[i:i + args.batch_size])
+    results["batched_per_sec"] = rate(len(corpus), time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "cache.sqlite")
+        cached = CachedEmbedder(embedder, cache_path=cache_path, batch_size=args.batch_size)
+        start = time.perf_counter()
+        cached.embed(corpus)
+        results["cached_cold_per_sec"] = rate(len(corpus), time.perf_counter() - start)
+        results["cold_hit_rate"] = round(cached.hit_rate(), 3)
+
+        # Queries repeat stored facts, as when the agent re-searches what the user just said
+        queries = random.Random(1).choices(corpus, k=len(corpus))
+        start = time.perf_counter()
+        for query in queries:
+            cached.embed([query])
+        results["cached_warm_per_sec"] = rate(len(queries), time.perf_counter() - start)
+
+        # A fresh process: empty memory cache, warm disk cache
+        restarted = CachedEmbedder(embedder, cache_path=cache_path, batch_size=args.batch_size)
+        start = time.perf_counter()
+        restarted.embed(corpus)
+        results["disk_warm_per_sec"] = rate(len(corpus), time.perf_counter() - start)
+        results["cache_stats"] = dict(cached.stats, hit_rate=round(cached.hit_rate(), 3))
+        results["restart_cache_stats"] = dict(restarted.stats, hit_rate=round(restarted.hit_rate(), 3))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+PDF extraction throughput against worker count, cold and from the extraction cache.
+
+Usage: python -m bench.extraction [--pages 200] [--workers 1,2,4] [--pdf path/to/file.pdf]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from bench.corpora import page_texts, write_pdf
+from tools.extract import ExtractionCache, file_sha256
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=200, help="pages of the synthetic PDF")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--pdf", help="benchmark this PDF instead of a synthetic one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp, "synthetic.pdf")
+            write_pdf(pdf_path, page_texts(args.pages))
+
+        sha256 = file_sha256(pdf_path)
+        results = {"pdf": pdf_path, "runs": []}
+        for workers in [int(w) for w in args.workers.split(",")]:
+            cache = ExtractionCache(cache_dir=os.path.join(tmp, f"cache_{workers}"), workers=workers)
+
+            # Start the pool before timing, as a long-running server would have
+            cache.document(pdf_path)
+            os.remove(os.path.join(cache.cache_dir, sha256 + ".idx"))
+
+            start = time.perf_counter()
+            document = cache.document(pdf_path)
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            warm_pages = sum(1 for _ in cache.document(pdf_path).iter_pages())
+            warm = time.perf_counter() - start
+
+            start = time.perf_counter()
+            sub_range = sum(1 for _ in cache.document(pdf_path).iter_pages(10, 20))
+            ranged = time.perf_counter() - start
+
+            results["runs"].append({
+                "workers": workers,
+                "pages": len(document),
+                "cold_pages_per_sec": round(len(document) / cold, 1),
+                "cached_pages_per_sec": round(warm_pages / warm, 1),
+                "cached_range_ms": round(ranged * 1000, 2),
+                "range_pages": sub_range,
+            })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Deterministic stand-in for the Ollama HTTP API that replays scripted ReAct completions.
+
+Usage: python -m bench.fake_ollama [--port 11434] [--token-rate 50] [--latency 0.05] [--script script.json]
+                                   [--drift 0.2] [--no-tools] [--load-seconds 2] [--models JSON]
+
+A script is a list of rules {"match": <regex on the user query>, "steps": [<completion>, ...]}.
+The step is picked by how many assistant turns follow the last user query, so a multi-step
+ReAct run walks through the steps in order. The first matching rule wins.
+
+Requests with a JSON schema `format` get the step as a JSON object and requests with `tools` get native
+tool calls, as a model under constrained decoding would produce them. Free-text replies drift from the
+ReAct format with the given probability.
+
+--models overrides token_rate, prompt_rate and drift per model (e.g. a fast, sloppier draft model), and
+--load-seconds is charged on a model's first request, or the first one after a keep_alive of 0 unloaded it,
+and --embed-latency on every embedding request. Requests with options.num_predict stop after that many tokens.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.memory import HashEmbedder
+from core.parser import ACTION_PAIR_PATTERN, FINAL_MARKER, OBSERVATION_MARKER
+
+DEFAULT_SCRIPT = [
+    {"match": r"^(hi|hello|hey|thanks|thank you)\b",
+     "steps": ["Thought: A greeting, no tools needed.\nFinal Answer: Hello! What are we breaking today?"]},
+    {"match": r"\b(latest|search|news|version)\b",
+     "steps": ["Thought: I need to search the web.\nAction: search\nAction Input: {query}\n"
+               "Observation: (the model often invents this part)",
+               "Thought: I have the answer.\nFinal Answer: According to the search results, here is what I found."]},
+    {"match": r"\b(mark|done|finished)\b",
+     "steps": ["Thought: I should close the task.\nAction: mark_todo\nAction Input: {query}\n",
+               "Thought: Done.\nFinal Answer: Crossed it off. Look at you, being productive."]},
+    {"match": r"\b(remind|task|todo)\b",
+     "steps": ["Thought: I should add a task.\nAction: add_todo\nAction Input: {query}\n",
+               "Thought: The task is saved.\nFinal Answer: Added it to your list. Don't make me remind you twice."]},
+    {"match": r"\b(remember|note that)\b",
+     "steps": ["Thought: I should store this fact.\nAction: save_memory\nAction Input: {query}\n",
+               "Thought: Stored.\nFinal Answer: Noted. I will remember that."]},
+    {"match": r"(\S+\.(?:pdf|docx|txt))",
+     "steps": ["Thought: I need to read the document.\nAction: read_file\nAction Input: {match}\n",
+               "Thought: I have read the relevant passages.\nFinal Answer: The document says what you'd expect, "
+               "see the cited pages."]},
+    {"match": r"\b(what do you know|recall|my name)\b",
+     "steps": ["Thought: Let me check my memory.\nAction: search_memory\nAction Input: {query}\n",
+               "Thought: Found it.\nFinal Answer: Here is what I remember about you."]},
+    {"match": r".",
+     "steps": ["Thought: I can answer directly.\nFinal Answer: Here is a sarcastic but helpful answer to your question."]},
+]
+
+TOKEN_PATTERN = re.compile(r"\s*\S+|\s+")
+
+# Ways a free-text reply drifts from the ReAct format
+DRIFTS = [("Action Input:", "Using input:"), (FINAL_MARKER, "Answer:"), ("Action:", "I will use")]
+
+
+def _is_user_query(message: Dict[str, Any]) -> bool:
+    return message.get("role") == "user" and not str(message.get("content", "")).startswith("Observation")
+
+
+def _structure(text: str) -> Dict[str, Any]:
+    """Splits a scripted ReAct completion into thought, tool calls and final answer."""
+    text = text.split(OBSERVATION_MARKER, 1)[0]
+    thought = re.search(r"Thought:\s*(.*)", text)
+    return {
+        "thought": thought.group(1).strip() if thought else "",
+        "actions": [{"tool": action.strip(), "input": action_input.strip()}
+                    for action, action_input in ACTION_PAIR_PATTERN.findall(text)],
+        "final_answer": text.split(FINAL_MARKER, 1)[1].strip() if FINAL_MARKER in text else "",
+    }
+
+
+class FakeOllama:
+    """
+    Script, timing model and counters shared by all request handlers.
+    Prompt evaluation only pays for tokens after the prefix shared with the previous prompt, like llama.cpp.
+    """
+    def __init__(self, script: List[Dict[str, Any]] = None, token_rate: float = 50.0, prompt_rate: float = 1000.0,
+                 latency: float = 0.05, drift: float = 0.0, supports_tools: bool = True, load_seconds: float = 0.0,
+                 models: Dict[str, Dict[str, float]] = None, embed_latency: float = 0.0):
+        self.script = [(re.compile(rule["match"], re.IGNORECASE), rule["steps"]) for rule in (script or DEFAULT_SCRIPT)]
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self.latency = latency
+        self.drift = drift
+        self.supports_tools = supports_tools
+        # Loading weights is paid on a model's first request, and again after a keep_alive of 0 unloads it
+        self.load_seconds = load_seconds
+        # Per-model overrides of token_rate, prompt_rate and drift, e.g. a fast but sloppy draft model
+        self.models = models or {}
+        self.loaded = set()
+        self.calls_by_model: Dict[str, int] = {}
+        self.embedder = HashEmbedder()
+        # Time an embedding request takes (e.g. nomic-embed-text sharing the GPU with the chat model)
+        self.embed_latency = embed_latency
+        self.counters = {"chat_calls": 0, "generated_tokens": 0, "aborted_streams": 0, "prompt_tokens": 0,
+                         "prompt_tokens_evaluated": 0, "embed_calls": 0, "drifted": 0}
+        self._last_prompt: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def completion(self, messages: List[Dict[str, Any]]) -> str:
+        """Picks the scripted completion for the current step of the conversation."""
+        last_query = max((i for i, m in enumerate(messages) if _is_user_query(m)), default=-1)
+        query = str(messages[last_query]["content"]) if last_query >= 0 else ""
+        step = sum(1 for m in messages[last_query + 1:] if m.get("role") == "assistant")
+
+        for pattern, steps in self.script:
+            match = pattern.search(query)
+            if match:
+                text = steps[min(step, len(steps) - 1)]
+                return text.replace("{query}", query).replace("{match}", match.group(match.lastindex or 0))
+        return "Final Answer: ..."
+
+    def setting(self, model: str, name: str) -> float:
+        """A timing or drift setting, with the model's override if it has one."""
+        return self.models.get(model.split(":")[0], {}).get(name, getattr(self, name))
+
+    def load(self, model: str, keep_alive: Any = None) -> float:
+        """Returns the load time this request pays, and tracks which models stay loaded."""
+        with self._lock:
+            seconds = 0.0 if model in self.loaded else self.load_seconds
+            if keep_alive in (0, "0", "0s", "0m"):
+                self.loaded.discard(model)
+            else:
+                self.loaded.add(model)
+        return seconds
+
+    def reply(self, messages: List[Dict[str, Any]], format: Any = None, tools: List[Dict[str, Any]] = None,
+              model: str = "llama3") -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        The step in the shape the request asked for: (content, native tool calls).
+        """
+        text = self.completion(messages)
+        if tools:
+            step = _structure(text)
+            calls = [{"function": {"name": a["tool"], "arguments": {"input": a["input"]}}} for a in step["actions"]]
+            return ("" if calls else step["final_answer"]), calls
+        if format:
+            return json.dumps(_structure(text)), []
+
+        # The same prompt always drifts the same way, so runs are reproducible
+        rng = random.Random(hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode()).digest())
+        if rng.random() < self.setting(model, "drift"):
+            old, new = rng.choice([d for d in DRIFTS if d[0] in text] or DRIFTS)
+            text = text.replace(old, new)
+            self.count("drifted")
+        return text, []
+
+    def prompt_cost(self, model: str, messages: List[Dict[str, Any]]) -> Dict[str, float]:
+        """Counts prompt tokens, and the ones that miss the simulated prefix cache."""
+        prompt = "".join(f"{m.get('role')}:{m.get('content')}\n" for m in messages)
+        with self._lock:
+            cached = len(os.path.commonprefix([prompt, self._last_prompt.get(model, "")]))
+            self._last_prompt[model] = prompt
+            total, evaluated = len(prompt) // 4 + 1, (len(prompt) - cached) // 4 + 1
+            self.counters["chat_calls"] += 1
+            self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+            self.counters["prompt_tokens"] += total
+            self.counters["prompt_tokens_evaluated"] += evaluated
+        seconds = self.latency + evaluated / self.setting(model, "prompt_rate")
+        return {"total": total, "evaluated": evaluated, "seconds": seconds}
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake: FakeOllama = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            names = ["llama3"] + [name for name in self.fake.models if name != "llama3"]
+            self._json({"models": [{"name": f"{name}:latest", "model": f"{name}:latest"} for name in names]})
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if self.path == "/api/chat":
+            self._chat(self._body())
+        elif self.path == "/api/generate":
+            # Preload / keep-alive requests
+            body = self._body()
+            load_seconds = self.fake.load(body.get("model", "llama3"), body.get("keep_alive"))
+            time.sleep(load_seconds)
+            self._json({"model": body.get("model"), "response": "", "done": True,
+                        "load_duration": int(load_seconds * 1e9)})
+        elif self.path in ("/api/embed", "/api/embeddings"):
+            self._embed(self._body())
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def _embed(self, body: Dict[str, Any]) -> None:
+        texts = body.get("input", body.get("prompt", ""))
+        texts = [texts] if isinstance(texts, str) else texts
+        self.fake.count("embed_calls")
+        time.sleep(self.fake.embed_latency)
+        vectors = self.fake.embedder.embed(texts)
+        if self.path == "/api/embeddings":
+            self._json({"embedding": vectors[0]})
+        else:
+            self._json({"model": body.get("model"), "embeddings": vectors})
+
+    def _chat(self, body: Dict[str, Any]) -> None:
+        model, messages = body.get("model", "llama3"), body.get("messages", [])
+        if body.get("tools") and not self.fake.supports_tools:
+            self._json({"error": f"registry.ollama.ai/library/{model} does not support tools"}, 400)
+            return
+        text, tool_calls = self.fake.reply(messages, body.get("format"), body.get("tools"), model)
+        load_seconds = self.fake.load(model, body.get("keep_alive"))
+        cost = self.fake.prompt_cost(model, messages)
+        time.sleep(load_seconds + cost["seconds"])
+
+        tokens = TOKEN_PATTERN.findall(text)
+        # A capped request (e.g. a prefill with num_predict=1) stops after that many tokens
+        num_predict = (body.get("options") or {}).get("num_predict")
+        if num_predict is not None and num_predict >= 0:
+            tokens, tool_calls = tokens[:num_predict], []
+            text = "".join(tokens)
+        token_rate = self.fake.setting(model, "token_rate")
+        base = {"model": model, "created_at": datetime.now(timezone.utc).isoformat()}
+        final = {**base, "done": True, "done_reason": "stop", "load_duration": int(load_seconds * 1e9),
+                 "prompt_eval_count": cost["evaluated"], "prompt_eval_duration": int(cost["seconds"] * 1e9),
+                 "eval_count": len(tokens), "eval_duration": int(len(tokens) / token_rate * 1e9)}
+        final["total_duration"] = final["load_duration"] + final["prompt_eval_duration"] + final["eval_duration"]
+
+        if not body.get("stream", True):
+            time.sleep(len(tokens) / token_rate)
+            self.fake.count("generated_tokens", len(tokens))
+            message = {"role": "assistant", "content": text}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            self._json({**final, "message": message})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        try:
+            for token in tokens:
+                time.sleep(1 / token_rate)
+                self._chunk({**base, "message": {"role": "assistant", "content": token}, "done": False})
+                sent += 1
+            if tool_calls:
+                self._chunk({**base, "message": {"role": "assistant", "content": "", "tool_calls": tool_calls},
+                             "done": False})
+            self._chunk({**final, "message": {"role": "assistant", "content": ""}})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (early stop); generation ends here like in Ollama
+            self.fake.count("aborted_streams")
+            self.close_connection = True
+        finally:
+            self.fake.count("generated_tokens", sent)
+
+    def _chunk(self, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_server(fake: FakeOllama, port: int = 0) -> ThreadingHTTPServer:
+    """
+    Serves the fake API on a background thread. Port 0 picks a free port (see server.server_port).
+    """
+    handler = type("Handler", (_Handler,), {"fake": fake})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+def load_script(path: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    if not path:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="generated tokens per second")
+    parser.add_argument("--prompt-rate", type=float, default=1000.0, help="prompt tokens evaluated per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="fixed latency per request in seconds")
+    parser.add_argument("--script", help="JSON file with scripted completions")
+    parser.add_argument("--drift", type=float, default=0.0, help="probability of a free-text reply breaking format")
+    parser.add_argument("--no-tools", action="store_true", help="reject native tool calling like older models")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="time to load a model's weights")
+    parser.add_argument("--models", type=json.loads, default=None,
+                        help='per-model overrides, e.g. {"llama3.2": {"token_rate": 200, "drift": 0.1}}')
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="time per embedding request in seconds")
+    args = parser.parse_args()
+
+    fake = FakeOllama(load_script(args.script), args.token_rate, args.prompt_rate, args.latency, args.drift,
+                      not args.no_tools, args.load_seconds, args.models, args.embed_latency)
+    server = start_server(fake, args.port)
+    print(f"Fake Ollama listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
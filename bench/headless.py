@@ -0,0 +1,75 @@
+"""
+Throughput and latency of the headless batch runner at several concurrency levels, against the fake Ollama
+server (which, like Ollama with OLLAMA_NUM_PARALLEL, serves concurrent requests side by side).
+
+Usage: python -m bench.headless [--requests 200] [--concurrency 1,4,8] [--sessions 20] [--token-rate 50]
+
+Requests come from --sessions simulated users; a user's requests carry its session_id, so they run in order
+and continue the same conversation.
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from bench.agents import configure_environment, session_queries
+from bench.corpora import memory_facts, todo_tasks, write_documents
+
+
+def batch_lines(requests: int, sessions: int, documents):
+    """JSONL requests, round-robin over the simulated users."""
+    queries = [session_queries(requests // sessions + 1, documents, seed) for seed in range(sessions)]
+    return [json.dumps({"id": i, "session_id": f"user{i % sessions}", "user_name": f"User {i % sessions}",
+                        "query": queries[i % sessions][i // sessions]}) for i in range(requests)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,4,8", help="concurrency levels to compare")
+    parser.add_argument("--sessions", type=int, default=20, help="simulated users")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="fake model tokens per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency per call in seconds")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    configure_environment(workdir)
+    # Every request must reach the model for the levels to be comparable
+    os.environ.update({"RESPONSE_CACHE": "0", "WARMUP": "0"})
+
+    from bench.fake_ollama import FakeOllama, start_server
+    from core.headless import HeadlessRunner, run_batch
+    from core.resources import get_memory, get_todo_manager, tenant_for
+
+    fake = FakeOllama(token_rate=args.token_rate, latency=args.latency)
+    server = start_server(fake)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        # Requests carry a user_name, so each simulated user reads its own tenant's memory and tasks
+        for user in range(args.sessions):
+            tenant = tenant_for(f"User {user}")
+            get_memory(tenant).add_memories(memory_facts(max(1, 200 // args.sessions), seed=user))
+            for task in todo_tasks(max(1, 20 // args.sessions), seed=user):
+                get_todo_manager().add_task(task, owner=tenant or "")
+        os.makedirs(os.path.join(workdir, "docs"))
+        documents = write_documents(os.path.join(workdir, "docs"), 2, pages=2)
+        lines = batch_lines(args.requests, args.sessions, documents)
+
+        results = []
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            out = io.StringIO()
+            report = run_batch(HeadlessRunner(concurrency=concurrency), lines, out)
+            answered = [json.loads(line) for line in out.getvalue().splitlines()]
+            results.append({**report, "results_written": len(answered)})
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Relevance and latency of memory retrieval on a synthetic corpus: dense only, BM25 only, hybrid (reciprocal rank
+fusion) and hybrid with the dense query skipped when the keyword match is decisive.
+
+Usage: python -m bench.memory [--size 100000] [--queries 300] [--embedder hash]
+
+Queries ask for exact identifiers (invoice numbers, file names, tickets), for the rare words of a memory,
+and for the same with a user filter. Recall@3 counts queries whose memory is among the 3 results.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from bench.agents import summarize
+from bench.corpora import memory_corpus
+
+
+def dense_only(memory, query: str, n_results: int, filters: Dict[str, Any]) -> List[str]:
+    from core.memory import memory_filter
+    results = memory.collection.query(query_embeddings=memory.embedder.embed([query]), n_results=n_results,
+                                      where=memory_filter(**filters), include=["documents"])
+    return results["documents"][0]
+
+
+def lexical_only(memory, query: str, n_results: int, filters: Dict[str, Any]) -> List[str]:
+    from core.memory import metadata_matches
+    matches = memory.index.search(query, n_results * (20 if filters else 1))
+    if not matches:
+        return []
+    found = memory.collection.get(ids=[doc_id for doc_id, _, _ in matches], include=["documents", "metadatas"])
+    documents = {doc_id: text for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+                 if metadata_matches(metadata, **filters)}
+    return [documents[doc_id] for doc_id, _, _ in matches if doc_id in documents][:n_results]
+
+
+def hybrid(memory, margin: float):
+    """search_memory with a fixed lexical margin (0 always runs the dense query)."""
+    def search(query: str, n_results: int, filters: Dict[str, Any]) -> List[str]:
+        memory.lexical_margin = margin
+        return memory.search_memory(query, n_results, **filters)
+    return search
+
+
+def run_mode(name: str, search, cases, n_results: int = 3) -> Dict[str, Any]:
+    """Recall@n, MRR and latency of one retrieval strategy over every query, per query kind and overall."""
+    by_kind, latencies = {}, []
+    for case in cases:
+        start = time.perf_counter()
+        results = search(case["query"], n_results, case["filter"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        rank = results.index(case["expected"]) + 1 if case["expected"] in results else None
+        kind = by_kind.setdefault(case["kind"], {"queries": 0, "hits": 0, "reciprocal_rank": 0.0})
+        kind["queries"] += 1
+        kind["hits"] += rank is not None
+        kind["reciprocal_rank"] += 1 / rank if rank else 0.0
+
+    total = len(cases)
+    return {"mode": name,
+            "recall_at_3": round(sum(k["hits"] for k in by_kind.values()) / total, 3),
+            "mrr": round(sum(k["reciprocal_rank"] for k in by_kind.values()) / total, 3),
+            "by_kind": {kind: round(k["hits"] / k["queries"], 3) for kind, k in sorted(by_kind.items())},
+            "latency": summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000, help="memories in the corpus")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--embedder", default="hash", help="embedder spec, see core.memory.create_embedder")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    os.environ.update({"CHROMA_DB_PATH": os.path.join(workdir, "chroma_db"), "MEMORY_EMBEDDER": args.embedder,
+                       "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite"),
+                       "MEMORY_COMPACT_EVERY": "0"})
+    from core.memory import Memory
+
+    try:
+        texts, metadatas, cases = memory_corpus(args.size, args.queries)
+        memory = Memory()
+        start = time.perf_counter()
+        memory.add_memories(texts, metadatas, batch_size=1000, dedupe=False)
+        load_seconds = time.perf_counter() - start
+
+        # A restarted process rebuilds the keyword index from the collection
+        start = time.perf_counter()
+        indexed = len(Memory()._index())
+        rebuild_seconds = time.perf_counter() - start
+
+        results = [run_mode("dense", lambda *search_args: dense_only(memory, *search_args), cases),
+                   run_mode("bm25", lambda *search_args: lexical_only(memory, *search_args), cases),
+                   run_mode("hybrid", hybrid(memory, 0.0), cases)]
+        skipped_before = memory.stats["dense_skipped"]
+        results.append({**run_mode("hybrid + skip", hybrid(memory, 1.5), cases),
+                        "dense_skipped": memory.stats["dense_skipped"] - skipped_before})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"size": args.size, "queries": len(cases), "embedder": memory.embedder.name,
+                      "load_seconds": round(load_seconds, 1), "index_rebuild_seconds": round(rebuild_seconds, 2),
+                      "indexed": indexed, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
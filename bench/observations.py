@@ -0,0 +1,142 @@
+"""
+Prompt tokens and answer quality with and without the observation compressor, on multi-step research runs
+against the fake Ollama server: each run searches the web, reads a document and recalls a memory before
+answering, so every observation is re-sent with each later step.
+
+Usage: python -m bench.observations [--cases 30] [--modes off,bm25,hybrid] [--paragraphs 40]
+
+Each case plants one fact in the search results, one in the document and one in memory, among filler. The
+fake model answers with the planted facts it can see in its prompt, so "evidence_recall" is the share of
+them that survived compression (what a real model could have used to answer).
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from bench.agents import configure_environment, summarize
+from bench.corpora import memory_facts, sentence, vocabulary
+from bench.fake_ollama import FakeOllama, start_server
+
+QUERY = "Research {topic}: check the web, {document} and what you remember, then answer."
+QUERY_PATTERN = re.compile(r"^Research (.+?): check the web, (\S+) and")
+
+
+def make_cases(count: int, workdir: str, paragraphs: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Topics with a planted fact per source, the search fixtures and the documents that hold them."""
+    rng = random.Random(seed)
+    words = vocabulary(3 * count, seed=seed)
+    cases = []
+    for i in range(count):
+        topic, value = f"{words[3 * i]} {words[3 * i + 1]}", words[3 * i + 2]
+        facts = {"search": f"The {topic} release is codenamed {value}-{i}.",
+                 "document": f"The {topic} budget was approved by {value.capitalize()} Team {i}.",
+                 "memory": f"User {i} prefers {topic} deployments on day {i + 3}."}
+
+        results = [{"title": f"{topic} ({n})", "href": f"https://example.com/{i}/{n}",
+                    "body": " ".join(sentence(rng) for _ in range(5))} for n in range(3)]
+        results[rng.randrange(3)]["body"] += " " + facts["search"]
+
+        texts = ["\n".join(sentence(rng) for _ in range(6)) for _ in range(paragraphs)]
+        # The fact's paragraph also mentions the topic elsewhere, like a real section would
+        texts[rng.randrange(paragraphs)] += f"\n{facts['document']} The {topic} work continues."
+        document = os.path.join(workdir, f"research_{i}.txt")
+        with open(document, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(texts))
+        cases.append({"topic": topic, "document": document, "facts": facts, "results": results,
+                      "query": QUERY.format(topic=topic, document=document)})
+    return cases
+
+
+class ResearchModel(FakeOllama):
+    """
+    Walks every research query through search -> read_file -> search_memory -> answer, and answers with the
+    planted facts present in its prompt.
+    """
+    def __init__(self, cases: List[Dict[str, Any]], **kwargs):
+        super().__init__(**kwargs)
+        self.facts = [fact for case in cases for fact in case["facts"].values()]
+
+    def completion(self, messages: List[Dict[str, Any]]) -> str:
+        last_query = max(i for i, m in enumerate(messages) if m.get("role") == "user"
+                         and QUERY_PATTERN.match(str(m.get("content", ""))))
+        topic, document = QUERY_PATTERN.match(messages[last_query]["content"]).groups()
+        step = sum(1 for m in messages[last_query + 1:] if m.get("role") == "assistant")
+        steps = [("search", topic), ("read_file", document), ("search_memory", f"{topic} deployments")]
+        if step < len(steps):
+            return f"Thought: I need more information.\nAction: {steps[step][0]}\nAction Input: {steps[step][1]}\n"
+        prompt = "\n".join(str(m.get("content", "")) for m in messages[last_query:])
+        seen = [fact for fact in self.facts if fact in prompt]
+        return "Thought: I have the answer.\nFinal Answer: " + (" ".join(seen) or "I could not find it.")
+
+
+def run_mode(mode: str, cases: List[Dict[str, Any]], fake: ResearchModel) -> Dict[str, Any]:
+    from core.agent import Agent
+    from core.observations import ObservationCompressor
+
+    agent = Agent()
+    agent.compress_observations = mode != "off"
+    if mode != "off":
+        agent.observations = ObservationCompressor(scorer=mode)
+    before = dict(fake.counters)
+    latencies, recalls = [], []
+    for case in cases:
+        start = time.perf_counter()
+        # Each case is a new conversation, so the prompts only grow within a run
+        answer = agent.run(case["query"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(sum(fact in answer for fact in case["facts"].values()) / len(case["facts"]))
+    calls = fake.counters["chat_calls"] - before["chat_calls"]
+    return {
+        "mode": mode,
+        "prompt_tokens_per_run": round((fake.counters["prompt_tokens"] - before["prompt_tokens"]) / len(cases)),
+        "prompt_tokens_evaluated_per_run": round(
+            (fake.counters["prompt_tokens_evaluated"] - before["prompt_tokens_evaluated"]) / len(cases)),
+        "llm_calls_per_run": round(calls / len(cases), 2),
+        "evidence_recall": round(sum(recalls) / len(recalls), 3),
+        "latency": summarize(latencies),
+        "compression": agent.observations.stats() if mode != "off" else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=30)
+    parser.add_argument("--modes", default="off,bm25,hybrid", help="off, or the compressor's scorers to compare")
+    parser.add_argument("--paragraphs", type=int, default=40, help="paragraphs per document")
+    parser.add_argument("--memories", type=int, default=500, help="filler memories")
+    parser.add_argument("--prompt-rate", type=float, default=1000.0, help="fake prompt tokens evaluated per second")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    configure_environment(workdir)
+    os.environ.update({"RESPONSE_CACHE": "0", "WARMUP": "0", "MEMORY_COMPACT_EVERY": "0"})
+    cases = make_cases(args.cases, workdir, args.paragraphs)
+    fixtures = os.path.join(workdir, "search_fixtures.json")
+    with open(fixtures, "w", encoding="utf-8") as f:
+        json.dump({case["topic"]: case["results"] for case in cases}, f)
+    os.environ["SEARCH_BACKEND"] = f"fixture:{fixtures}"
+
+    fake = ResearchModel(cases, token_rate=500, latency=0.01, prompt_rate=args.prompt_rate)
+    server = start_server(fake)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_port}"
+
+    from core.resources import get_memory
+    try:
+        get_memory().add_memories(memory_facts(args.memories) + [case["facts"]["memory"] for case in cases],
+                                  batch_size=500, dedupe=False)
+        results = [run_mode(mode, cases, fake) for mode in args.modes.split(",")]
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Pre-LLM phase of a run, one stage after the other (sequential) against the pipelined start: memory lookup,
+prefill of the prompt prefix and tool prefetch side by side, with small talk skipping the lookup. Runs
+multi-turn chat sessions against the fake Ollama server, with embeddings served (and paid for) by the
+server as with nomic-embed-text.
+
+Usage: python -m bench.pipeline [--sessions 4] [--queries 8] [--prompt-rate 400] [--embed-latency 0.05]
+
+"ready_ms" is the time from the start of a run to its first model request, "first_token_ms" the time to the
+first token of the answer, and "stages" the per-span latencies from the trace log.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from bench.agents import configure_environment, session_queries, stage_percentiles, summarize
+from bench.corpora import memory_facts, write_documents
+from bench.fake_ollama import FakeOllama, start_server
+
+MODES = {"sequential": "0", "pipelined": "1"}
+STAGES = ("memory.search", "brain.prefill", "tool.prefetch", "tool.prefetched", "brain.chat")
+
+
+def run_session(queries: List[str]) -> List[Dict[str, Any]]:
+    """One user asking its queries in order; times the start and the first answer token of each run."""
+    from core.agent import Agent
+    agent = Agent()
+    history, runs = [], []
+    for query in queries:
+        start = time.perf_counter()
+        first_token, parts = None, []
+        for token in agent.stream(query, chat_history=list(history)):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            parts.append(token)
+        answer = "".join(parts)
+        runs.append({"seconds": time.perf_counter() - start, "first_token": first_token,
+                     "startup": dict(agent.latest_startup), "trace_id": agent.latest_trace_id,
+                     "error": answer.startswith("Error")})
+        history += [{"role": "user", "content": query}, {"role": "assistant", "content": answer}]
+    return runs
+
+
+def run_mode(mode: str, sessions: List[List[str]], fake: FakeOllama) -> Dict[str, Any]:
+    from core.resources import get_embedder
+    from core.tracing import tracer
+
+    os.environ["RUN_PIPELINE"] = MODES[mode]
+    # Neither mode inherits the other's prefix cache or query embeddings
+    fake._last_prompt.clear()
+    get_embedder()._lru.clear()
+    before = dict(fake.counters)
+    runs = [run for queries in sessions for run in run_session(queries)]
+
+    stages = stage_percentiles(tracer.path, {run["trace_id"] for run in runs})
+    return {
+        "mode": mode,
+        "runs": len(runs),
+        "errors": sum(run["error"] for run in runs),
+        "latency": summarize([run["seconds"] * 1000 for run in runs]),
+        "first_token_ms": summarize([run["first_token"] * 1000 for run in runs if run["first_token"] is not None]),
+        "ready_ms": summarize([run["startup"]["ready_ms"] for run in runs]),
+        "memory": dict(Counter(run["startup"]["memory"] for run in runs)),
+        "prefill": dict(Counter(run["startup"].get("prefill", "off") for run in runs)),
+        "prefetch_used": sum(run["startup"].get("prefetch_used", 0) for run in runs),
+        "prompt_tokens_evaluated": fake.counters["prompt_tokens_evaluated"] - before["prompt_tokens_evaluated"],
+        "embed_calls": fake.counters["embed_calls"] - before["embed_calls"],
+        "stages": {name: stats for name, stats in stages.items() if name in STAGES},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=8, help="queries per session")
+    parser.add_argument("--memories", type=int, default=2000)
+    parser.add_argument("--token-rate", type=float, default=100.0, help="fake model tokens per second")
+    parser.add_argument("--prompt-rate", type=float, default=400.0, help="fake prompt tokens evaluated per second")
+    parser.add_argument("--latency", type=float, default=0.03, help="fake model latency per call in seconds")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding latency per request")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    configure_environment(workdir)
+    os.environ.update({"RESPONSE_CACHE": "0", "WARMUP": "0", "MEMORY_COMPACT_EVERY": "0",
+                       "MEMORY_EMBEDDER": "ollama:nomic-embed-text",
+                       # Every query pays for its embedding, as a new question would
+                       "EMBEDDING_CACHE_PATH": ""})
+
+    fake = FakeOllama(token_rate=args.token_rate, prompt_rate=args.prompt_rate, latency=args.latency)
+    server = start_server(fake)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_port}"
+    try:
+        # Memories are embedded once, before embeddings start costing time
+        from core.resources import get_memory
+        get_memory().add_memories(memory_facts(args.memories), batch_size=500)
+        fake.embed_latency = args.embed_latency
+
+        os.makedirs(os.path.join(workdir, "docs"))
+        documents = write_documents(os.path.join(workdir, "docs"), 4, pages=4)
+        sessions = [session_queries(args.queries, documents, seed) for seed in range(args.sessions)]
+        results = [run_mode(mode, sessions, fake) for mode in MODES]
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Cost of painting the chat and Under the Hood pages with a large store: reading what a view shows (the whole
+memory collection and task list, against one filtered page of them) and rendering the pages themselves with
+Streamlit's AppTest, with a long conversation in the session.
+
+Usage: python -m bench.rendering [--memories 50000] [--tasks 2000] [--messages 400] [--page-size 50]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from bench.agents import configure_environment, summarize
+from bench.corpora import memory_facts, todo_tasks
+
+PAGES = {"chat": "app.py", "under_the_hood": os.path.join("pages", "under_the_hood.py")}
+
+
+def timed(step, repeats: int):
+    """Latencies in ms of calling step() repeats times, and the growth of the process RSS over them."""
+    from core.resources import current_rss_mb
+    rss = current_rss_mb()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        step()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"latency": summarize(latencies), "rss_growth_mb": round(current_rss_mb() - rss, 1) if rss else None}
+
+
+def render(page: str, messages: int, repeats: int):
+    """Script run time of a page, rerun as a user would (the session keeps its agent and history)."""
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.abspath(PAGES[page]), default_timeout=120)
+    app.session_state["messages"] = [{"role": "user" if i % 2 else "assistant", "content": f"Message {i}"}
+                                     for i in range(messages)]
+    app.session_state["agent_history"] = list(app.session_state["messages"])
+    app.run()
+    return timed(app.run, repeats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--memories", type=int, default=50000)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=400, help="messages in the session's conversation")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    configure_environment(workdir)
+    os.environ.update({"WARMUP": "0", "MEMORY_COMPACT_EVERY": "0", "INSPECTOR_PAGE_SIZE": str(args.page_size)})
+
+    from core.resources import get_memory, get_todo_manager
+
+    try:
+        memory, todo_manager = get_memory(), get_todo_manager()
+        memory.add_memories(memory_facts(args.memories), batch_size=1000, dedupe=False)
+        for task in todo_tasks(args.tasks):
+            todo_manager.add_task(task)
+
+        reads = {
+            "memory_full": timed(memory.get_all_memories, args.repeats),
+            "memory_page": timed(lambda: memory.browse(limit=args.page_size, offset=args.page_size * 10),
+                                 args.repeats),
+            "memory_page_filtered": timed(lambda: memory.browse(limit=args.page_size, contains="coffee"),
+                                          args.repeats),
+            # Every read comes after a write, so neither is served from the task cache
+            "tasks_full": timed(lambda: (todo_manager.add_task("Bench"), todo_manager.get_tasks()), args.repeats),
+            "tasks_page": timed(lambda: (todo_manager.add_task("Bench"), todo_manager.count_tasks(),
+                                         todo_manager.get_tasks(limit=args.page_size)), args.repeats),
+        }
+        renders = {page: render(page, args.messages, args.repeats) for page in PAGES}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"config": vars(args), "reads": reads, "page_renders": renders}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
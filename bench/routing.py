@@ -0,0 +1,82 @@
+"""
+Latency and per-model calls with the large model alone, with a small model drafting the tool-selection steps,
+and with both models raced, against a fake Ollama server where the small model is faster but sloppier.
+
+Usage: python -m bench.routing [--queries 40] [--large-rate 40] [--small-rate 200] [--small-drift 0.1]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from bench.agents import configure_environment, session_queries, summarize
+from bench.corpora import write_documents
+
+LARGE_MODEL, SMALL_MODEL = "llama3", "llama3.2"
+
+
+def run_routing(name: str, queries, fake, draft_model: str = None, race: bool = False):
+    """Asks every query in a fresh session and reports latency, answers and calls per model."""
+    from core.agent import Agent
+
+    calls_before = dict(fake.calls_by_model)
+    agent = Agent(model_name=LARGE_MODEL, draft_model=draft_model, race=race)
+    latencies, answers = [], 0
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        answer = agent.run(query)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+        answers += not answer.startswith("Error")
+    elapsed = time.perf_counter() - start
+
+    router = agent.brain.router.stats()
+    return {"routing": name, "queries": len(queries), "answers": answers, "seconds": round(elapsed, 2),
+            "queries_per_sec": round(len(queries) / elapsed, 2), "latency": summarize(latencies),
+            "calls_by_model": {model: count - calls_before.get(model, 0)
+                               for model, count in fake.calls_by_model.items()},
+            "router": {key: value for key, value in router.items() if key not in ("large", "small", "race")}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--large-rate", type=float, default=40.0, help="large model tokens per second")
+    parser.add_argument("--small-rate", type=float, default=200.0, help="small model tokens per second")
+    parser.add_argument("--small-drift", type=float, default=0.1, help="small model format drift probability")
+    parser.add_argument("--load-seconds", type=float, default=0.5, help="time to load each model")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    configure_environment(workdir)
+    # Every step must reach a model for the comparison to be fair
+    os.environ["RESPONSE_CACHE"] = "0"
+
+    from bench.fake_ollama import FakeOllama, start_server
+    from core.resources import get_todo_manager
+
+    fake = FakeOllama(token_rate=args.large_rate, latency=0.01, load_seconds=args.load_seconds,
+                      models={SMALL_MODEL: {"token_rate": args.small_rate, "drift": args.small_drift}})
+    server = start_server(fake)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        get_todo_manager().add_task("Budget report")
+        os.makedirs(os.path.join(workdir, "docs"))
+        documents = write_documents(os.path.join(workdir, "docs"), 2, pages=2)
+        queries = session_queries(args.queries, documents, seed=0)
+
+        results = [run_routing("large only", queries, fake),
+                   run_routing("draft", queries, fake, draft_model=SMALL_MODEL),
+                   run_routing("race", queries, fake, draft_model=SMALL_MODEL, race=True)]
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Search cache benchmark against an offline fixture backend with simulated network latency.
+
+Usage: python -m bench.search [--queries 2000] [--threads 8] [--latency 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from tools.search import FixtureBackend, SearchCache, SearchTool
+
+TOPICS = ["latest python version", "streamlit release notes", "ollama models", "chromadb docs",
+          "weather in kyiv", "duckduckgo api", "llama3 context length", "pypdf extract text"]
+
+
+def user_query(rng: random.Random) -> str:
+    """Popular topics asked in slightly different spellings, plus a long tail of unique queries."""
+    if rng.random() < 0.2:
+        return f"unique question {rng.randint(0, 10 ** 9)}"
+    topic = TOPICS[min(int(rng.expovariate(0.5)), len(TOPICS) - 1)]
+    return rng.choice([topic, topic.upper(), topic + "?", "  " + topic + " "])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated backend latency in seconds")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    queries = [user_query(rng) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = FixtureBackend(latency=args.latency)
+        tool = SearchTool(backend=backend, cache=SearchCache(path=os.path.join(tmp, "cache.sqlite")))
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(tool.search, queries))
+
+        results = {"queries": args.queries, "threads": args.threads, "backend_calls": backend.calls,
+                   **tool.stats()}
+
+        # A restarted process starts with the persisted cache
+        restarted = SearchTool(backend=backend, cache=SearchCache(path=os.path.join(tmp, "cache.sqlite")))
+        for topic in TOPICS:
+            restarted.search(topic)
+        results["restart_hit_rate"] = restarted.stats()["hit_rate"]
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Cold start: import time of the app's modules and heavy dependencies, and time to the first answer after a
+process start, with every backend built up front (eager), on first use (lazy), and on first use with the
+background warmup (warmup). Each measurement runs in a fresh Python process against a fresh fake Ollama
+server that charges --load-seconds on a model's first request.
+
+Usage: python -m bench.startup [--load-seconds 2] [--think 0,3] [--memories 2000]
+
+"ui_ready_s" is when the page could render (agent built), "answer_s" the latency of a first question asked
+--think seconds later, and "first_answer_s" the sum, from process start.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MODULES = ["core.agent", "ollama", "chromadb", "duckduckgo_search", "pypdf", "docx", "streamlit"]
+MODES = ["eager", "lazy", "warmup"]
+
+
+def import_seconds(module: str) -> float:
+    """Time to import a module in a fresh interpreter (interpreter startup excluded)."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    return round(float(result.stdout.strip().splitlines()[-1]), 3) if result.returncode == 0 else None
+
+
+def child(mode: str, query: str, think: float) -> None:
+    """One cold boot in this (fresh) process; prints its timings as JSON."""
+    start = time.perf_counter()
+    from core.agent import Agent
+    imported = time.perf_counter() - start
+
+    agent = Agent()
+    warmup = None
+    if mode == "eager":
+        # What the agent used to do in its constructor: open every store and build every tool
+        agent.brain.client, agent.memory, agent.search_tool, agent.todo_manager, agent.document_reader
+    elif mode == "warmup":
+        from core.resources import start_warmup
+        warmup = start_warmup(agent.brain.model_name)
+    ui_ready = time.perf_counter() - start
+
+    time.sleep(think)
+    asked = time.perf_counter()
+    answer = agent.run(query)
+    answered = time.perf_counter()
+    print(json.dumps({"mode": mode, "think_s": think, "import_s": round(imported, 3),
+                      "ui_ready_s": round(ui_ready, 3), "answer_s": round(answered - asked, 3),
+                      "first_answer_s": round(answered - start - think, 3), "error": answer.startswith("Error"),
+                      "warmup": warmup.status() if warmup is not None else None}))
+    # Let the warmup's requests finish rather than cut them off at exit
+    if warmup is not None:
+        warmup.wait()
+
+
+def run_child(mode: str, query: str, think: float, load_seconds: float) -> dict:
+    from bench.fake_ollama import FakeOllama, start_server
+    server = start_server(FakeOllama(token_rate=200, latency=0.02, load_seconds=load_seconds))
+    env = {**os.environ, "OLLAMA_HOST": f"http://127.0.0.1:{server.server_port}",
+           "WARMUP": "1" if mode == "warmup" else "0"}
+    try:
+        result = subprocess.run([sys.executable, "-m", "bench.startup", "--child", mode, "--query", query,
+                                 "--think", str(think)], capture_output=True, text=True, env=env)
+    finally:
+        server.shutdown()
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def seed(count: int) -> None:
+    """Fills long-term memory once, so that opening it costs what it would in a used install."""
+    from bench.corpora import memory_facts
+    from core.resources import get_memory
+    get_memory().add_memories(memory_facts(count), batch_size=500)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--load-seconds", type=float, default=2.0, help="fake model load time")
+    parser.add_argument("--think", default="0,3", help="seconds between page render and the first question")
+    parser.add_argument("--memories", type=int, default=2000)
+    parser.add_argument("--query", default="What do you know about my coffee?")
+    parser.add_argument("--child", choices=MODES + ["seed"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "seed":
+        seed(args.memories)
+        return
+    if args.child:
+        child(args.child, args.query, float(args.think))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    from bench.agents import configure_environment
+    configure_environment(workdir)
+    # Every boot must reach the model
+    os.environ["RESPONSE_CACHE"] = "0"
+    try:
+        subprocess.run([sys.executable, "-m", "bench.startup", "--child", "seed", "--memories", str(args.memories)],
+                       check=True)
+        imports = {module: import_seconds(module) for module in MODULES}
+        boots = [run_child(mode, args.query, float(think), args.load_seconds)
+                 for think in args.think.split(",") for mode in MODES]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"config": {key: value for key, value in vars(args).items() if key != "child"},
+                      "import_s": imports, "boots": boots}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Memory and to-do latency as the number of tenants grows: one shared collection filtered by user, against a
+collection (and keyword index) per tenant with idle tenants evicted from the process.
+
+Usage: python -m bench.tenants [--tenants 1,10,50,100] [--per-tenant 200] [--queries 200] [--cache-size 16]
+
+At each tenant count, queries go to random tenants (so the per-tenant mode also pays for reloading evicted
+ones) and ask for a stored fact of that tenant. A leak is a result saved by another tenant.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from bench.agents import configure_environment, summarize
+from bench.corpora import memory_facts, todo_tasks
+
+
+def tenant_name(i: int) -> str:
+    return f"tenant{i:04d}"
+
+
+def measure_queries(search, facts: Dict[str, List[str]], queries: int, seed: int = 0) -> Dict[str, Any]:
+    """Latency, recall@3 and leaks of searching random tenants for one of their own facts."""
+    rng = random.Random(seed)
+    tenants = sorted(facts)
+    latencies, hits, leaks = [], 0, 0
+    for _ in range(queries):
+        tenant = rng.choice(tenants)
+        expected = rng.choice(facts[tenant])
+        start = time.perf_counter()
+        results = search(tenant, expected)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += expected in results
+        leaks += sum(text not in facts[tenant] for text in results)
+    return {"latency": summarize(latencies), "recall_at_3": round(hits / queries, 3), "leaked_results": leaks}
+
+
+def measure_todos(todo_manager, tenants: List[str], queries: int, seed: int = 0) -> Dict[str, Any]:
+    """Latency of adding a task and reading the tenant's pending list back (a cache miss every time)."""
+    rng = random.Random(seed)
+    latencies = []
+    for i in range(queries):
+        tenant = rng.choice(tenants)
+        start = time.perf_counter()
+        todo_manager.add_task(f"Follow-up {i}", owner=tenant)
+        todo_manager.get_tasks(status="pending", owner=tenant)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", default="1,10,50,100", help="tenant counts to measure at")
+    parser.add_argument("--per-tenant", type=int, default=200, help="memories and tasks per tenant")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--cache-size", type=int, default=16, help="TENANT_CACHE_SIZE")
+    args = parser.parse_args()
+    checkpoints = sorted(int(count) for count in args.tenants.split(","))
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    configure_environment(workdir)
+    os.environ.update({"MEMORY_COMPACT_EVERY": "0", "TENANT_CACHE_SIZE": str(args.cache_size),
+                       "TENANT_MAX_TASKS": "0"})
+
+    from core.memory import Memory
+    from core.resources import get_memory, get_todo_manager, tenant_stats
+
+    try:
+        shared = Memory(collection_name="bench_shared")
+        todo_manager = get_todo_manager()
+        facts: Dict[str, List[str]] = {}
+        results = []
+        for count in checkpoints:
+            start = time.perf_counter()
+            for i in range(len(facts), count):
+                tenant = tenant_name(i)
+                # Tenant-specific wording, so another tenant's fact is never the right answer
+                facts[tenant] = [f"{tenant} {fact}" for fact in memory_facts(args.per_tenant, seed=i)]
+                shared.add_memories(facts[tenant], user=tenant, batch_size=500, dedupe=False)
+                get_memory(tenant).add_memories(facts[tenant], batch_size=500, dedupe=False)
+                for task in todo_tasks(args.per_tenant, seed=i):
+                    todo_manager.add_task(task, owner=tenant)
+            load_seconds = time.perf_counter() - start
+
+            evicted_before = tenant_stats()["evicted"]
+            results.append({
+                "tenants": count, "memories": count * args.per_tenant, "load_seconds": round(load_seconds, 1),
+                "shared_collection": measure_queries(
+                    lambda tenant, query: shared.search_memory(query, user=tenant), facts, args.queries),
+                "per_tenant": {**measure_queries(
+                    lambda tenant, query: get_memory(tenant).search_memory(query), facts, args.queries),
+                    "evictions": tenant_stats()["evicted"] - evicted_before},
+                "todo_add_and_list": measure_todos(todo_manager, sorted(facts), args.queries),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"config": vars(args), "tenant_cache": tenant_stats(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Task store throughput with concurrent writers and cached reads.
+
+Usage: python -m bench.todo [--writers 1,4,8] [--ops 500] [--tasks 2000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tools.todo import TodoManager
+
+
+def writer(manager: TodoManager, ops: int, seed: int) -> int:
+    """Adds tasks and marks random ones done, like a busy chat session."""
+    rng = random.Random(seed)
+    for i in range(ops):
+        if i % 3 == 2:
+            manager.mark_done(rng.randint(1, i + 1))
+        else:
+            manager.add_task(f"Task {seed}-{i}", owner=f"user{seed}")
+    return ops
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", default="1,4,8", help="comma-separated writer thread counts")
+    parser.add_argument("--ops", type=int, default=500, help="operations per writer")
+    parser.add_argument("--tasks", type=int, default=2000, help="tasks in the legacy JSON file to import")
+    args = parser.parse_args()
+
+    results = {"runs": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "todo.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump([{"id": i, "task": f"Legacy {i}", "status": "pending"} for i in range(1, args.tasks + 1)], f)
+
+        start = time.perf_counter()
+        TodoManager(file_path=json_path, db_path=os.path.join(tmp, "import.db"))
+        results["json_import_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        for count in [int(w) for w in args.writers.split(",")]:
+            manager = TodoManager(file_path=json_path, db_path=os.path.join(tmp, f"writers_{count}.db"))
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=count) as pool:
+                total = sum(pool.map(writer, [manager] * count, [args.ops] * count, range(count)))
+            elapsed = time.perf_counter() - start
+
+            ids = [t["id"] for t in manager.get_tasks()]
+            start = time.perf_counter()
+            for _ in range(1000):
+                manager.get_tasks(status="pending")
+            cached_read = (time.perf_counter() - start) / 1000
+
+            results["runs"].append({
+                "writers": count,
+                "ops_per_sec": round(total / elapsed, 1),
+                "tasks": len(ids),
+                "unique_ids": len(set(ids)) == len(ids),
+                "cached_get_tasks_us": round(cached_read * 1e6, 1),
+            })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
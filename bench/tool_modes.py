@@ -0,0 +1,81 @@
+"""
+LLM calls per successful answer with the text protocol, JSON-constrained steps and native tool calls,
+against the fake Ollama server with a model that drifts from the text format.
+
+Usage: python -m bench.tool_modes [--queries 60] [--drift 0.2] [--max-iterations 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from bench.agents import configure_environment, session_queries
+from bench.corpora import write_documents
+
+EXTRA_QUERIES = ["Mark task 1 as done", "I finished the budget report"]
+
+
+def run_mode(mode: str, queries, max_iterations: int):
+    """Asks every query in a fresh session and counts LLM calls, invalid steps and answers."""
+    from core.agent import Agent
+    from core.tracing import tracer
+
+    results = {"mode": mode, "queries": len(queries), "answers": 0, "llm_calls": 0, "invalid_steps": 0,
+               "tool_errors": 0, "fallbacks": 0}
+    start = time.perf_counter()
+    for query in queries:
+        agent = Agent(tool_mode=mode)
+        answer = agent.run(query, max_iterations=max_iterations)
+        spans = tracer.trace(agent.latest_trace_id)
+        results["answers"] += not answer.startswith("Error")
+        results["llm_calls"] += sum(span["name"] == "brain.chat" for span in spans)
+        results["tool_errors"] += sum(step.startswith("🛠️") and ":\nError" in step for step in agent.latest_monologue)
+        results["invalid_steps"] += sum(metrics["outcome"] == "invalid" for metrics in agent.latest_metrics)
+        results["fallbacks"] += agent.tool_mode != mode
+
+    results["seconds"] = round(time.perf_counter() - start, 2)
+    results["llm_calls_per_answer"] = round(results["llm_calls"] / results["answers"], 2) if results["answers"] else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=60)
+    parser.add_argument("--drift", type=float, default=0.2, help="probability of a free-text reply breaking format")
+    parser.add_argument("--max-iterations", type=int, default=5)
+    parser.add_argument("--token-rate", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="openclaw-bench-")
+    configure_environment(workdir)
+    # Every call must reach the model for the counts to be comparable
+    os.environ["RESPONSE_CACHE"] = "0"
+
+    from bench.fake_ollama import FakeOllama, start_server
+    from core.resources import get_todo_manager
+
+    fake = FakeOllama(token_rate=args.token_rate, latency=0.0, drift=args.drift)
+    server = start_server(fake)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        get_todo_manager().add_task("Budget report")
+        os.makedirs(os.path.join(workdir, "docs"))
+        documents = write_documents(os.path.join(workdir, "docs"), 2, pages=2)
+        queries = (session_queries(args.queries, documents, seed=0) + EXTRA_QUERIES)
+
+        results = [run_mode(mode, queries, args.max_iterations) for mode in ("text", "json", "native")]
+        # A model without tool support: native mode has to fall back to the text protocol
+        fake.supports_tools = False
+        results.append({**run_mode("native", queries, args.max_iterations), "mode": "native (unsupported)"})
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"drift": args.drift, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
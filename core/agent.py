@@ -1,24 +1,278 @@
+import contextvars
+import os
+import queue
 import re
-from typing import List, Dict
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, List, Dict, Iterator, Any, Optional, Tuple
 
 from core.brain import Brain
-from core.memory import Memory
-from tools.search import SearchTool
-from tools.todo import TodoManager
-from tools.reader import DocumentReader
+from core.context import ContextManager
+from core.observations import ObservationCompressor
+from core.parser import FINAL_MARKER, JsonStepStreamer, ReActStreamParser, parse_actions, parse_json_step
+from core.resources import get_memory, get_todo_manager, get_search_tool, get_document_reader
+from core.runtime import ToolRuntime, submit, submit_tool
+from core.tracing import logger, tracer
+
+# Tool registry: prompt description, expected input (and its JSON type, string unless noted), whether it may run
+# alongside other tools, timeout (s), whether its observations go stale (later LLM calls of the run then
+# bypass the response cache), and the token budget its outputs are compressed to (none: kept verbatim)
+TOOL_SPECS = {
+    "search": {"description": "Search the internet.", "input": "query", "concurrent": True, "timeout": 20,
+               "volatile": True, "budget": 250},
+    "add_todo": {"description": "Add a task.", "input": "description", "concurrent": False, "timeout": 10,
+                 "volatile": True},
+    "mark_todo": {"description": "Mark task done.", "input": "task ID (int)", "type": "integer", "concurrent": False,
+                  "timeout": 10, "volatile": True},
+    "read_file": {"description": "Read the passages of a document relevant to the question.", "input": "file path",
+                  "concurrent": True, "timeout": 60, "budget": 400},
+    "save_memory": {"description": "Remember a fact.", "input": "fact", "concurrent": False, "timeout": 10},
+    "search_memory": {"description": "Recall a fact.", "input": "query", "concurrent": True, "timeout": 10,
+                      "budget": 150},
+    "expand_observation": {"description": "Show the full output of a shortened tool result.",
+                           "input": "handle from the extract (e.g. obs-1), optionally followed by a page number",
+                           "concurrent": True, "timeout": 5},
+}
+
+# Small talk that no stored fact can help with; such queries skip the memory lookup
+SMALL_TALK_WORDS = frozenset("hi hello hey yo thanks thank you thx ok okay cool great nice sure bye goodbye good "
+                             "morning afternoon evening night there again a so very much lot all".split())
+
+# An explicit request to search, opening a sentence ("Search the web for X", "Please look up X", "Latest news
+# about X"), and its subject, which is what gets searched
+SEARCH_REQUEST = re.compile(
+    r"(?:^|[.!?]\s+|\b(?:please|can you|could you)\s+)"
+    r"(?:search(?:\s+(?:the\s+web|online|the\s+internet))?(?:\s+(?:for|about))?|look\s+up|google|"
+    r"(?:the\s+)?(?:latest\s+)?news\s+(?:about|on))"
+    r"\s+(?:the\s+)?(?:(?:latest\s+)?news\s+(?:about|on)\s+)?((?:[^?!.\n]|\.(?=\S)){2,80}?)\s*(?:[?!]|\.(?!\S)|$)",
+    re.IGNORECASE | re.MULTILINE)
+
+# Tool calls a query obviously needs, started before the first step: a document it names, a search it asks for
+PREFETCH_RULES = [
+    ("read_file", re.compile(r"(?<![\w/.])([\w./\\~-]+\.(?:pdf|docx?|txt))\b", re.IGNORECASE)),
+    ("search", SEARCH_REQUEST),
+]
+
+
+def needs_memory(query: str) -> bool:
+    """Cheap relevance gate: False for greetings and thanks, which no memory can help answer."""
+    words = re.findall(r"[a-z']+", query.lower())
+    return any(word not in SMALL_TALK_WORDS for word in words)
+
+
+def _prefetch_key(action: str, action_input: str) -> Tuple[str, str]:
+    """Matches a prefetch to the call the model makes, whether it passes on the subject or the whole request."""
+    if action == "search":
+        match = SEARCH_REQUEST.search(action_input.strip())
+        action_input = match.group(1) if match else action_input
+    return action, action_input.strip().strip("'\"`?!.").lower()
+
+
+# How the model requests tools: the ReAct text protocol, a JSON object constrained by a schema, or native tool calls
+TOOL_MODES = ("text", "json", "native")
+
+TEXT_FORMAT_INSTRUCTIONS = """Option 1 - Use a tool:
+Thought: I need to use a tool.
+Action: [tool_name]
+Action Input: [input string]
+If several tools are independent of each other, repeat the Action and Action Input lines for each of them
+(at most {max_actions}); their observations come back together.
+
+Option 2 - Final Answer:
+Thought: I have the answer.
+Final Answer: [your response]"""
+
+JSON_FORMAT_INSTRUCTIONS = """Reply with a single JSON object:
+{{"thought": "your reasoning", "actions": [{{"tool": "tool_name", "input": "input"}}], "final_answer": ""}}
+To use tools, list up to {max_actions} independent calls in "actions"; their observations come back together.
+To answer, leave "actions" empty and write your response in "final_answer"."""
+
+NATIVE_FORMAT_INSTRUCTIONS = """Call the provided tools when you need them (up to {max_actions} independent calls at once).
+When you have the answer, reply with it directly."""
+
+# (model, mode) pairs that failed in this process; new sessions start with the text protocol. A pair is marked
+# once the server rejects the request, or after TOOL_MODE_MAX_FAILURES invalid steps in a row (one bad sample
+# says little about the mode)
+_unsupported_tool_modes = set()
+_tool_mode_failures: Dict[Tuple[str, str], int] = {}
+_tool_mode_lock = threading.Lock()
+TOOL_MODE_MAX_FAILURES = int(os.getenv("TOOL_MODE_MAX_FAILURES", "3"))
+
+
+def tool_json_schema(max_actions: int) -> Dict[str, Any]:
+    """
+    JSON schema of a structured step, generated from the tool registry.
+    """
+    variants = [{"type": "object",
+                 "properties": {"tool": {"enum": [name]}, "input": {"type": spec.get("type", "string")}},
+                 "required": ["tool", "input"]}
+                for name, spec in TOOL_SPECS.items()]
+    return {
+        "type": "object",
+        "properties": {
+            "thought": {"type": "string"},
+            "actions": {"type": "array", "items": {"anyOf": variants}, "maxItems": max_actions},
+            "final_answer": {"type": "string"},
+        },
+        "required": ["thought", "actions", "final_answer"],
+    }
+
+
+def tool_function_schemas() -> List[Dict[str, Any]]:
+    """
+    Tool definitions for Ollama's native tool calling, generated from the tool registry.
+    """
+    return [{"type": "function", "function": {
+        "name": name,
+        "description": spec["description"],
+        "parameters": {"type": "object", "required": ["input"],
+                       "properties": {"input": {"type": spec.get("type", "string"), "description": spec["input"]}}},
+    }} for name, spec in TOOL_SPECS.items()]
+
+
+def validate_action(action: str, action_input: str) -> Optional[str]:
+    """
+    Checks a tool call before running it. Returns an error observation, or None if the call is valid.
+    """
+    spec = TOOL_SPECS.get(action)
+    if spec is None:
+        return f"Error: Tool '{action}' not recognized. Available tools: {', '.join(TOOL_SPECS)}."
+    if not action_input.strip():
+        return f"Error: '{action}' needs an input: {spec['input']}."
+    if spec.get("type") == "integer" and len(re.findall(r"\d+", action_input)) != 1:
+        return f"Error: '{action}' needs exactly one {spec['input']}, got '{action_input}'."
+    return None
+
+
+def _run_to_end(generator) -> Any:
+    """Runs a step generator that yields nothing (a draft) and returns its result."""
+    try:
+        while True:
+            next(generator)
+    except StopIteration as stop:
+        return stop.value
+
+
+def _yield_to_queue(generator, events: "queue.Queue", name: str) -> Any:
+    """Forwards what a step generator yields to a queue as ('chunk', name, text) and returns its result."""
+    try:
+        while True:
+            events.put(("chunk", name, next(generator)))
+    except StopIteration as stop:
+        return stop.value
+
+
+def _argument_text(arguments: Dict[str, Any]) -> str:
+    """The input of a native tool call; models sometimes pick their own argument name."""
+    if not arguments:
+        return ""
+    value = arguments.get("input", next(iter(arguments.values())))
+    return value if isinstance(value, str) else str(value)
+
 
 class Agent:
     """Orchestrates the LLM, memory, and tools using a ReAct loop."""
-    def __init__(self, model_name: str = "llama3"):
-        self.brain = Brain(model_name=model_name)
-        self.memory = Memory()
-        self.search_tool = SearchTool()
-        self.todo_manager = TodoManager()
-        self.document_reader = DocumentReader()
+    def __init__(self, model_name: str = "llama3", max_actions_per_step: int = 3, tool_mode: str = None,
+                 draft_model: str = None, race: bool = None, tenant: str = None, brain: Brain = None):
+        # Sessions may share one Brain (client, caches and router statistics), e.g. in the headless server
+        self.brain = brain or Brain(model_name=model_name)
+        self.brain.set_models(model_name, draft_model or self.brain.router.small, race)
+        self.context = ContextManager(self.brain)
+        # Storage and tools are process-wide and built on first use (see the properties below); only the
+        # conversation state belongs to this session. Memory and tasks are scoped to the tenant
+        # (None shares them between all sessions)
+        self.tenant = tenant or None
+        # Independent tool calls from the same step run concurrently
+        self.max_actions_per_step = max_actions_per_step
+        self.tool_runtime = ToolRuntime(self._execute_tool, TOOL_SPECS)
+        # Long tool outputs enter the context as query-relevant extracts; the raw outputs stay available by handle
+        self.compress_observations = os.getenv("OBSERVATION_COMPRESSION", "1") != "0"
+        self.observations = ObservationCompressor()
+        # Structured modes fall back to the text protocol if the model or server can't follow them
+        self.configured_tool_mode = tool_mode or os.getenv("AGENT_TOOL_MODE", "text")
+        if self.configured_tool_mode not in TOOL_MODES:
+            raise ValueError(f"Unknown tool mode '{self.configured_tool_mode}', "
+                             f"expected one of {', '.join(TOOL_MODES)}.")
+        self.tool_mode = self._effective_tool_mode()
+        self._fell_back = False
+        self.current_query = ""
+        # Saved memories are tagged with the user of the run, so searches can be filtered by user
+        self.user_name = "User"
+        self.latest_monologue: List[str] = []
+        # Per-step streaming metrics (time-to-first-token, tokens generated) of the last run
+        self.latest_metrics: List[Dict] = []
+        # Trace of the last run, for the latency breakdown on Under the Hood
+        self.latest_trace_id = None
+        # Set once a volatile tool ran in the current run
+        self.volatile_run = False
+        # Called with ("thought" | "observation", text) as the run progresses, e.g. by a background job
+        self.on_progress: Optional[Callable[[str, str], None]] = None
+        # Cancel token of the current run, set by cancel() from another thread; the run stops at its next
+        # step boundary or token. Each run gets its own, so cancelling one never stops (or is undone by) another
+        self._cancelled = threading.Event()
+        # Before the first step, the memory lookup, a prefill of the prompt prefix and the prefetch of obviously
+        # needed tools run side by side; memories taking longer than MEMORY_WAIT_MS join at the first observation
+        self.pipeline = os.getenv("RUN_PIPELINE", "1") != "0"
+        self.prefill = os.getenv("PREFIX_PREFILL", "1") != "0"
+        self.prefetch = os.getenv("TOOL_PREFETCH", "1") != "0"
+        memory_wait = os.getenv("MEMORY_WAIT_MS", "")
+        self.memory_wait = float(memory_wait) / 1000 if memory_wait else None
+        max_distance = os.getenv("MEMORY_INJECT_MAX_DISTANCE", "")
+        self.memory_max_distance = float(max_distance) if max_distance else None
+        self._deferred_memories: Optional[Future] = None
+        self._prefetched: Dict[Tuple[str, str], Future] = {}
+        # Timings of the last run's pre-LLM phase
+        self.latest_startup: Dict[str, Any] = {}
+
+    def set_models(self, model_name: str, draft_model: str = None, race: bool = None) -> None:
+        """
+        Switches the models of the next requests without rebuilding memory, tools or the conversation state.
+        """
+        self.brain.set_models(model_name, draft_model, race)
+        self.tool_mode = self._effective_tool_mode()
+
+    def set_tenant(self, tenant: str = None) -> None:
+        """
+        Switches the memory store and task list of the next requests to another tenant (e.g. user).
+        """
+        self.tenant = tenant or None
+
+    @property
+    def memory(self):
+        """The tenant's memory store; looked up on each use, since idle tenants' stores are evicted."""
+        return get_memory(self.tenant)
+
+    @property
+    def search_tool(self):
+        return get_search_tool()
+
+    @property
+    def todo_manager(self):
+        return get_todo_manager()
+
+    @property
+    def document_reader(self):
+        return get_document_reader()
+
+    @property
+    def todo_owner(self) -> str:
+        """Owner of the tasks this agent adds; tenants also only see and complete their own."""
+        return self.tenant or ""
+
+    def _effective_tool_mode(self) -> str:
+        """The configured tool mode, unless it already failed for the current model."""
+        if (self.brain.model_name, self.configured_tool_mode) in _unsupported_tool_modes:
+            return "text"
+        return self.configured_tool_mode
 
     def _build_system_prompt(self, user_name: str, user_info: str, agent_name: str, agent_role: str,
                                  agent_instructions: str) -> str:
         """Dynamically builds the system prompt based on UI configuration."""
+        tool_lines = "\n".join(f'{i}. "{name}": {spec["description"]} Input: {spec["input"]}.'
+                               for i, (name, spec) in enumerate(TOOL_SPECS.items(), 1))
+        instructions = {"text": TEXT_FORMAT_INSTRUCTIONS, "json": JSON_FORMAT_INSTRUCTIONS,
+                        "native": NATIVE_FORMAT_INSTRUCTIONS}[self.tool_mode]
         return f"""You are {agent_name}, acting as a {agent_role}.
 
 User Profile:
@@ -31,90 +285,556 @@ Your Instructions:
 You must think step-by-step and use the exact format below.
 
 Tools:
-1. "search": Search the internet. Input: query.
-2. "add_todo": Add a task. Input: description.
-3. "mark_todo": Mark task done. Input: task ID (int).
-4. "read_file": Read a document. Input: file path.
-5. "save_memory": Remember a fact. Input: fact.
-6. "search_memory": Recall a fact. Input: query.
+{tool_lines}
 
 FORMAT INSTRUCTIONS:
-Option 1 - Use a tool:
-Thought: I need to use a tool.
-Action: [tool_name]
-Action Input: [input string]
-
-Option 2 - Final Answer:
-Thought: I have the answer.
-Final Answer: [your response]
+{instructions.format(max_actions=self.max_actions_per_step)}
 """
 
     def run(self, user_query: str, chat_history: List[Dict[str, str]] = None, max_iterations: int = 5,
             user_name: str = "User", user_info: str = "", agent_name: str = "Agent", agent_role: str = "Assistant",
             agent_instructions: str = "") -> str:
         """Executes the Thought -> Action -> Observation loop."""
+        return "".join(self.stream(user_query, chat_history, max_iterations, user_name, user_info, agent_name,
+                                   agent_role, agent_instructions))
+
+    def stream(self, user_query: str, chat_history: List[Dict[str, str]] = None, max_iterations: int = 5,
+               user_name: str = "User", user_info: str = "", agent_name: str = "Agent", agent_role: str = "Assistant",
+               agent_instructions: str = "", cancel: threading.Event = None) -> Iterator[str]:
+        """
+        Executes the ReAct loop, yielding the Final Answer token by token as the model writes it.
+        Setting `cancel` (or calling cancel()) stops this run.
+        """
         self.latest_monologue = []
+        self.latest_metrics = []
+        self.current_query = user_query
+        self.user_name = user_name
+        self.volatile_run = False
+        self._fell_back = False
+        self.tool_mode = self._effective_tool_mode()
+        cancel = self._cancelled = cancel or threading.Event()
+
+        with tracer.span("agent.run", model=self.brain.model_name, max_iterations=max_iterations) as run_span:
+            self.latest_trace_id = run_span.trace_id
+            system_prompt = self._build_system_prompt(user_name, user_info, agent_name, agent_role,
+                                                      agent_instructions)
+            if self.pipeline:
+                messages = self._start_pipelined(system_prompt, chat_history or [], user_query)
+            else:
+                messages = self._start_sequential(system_prompt, chat_history or [], user_query)
 
-        system_prompt = self._build_system_prompt(user_name, user_info, agent_name, agent_role, agent_instructions)
+            for step in range(max_iterations):
+                with tracer.span("agent.iteration", step=step + 1):
+                    finished = yield from self._run_step(messages, step, cancel)
+                if finished:
+                    run_span.set(iterations=step + 1)
+                    return
+                if cancel.is_set():
+                    run_span.set(iterations=step + 1, error="cancelled")
+                    return
 
-        chat_history = chat_history or []
-        messages = [{"role": "system", "content": system_prompt}] + chat_history
+            run_span.set(iterations=max_iterations, error="max_iterations")
+            yield "Error: Reached maximum iterations without a Final Answer."
 
+    def _start_sequential(self, system_prompt: str, chat_history: List[Dict[str, str]],
+                          user_query: str) -> List[Dict[str, Any]]:
+        """The messages of a new run, built one stage after the other."""
+        start = time.perf_counter()
+        startup = self.latest_startup = {"pipelined": False, "memory": "injected"}
+        self._deferred_memories, self._prefetched = None, {}
         # Automatically inject relevant memories
-        relevant_memories = self.memory.search_memory(user_query)
-        if relevant_memories:
-            messages.append({
-                "role": "system",
-                "content": f"Relevant context from your memory: {relevant_memories}"
-            })
-
-        messages.append({"role": "user", "content": user_query})
-
-        for _ in range(max_iterations):
-            llm_response = self.brain.chat(messages)
-            self.latest_monologue.append(f"🤖 Agent Thought:\n{llm_response}")
-            messages.append({"role": "assistant", "content": llm_response})
-
-            # Check for final answer
-            if "Final Answer:" in llm_response:
-                return llm_response.split("Final Answer:")[-1].strip()
-
-            # Parse tool execution request
-            action_match = re.search(r"Action:\s*(.+)", llm_response)
-            input_match = re.search(r"Action Input:\s*(.+)", llm_response)
-
-            if action_match and input_match:
-                # Extract and clean up the action and input
-                action = action_match.group(1).strip().strip("[]")
-                action_input = input_match.group(1).strip().strip("[]")
-
-                observation = self._execute_tool(action, action_input)
-                self.latest_monologue.append(f"🛠️ Tool Observation ({action}):\n{observation}")
-                messages.append({"role": "user", "content": f"Observation: {observation}"})
+        relevant_memories = self._recall(user_query, startup)
+        messages = self.context.build(system_prompt, chat_history, relevant_memories, user_query)
+        startup["ready_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return messages
+
+    def _start_pipelined(self, system_prompt: str, chat_history: List[Dict[str, str]],
+                         user_query: str) -> List[Dict[str, Any]]:
+        """
+        The messages of a new run, with the independent stages overlapped: the memory lookup (unless the query
+        is small talk), the prefill of the prompt prefix in Ollama, and the prefetch of obviously needed tools.
+        """
+        start = time.perf_counter()
+        startup = self.latest_startup = {"pipelined": True, "memory": "skipped", "prefill": "cached",
+                                         "prefetched": []}
+        self._deferred_memories = None
+        lookup = submit(self._recall, user_query, startup) if needs_memory(user_query) else None
+        self._prefetched = self._start_prefetch(user_query, startup)
+
+        # Building the prefix may summarize old turns, which overlaps with the lookup too
+        prefix = self.context.prefix(system_prompt, chat_history)
+        prefill, prefill_deadline = None, None
+        model = self.brain.router.draft_model or self.brain.model_name
+        uncached = self.brain.uncached_tokens(prefix, model) if self.prefill else 0
+        if uncached:
+            # Waiting on the prefill for longer than evaluating the prefix takes can't save anything
+            prefill_deadline = time.perf_counter() + self.brain.eval_seconds(uncached, model)
+            prefill = submit(self._prefill, prefix, model, startup)
+
+        relevant_memories = []
+        if lookup is not None:
+            try:
+                relevant_memories = lookup.result(timeout=self.memory_wait)
+                startup["memory"] = "injected" if relevant_memories else "none relevant"
+            except FutureTimeout:
+                # Don't hold the first step for it; it joins the run with the first observation
+                self._deferred_memories = lookup
+                startup["memory"] = "deferred"
+        if prefill is not None:
+            try:
+                if prefill.result(timeout=max(0.0, prefill_deadline - time.perf_counter())):
+                    self.context.record_prefill(prefix)
+            except FutureTimeout:
+                # The request goes out now; Ollama runs it after the prefill and reuses what that evaluated
+                startup["prefill"] = "running"
+            # The lookup may have finished while waiting for the prefill
+            if self._deferred_memories is not None and self._deferred_memories.done():
+                relevant_memories, self._deferred_memories = self._deferred_memories.result(), None
+                startup["memory"] = "injected" if relevant_memories else "none relevant"
+        startup["ready_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return self.context.complete(prefix, relevant_memories, user_query)
+
+    def _recall(self, user_query: str, startup: Dict[str, Any]) -> List[str]:
+        """The memories injected into the prompt of a query."""
+        start = time.perf_counter()
+        with tracer.span("memory.search"):
+            memories = self.context.fit_memories(self.memory.search_memory(
+                user_query, max_distance=self.memory_max_distance))
+        startup["memory_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return memories
+
+    def _prefill(self, prefix: List[Dict[str, Any]], model: str, startup: Dict[str, Any]) -> bool:
+        """
+        Has the model of the first step evaluate the prompt prefix while the rest of the prompt is gathered.
+        Returns whether it did.
+        """
+        start = time.perf_counter()
+        stats = self.brain.prefill(prefix, model=model)
+        startup["prefill"] = "failed" if stats.get("error") else "done"
+        startup["prefill_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return not stats.get("error")
+
+    def _start_prefetch(self, user_query: str, startup: Dict[str, Any]) -> Dict[Tuple[str, str], Future]:
+        """Starts the tool calls the query obviously needs; the step that requests them gets their result."""
+        if not self.prefetch:
+            return {}
+        prefetched = {}
+        for action, pattern in PREFETCH_RULES:
+            match = pattern.search(user_query)
+            if match is None:
+                continue
+            action_input = match.group(1).strip()
+            if action == "read_file" and not os.path.exists(action_input):
+                continue
+            if validate_action(action, action_input) is None:
+                future = submit_tool(self._run_prefetch, action, action_input)
+                prefetched[_prefetch_key(action, action_input)] = future
+                startup["prefetched"].append(action)
+        return prefetched
+
+    def _run_prefetch(self, action: str, action_input: str) -> str:
+        with tracer.span("tool.prefetch", tool=action):
+            return self._dispatch_tool(action, action_input)
+
+    def _inject_deferred_memories(self, messages: List[Dict[str, Any]]) -> None:
+        """Adds memories whose lookup outlasted the start of the run, once they are there."""
+        if self._deferred_memories is None or not self._deferred_memories.done():
+            return
+        memories = self._deferred_memories.result()
+        self._deferred_memories = None
+        self.latest_startup["memory"] = "injected late" if memories else "none relevant"
+        if memories:
+            messages.append({"role": "system", "content": f"Relevant context from your memory: {memories}"})
+
+    def _run_step(self, messages: List[Dict[str, Any]], step: int, cancel: threading.Event) -> Iterator[str]:
+        """Runs one Thought -> Action -> Observation step. Returns True once a Final Answer was given."""
+        mode = self.tool_mode
+        result = yield from self._generate(messages, step, cancel)
+        if "rejected" in result:
+            # Cancelled before the model wrote anything worth keeping
+            self.latest_metrics.append({"step": step + 1, "mode": mode, "outcome": result["rejected"],
+                                        **result["stats"]})
+            return False
+        llm_response, final_answer, actions, tool_calls = (result["text"], result["final_answer"], result["actions"],
+                                                           result["tool_calls"])
+
+        self.context.record(messages, result["stats"])
+        outcome = "answer" if final_answer is not None else "tools" if actions else "invalid"
+        self.latest_metrics.append({"step": step + 1, "mode": mode, "outcome": outcome, **result["stats"]})
+        self._log("thought", f"🤖 Agent Thought:\n{llm_response}")
+        assistant_message = {"role": "assistant", "content": llm_response}
+        if tool_calls:
+            assistant_message["tool_calls"] = tool_calls
+        messages.append(assistant_message)
+
+        # Check for final answer
+        if final_answer is not None:
+            self.context.remember_turn(llm_response, final_answer)
+            return True
+
+        if actions:
+            observations = [self._compress_observation(action, action_input, observation)
+                            for (action, action_input), observation in zip(actions, self._run_actions(actions))]
+            for (action, _), observation in zip(actions, observations):
+                self._log("observation", f"🛠️ Tool Observation ({action}):\n{observation}")
+            if tool_calls:
+                # Native tool results go back as one tool message per call
+                messages.extend({"role": "tool", "tool_name": action,
+                                 "content": self.context.fit_observation(observation, len(actions))}
+                                for (action, _), observation in zip(actions, observations))
             else:
-                # Force correct formatting if the LLM hallucinates
-                messages.append({
-                    "role": "user",
-                    "content": "Observation: Invalid format. Use 'Action:' and 'Action Input:' or 'Final Answer:'."
-                })
+                messages.append({"role": "user", "content": self._format_observations(actions, observations)})
+            self._inject_deferred_memories(messages)
+
+        # Force correct formatting if the LLM hallucinates, and announce a fallback to the text protocol
+        if not actions or self._fell_back:
+            messages.append({"role": "user", "content": self._format_feedback()})
+        return False
+
+    def _generate(self, messages: List[Dict[str, Any]], step: int, cancel: threading.Event) -> Iterator[str]:
+        """
+        Produces one step with the models picked by the router: the draft model's tool selection if it is
+        valid, otherwise the large model's step (streamed to the user).
+        """
+        generate = self._text_step if self.tool_mode == "text" else self._structured_step
+        router = self.brain.router
+        draft_model = router.draft_model
+        if draft_model is None:
+            result = yield from generate(messages, cancel=cancel)
+            router.record(result["stats"])
+            return result
+
+        if router.race:
+            return (yield from self._race(messages, step, generate, draft_model))
+
+        draft = _run_to_end(generate(messages, model=draft_model, draft=True))
+        router.record(draft["stats"])
+        if "rejected" not in draft:
+            router.count("drafts_accepted")
+            return draft
+
+        # The large model writes answers and repairs steps the draft model couldn't format
+        router.count(f"escalated_{draft['rejected']}")
+        self.latest_metrics.append({"step": step + 1, "mode": self.tool_mode, "outcome": f"draft_{draft['rejected']}",
+                                    **draft["stats"]})
+        result = yield from generate(messages, cancel=cancel)
+        router.record(result["stats"])
+        return result
+
+    def _race(self, messages: List[Dict[str, Any]], step: int, generate, draft_model: str) -> Iterator[str]:
+        """
+        Runs the draft and the large model side by side; the first valid step wins and the other is cancelled.
+        Once the large model has started streaming a Final Answer it is committed and the draft is dropped.
+        """
+        router = self.brain.router
+        events = queue.Queue()
+        cancel = {"draft": threading.Event(), "large": threading.Event()}
+        results = {}
+
+        def run(name: str, model: Optional[str]):
+            steps = generate(messages, model=model, draft=name == "draft", cancel=cancel[name])
+            results[name] = {"rejected": "invalid", "stats": {}}
+            try:
+                results[name] = _yield_to_queue(steps, events, name)
+            finally:
+                router.record(results[name]["stats"])
+                events.put(("done", name))
+
+        # Workers inherit the current span, so both calls nest under this iteration
+        for name, model in (("draft", draft_model), ("large", None)):
+            threading.Thread(target=contextvars.copy_context().run, args=(run, name, model), daemon=True,
+                             name=f"race-{name}").start()
+
+        committed, finished = False, 0
+        while True:
+            event = events.get()
+            if event[0] == "chunk":
+                # Only the large model streams answer text
+                committed = True
+                yield event[2]
+                continue
+
+            name, finished = event[1], finished + 1
+            result = results[name]
+            # A step with neither actions nor an answer doesn't win; the other model may still write a valid one
+            valid = "rejected" not in result and (result["final_answer"] is not None or bool(result["actions"]))
+            if name == "large" and valid:
+                cancel["draft"].set()
+                router.count("race_won_large")
+                return result
+            if name == "draft" and valid and not committed:
+                # The large model stops at its next token
+                cancel["large"].set()
+                router.count("race_won_small")
+                return result
+            if name == "draft":
+                outcome = result.get("rejected", "lost" if valid else "invalid")
+                self.latest_metrics.append({"step": step + 1, "mode": self.tool_mode, "outcome": f"draft_{outcome}",
+                                            **result["stats"]})
+            if finished == 2:
+                # Neither produced a usable step; report the large model's as invalid
+                if "rejected" not in results["large"]:
+                    return results["large"]
+                return {"text": "", "final_answer": None, "actions": [], "tool_calls": None,
+                        "stats": results["large"]["stats"]}
+
+    def _text_step(self, messages: List[Dict[str, Any]], model: str = None, draft: bool = False,
+                   cancel: threading.Event = None) -> Iterator[str]:
+        """
+        Streams a ReAct text step and returns its result.
+        A draft yields nothing and is rejected as soon as it turns into a Final Answer.
+        """
+        parser = ReActStreamParser(max_actions=self.max_actions_per_step)
+        token_stream = self.brain.chat_stream(messages, cache=not self.volatile_run, model=model)
+        rejected = None
+        try:
+            for token in token_stream:
+                answer_chunk = parser.feed(token)
+                if draft and parser.answering:
+                    rejected = "answer"
+                    break
+                if cancel is not None and cancel.is_set() and not parser.answering:
+                    rejected = "cancelled"
+                    break
+                if answer_chunk:
+                    yield answer_chunk
+                # Stop paying for tokens once the step is complete
+                if parser.done:
+                    break
+        finally:
+            token_stream.close()
+        stats = self.brain.last_stats
+        if rejected:
+            return {"rejected": rejected, "stats": stats}
 
-        return "Error: Reached maximum iterations without a Final Answer."
+        answer_chunk = parser.finish()
+        if answer_chunk:
+            yield answer_chunk
+
+        # A step cut short once complete is as good as a full response, so it is cached too
+        if parser.done and stats.get("stopped_early") and not self.volatile_run:
+            self.brain.cache_response(messages, parser.text, model=model)
+
+        # Parse tool execution requests
+        actions = parse_actions(parser.text, self.max_actions_per_step) if parser.final_answer is None else []
+        if draft and not actions:
+            return {"rejected": "invalid", "stats": stats}
+        return {"text": parser.text, "final_answer": parser.final_answer, "actions": actions, "tool_calls": None,
+                "stats": stats}
+
+    def _structured_step(self, messages: List[Dict[str, Any]], model: str = None, draft: bool = False,
+                         cancel: threading.Event = None) -> Iterator[str]:
+        """
+        Streams a step in JSON or native tool-calling mode and returns its result (a native answer is yielded
+        once the step is known to call no tools). A draft yields nothing and is rejected once it turns into a
+        final answer.
+        """
+        native = self.tool_mode == "native"
+        streamer = JsonStepStreamer()
+        token_stream = self.brain.chat_stream(
+            messages, cache=not self.volatile_run, model=model,
+            format=None if native else tool_json_schema(self.max_actions_per_step),
+            tools=tool_function_schemas() if native else None)
+        text, rejected = "", None
+        try:
+            for token in token_stream:
+                # Brain errors are handled below rather than shown as the answer
+                if self.brain.last_stats.get("error"):
+                    continue
+                text += token
+                # JSON mode streams the "final_answer" string. Native content is held back: models may reason in
+                # it before calling tools, so it is only the answer if the stream ends without tool calls
+                answer_chunk = "" if native else streamer.feed(token)
+                answering = not native and streamer.answering
+                if draft and answering:
+                    rejected = "answer"
+                    break
+                if cancel is not None and cancel.is_set() and not answering:
+                    rejected = "cancelled"
+                    break
+                if answer_chunk:
+                    yield answer_chunk
+        finally:
+            token_stream.close()
+        stats, tool_calls = self.brain.last_stats, self.brain.last_tool_calls[:self.max_actions_per_step]
+        if rejected:
+            return {"rejected": rejected, "stats": stats}
+
+        result = {"text": text, "final_answer": None, "actions": [], "tool_calls": None, "stats": stats}
+        if stats.get("error"):
+            # A failing draft model says nothing about the large one
+            if draft:
+                return {"rejected": "invalid", "stats": stats}
+            # A 4xx means the server refused the format or tools; anything else may be passing
+            status = stats.get("status_code")
+            self._fall_back_to_text(f"the model call failed: {stats['error']}",
+                                    rejected=status is not None and 400 <= status < 500)
+            return result
+
+        if native:
+            if tool_calls:
+                result["actions"] = [(call["function"]["name"], _argument_text(call["function"]["arguments"]))
+                                     for call in tool_calls]
+                result["tool_calls"] = tool_calls
+            elif draft:
+                return {"rejected": "answer" if text.strip() else "invalid", "stats": stats}
+            else:
+                result["final_answer"] = text.strip() or None
+                if result["final_answer"] is not None:
+                    yield result["final_answer"]
+            if not draft:
+                self._tool_mode_worked()
+            return result
+
+        try:
+            result["final_answer"], result["actions"] = parse_json_step(text, self.max_actions_per_step)
+        except ValueError as e:
+            if draft:
+                return {"rejected": "invalid", "stats": stats}
+            # The server didn't constrain the output; read it with the text protocol from now on
+            self._fall_back_to_text(f"invalid structured output ({e})")
+            if FINAL_MARKER in text:
+                result["final_answer"] = text.split(FINAL_MARKER, 1)[1].strip()
+                # Part of it may already have been streamed from the "final_answer" string
+                if not streamer.emitted:
+                    yield result["final_answer"]
+            else:
+                result["actions"] = parse_actions(text, self.max_actions_per_step)
+            return result
+
+        if not draft:
+            self._tool_mode_worked()
+        if result["final_answer"] is not None and not streamer.emitted:
+            yield result["final_answer"]
+        return result
+
+    def cancel(self, run: threading.Event = None) -> None:
+        """
+        Stops a run (by default the current one) from another thread: the model call in progress is aborted
+        (unless it is already writing the answer) and running tool calls are abandoned.
+        """
+        run = run or self._cancelled
+        run.set()
+        # The tool batch in flight belongs to the current run only
+        if run is self._cancelled:
+            self.tool_runtime.cancel()
+
+    def call_tool(self, action: str, action_input: str) -> str:
+        """Runs a single tool outside of a ReAct run, with the same validation as the model's tool calls."""
+        return validate_action(action, action_input) or self._execute_tool(action, action_input)
+
+    def _log(self, kind: str, entry: str) -> None:
+        """Adds an entry to the monologue and reports it to the progress listener."""
+        self.latest_monologue.append(entry)
+        if self.on_progress is not None:
+            self.on_progress(kind, entry)
+
+    def _fall_back_to_text(self, reason: str, rejected: bool = False) -> None:
+        """
+        Switches this run to the text protocol; the model is told at its next observation. Later runs keep the
+        mode unless the server rejected it or it failed TOOL_MODE_MAX_FAILURES times in a row.
+        """
+        logger.warning("Tool mode '%s' unavailable for %s, falling back to text: %s", self.tool_mode,
+                       self.brain.model_name, reason)
+        tracer.metrics.increment("tool_mode_fallbacks_total", mode=self.tool_mode)
+        key = (self.brain.model_name, self.tool_mode)
+        with _tool_mode_lock:
+            _tool_mode_failures[key] = _tool_mode_failures.get(key, 0) + 1
+            if rejected or _tool_mode_failures[key] >= TOOL_MODE_MAX_FAILURES:
+                _unsupported_tool_modes.add(key)
+        self.tool_mode = "text"
+        self._fell_back = True
+
+    def _tool_mode_worked(self) -> None:
+        """Resets the failure streak of the current structured mode after a valid step."""
+        key = (self.brain.model_name, self.tool_mode)
+        if key in _tool_mode_failures:
+            with _tool_mode_lock:
+                _tool_mode_failures.pop(key, None)
+
+    def _format_feedback(self) -> str:
+        """The observation sent when a step requested neither a tool nor an answer, or the protocol changed."""
+        if self._fell_back:
+            self._fell_back = False
+            return ("Observation: Structured output is not available. Use this format from now on:\n" +
+                    TEXT_FORMAT_INSTRUCTIONS.format(max_actions=self.max_actions_per_step))
+        if self.tool_mode == "json":
+            return "Observation: Invalid format. Reply with the JSON object described in the instructions."
+        return "Observation: Invalid format. Use 'Action:' and 'Action Input:' or 'Final Answer:'."
+
+    def _run_actions(self, actions: List[Tuple[str, str]]) -> List[str]:
+        """Validates the requested tool calls and runs the valid ones; invalid ones get an error observation."""
+        errors = [validate_action(action, action_input) for action, action_input in actions]
+        for (action, _), error in zip(actions, errors):
+            if error:
+                tracer.metrics.increment("tool_validation_errors_total",
+                                         tool=action if action in TOOL_SPECS else "unknown")
+
+        valid = [pair for pair, error in zip(actions, errors) if error is None]
+        results = iter(self.tool_runtime.run_batch(valid) if valid else [])
+        observations = [error or next(results) for error in errors]
+
+        if any(TOOL_SPECS[action].get("volatile") for action, _ in valid):
+            self.volatile_run = True
+        return observations
+
+    def _format_observations(self, actions: List[tuple], observations: List[str]) -> str:
+        """Combines the results of one step into a single Observation message."""
+        if len(actions) == 1:
+            return f"Observation: {self.context.fit_observation(observations[0])}"
+
+        blocks = [f"Observation {i} ({action}): {self.context.fit_observation(observation, len(actions))}"
+                  for i, ((action, _), observation) in enumerate(zip(actions, observations), 1)]
+        return "\n\n".join(blocks)
+
+    def _compress_observation(self, action: str, action_input: str, observation: str) -> str:
+        """The part of a tool output that enters the context: all of it, or an extract within the tool's budget."""
+        budget = TOOL_SPECS.get(action, {}).get("budget")
+        if not self.compress_observations or budget is None:
+            return observation
+        with tracer.span("observation.compress", tool=action) as span:
+            extract = self.observations.compress(observation, f"{self.current_query}\n{action_input}", budget)
+            span.set(raw_chars=len(observation), kept_chars=len(extract))
+        return extract
 
     def _execute_tool(self, action: str, action_input: str) -> str:
         """Routes the requested action to the corresponding tool."""
+        prefetched = self._prefetched.pop(_prefetch_key(action, action_input), None)
+        if prefetched is not None:
+            with tracer.span("tool.prefetched", tool=action):
+                self.latest_startup["prefetch_used"] = self.latest_startup.get("prefetch_used", 0) + 1
+                # Bounded like any tool call, so a hung prefetch doesn't also hold the thread waiting for it
+                timeout = TOOL_SPECS[action].get("timeout", self.tool_runtime.default_timeout)
+                try:
+                    return prefetched.result(timeout=timeout)
+                except FutureTimeout:
+                    return f"Error executing '{action}': timed out after {timeout:g}s."
+        # Unknown (hallucinated) tool names share one span name to keep the metrics bounded
+        with tracer.span(f"tool.{action}" if action in TOOL_SPECS else "tool.unknown", tool=action) as span:
+            observation = self._dispatch_tool(action, action_input)
+            if observation.startswith("Error"):
+                span.set(error=observation[:200])
+            return observation
+
+    def _dispatch_tool(self, action: str, action_input: str) -> str:
+        """Calls the tool behind an action."""
         try:
             if action == "search":
                 return self.search_tool.search(action_input)
             elif action == "add_todo":
-                return self.todo_manager.add_task(action_input)
+                return self.todo_manager.add_task(action_input, owner=self.todo_owner)
             elif action == "mark_todo":
                 task_id = int("".join(filter(str.isdigit, action_input)))
-                return self.todo_manager.mark_done(task_id)
+                return self.todo_manager.mark_done(task_id, owner=self.tenant and self.todo_owner)
             elif action == "read_file":
-                return self.document_reader.read_file(action_input)
+                # Only the passages relevant to the current question enter the context
+                return self.document_reader.read_file(action_input, question=self.current_query)
             elif action == "save_memory":
-                self.memory.add_memory(text=action_input)
-                return "Fact saved to long-term memory."
+                if self.memory.add_memory(text=action_input, user=self.user_name):
+                    return "Fact saved to long-term memory."
+                return "Already in long-term memory (a near-identical fact was saved before)."
+            elif action == "expand_observation":
+                return self.observations.expand(action_input, page_tokens=self.context.budgets["observations"])
             elif action == "search_memory":
                 memories = self.memory.search_memory(action_input)
                 return f"Found in memory: {memories}" if memories else "Nothing found in memory."
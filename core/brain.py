@@ -1,40 +1,584 @@
-import ollama
-from typing import List, Dict
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Iterator, Any, Optional, Tuple
+
+from core.context import estimate_tokens
+from core.resources import get_ollama_client, get_chroma_client, get_embedder, get_response_cache
+from core.tracing import logger, tracer
+
+# Counters reported by Ollama in the final response chunk
+OLLAMA_STAT_FIELDS = ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+                      "load_duration", "total_duration")
+
+
+def ollama_stats(response) -> Dict[str, Any]:
+    """
+    Extracts Ollama's token counts and durations (nanoseconds) from a response.
+    """
+    return {field: response.get(field) for field in OLLAMA_STAT_FIELDS}
+
+
+def _record_llm_call(span, model_name: str, stats: Dict[str, Any]) -> None:
+    """Attaches Ollama stats to the span and feeds the token counters."""
+    span.set(**{key: value for key, value in stats.items() if value is not None})
+    # A replayed cache hit never reached the model (llm_cache_lookups_total counts those)
+    if stats.get("cached"):
+        return
+    for kind in ("prompt_eval_count", "eval_count"):
+        if stats.get(kind):
+            tracer.metrics.increment("llm_tokens_total", stats[kind], model=model_name, kind=kind)
+    # Per-model request count and latency sums; rate(sum) / rate(count) gives the average
+    tracer.metrics.increment("llm_requests_total", model=model_name)
+    _note_prompt_rate(model_name, stats)
+    if stats.get("duration") is not None:
+        tracer.metrics.increment("llm_seconds_total", stats["duration"], model=model_name)
+    if stats.get("ttft") is not None:
+        tracer.metrics.increment("llm_ttft_seconds_total", stats["ttft"], model=model_name)
+
+
+def _record_cache_lookup(span, model_name: str, level: Optional[str]) -> None:
+    span.set(cache=level or "miss")
+    tracer.metrics.increment("llm_cache_lookups_total", model=model_name, result=level or "miss")
+
+
+def _is_direct_answer(response: str) -> bool:
+    """Only answers given without tools are reused for similar questions; tool inputs are question-specific."""
+    return "Final Answer:" in response and "Action:" not in response
+
+
+# Models already loaded (or being loaded) by Brain.preload in this process, with the thread loading them
+_preloaded: Dict[str, threading.Thread] = {}
+_preload_lock = threading.Lock()
+
+# Ollama keeps a model's prefix cache for all its callers, so what it still has to evaluate of a prompt depends on
+# the last prompt any session sent to that model, not only this one's. Tracked per model, with the model's
+# measured prompt evaluation speed (seconds per token) to tell what evaluating the rest would take
+_sent_prompts: Dict[str, str] = {}
+_prompt_seconds_per_token: Dict[str, float] = {}
+_sent_lock = threading.Lock()
+# Assumed until a model's first measured request
+DEFAULT_PROMPT_SECONDS_PER_TOKEN = 1 / 500
+
+
+def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+    return "".join(f"{m.get('role')}:{m.get('content')}\n" for m in messages)
+
+
+def _note_prompt(model: str, messages: List[Dict[str, Any]]) -> None:
+    """Records the prompt about to be sent to a model."""
+    with _sent_lock:
+        _sent_prompts[model] = _prompt_text(messages)
+
+
+def _note_prompt_rate(model: str, stats: Dict[str, Any]) -> None:
+    """Updates the model's prompt evaluation speed from a response's stats (a moving average)."""
+    count, duration = stats.get("prompt_eval_count"), stats.get("prompt_eval_duration")
+    if not count or not duration:
+        return
+    seconds = duration / 1e9 / count
+    with _sent_lock:
+        previous = _prompt_seconds_per_token.get(model)
+        _prompt_seconds_per_token[model] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+
+# Observations mentioning dates, clock times or "now" describe a moment that has passed by the next run
+VOLATILE_PATTERN = re.compile(r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}:\d{2}\b|\b(today|yesterday|tonight|right now|"
+                              r"currently|breaking|live)\b", re.IGNORECASE)
+
+# Splits a cached response into word-sized chunks, so replays stream like the model does
+REPLAY_PATTERN = re.compile(r"\s*\S+|\s+")
+
+
+def _is_observation(message: Dict[str, str]) -> bool:
+    return message.get("role") == "tool" or (message.get("role") == "user" and
+                                             message.get("content", "").startswith("Observation"))
+
+
+class ResponseCache:
+    """
+    Two-level cache of model responses, persisted to SQLite so it survives restarts.
+    The exact level is keyed on a hash of model, messages and options. The optional semantic level
+    matches a near-duplicate user question asked on top of the same context (persona, history, memories).
+    """
+    def __init__(self, path: Optional[str] = None, ttl: float = 86400.0, max_entries: int = 5000,
+                 similarity: float = 0.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Minimum cosine similarity for a semantic hit; 0 turns the semantic level off
+        self.similarity = similarity
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db = None
+        self._collection = None
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, response TEXT, created_at REAL, used_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_used_at ON responses (used_at)")
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "options": options}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def cacheable(messages: List[Dict[str, str]]) -> bool:
+        """
+        False if a tool observation in the conversation carries time-sensitive data.
+        """
+        return not any(_is_observation(m) and VOLATILE_PATTERN.search(m.get("content", "")) for m in messages)
+
+    def get(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any],
+            semantic: bool = False) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns (response, level) where level is 'exact' or 'semantic', or (None, None) on a miss.
+        """
+        response = self._get_exact(self.key(model, messages, options))
+        if response is not None:
+            self.counters["exact_hits"] += 1
+            return response, "exact"
+
+        if semantic and self.similarity > 0:
+            response = self._get_semantic(model, messages, options)
+            if response is not None:
+                self.counters["semantic_hits"] += 1
+                return response, "semantic"
+
+        self.counters["misses"] += 1
+        return None, None
+
+    def put(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any], response: str,
+            semantic: bool = False) -> None:
+        key = self.key(model, messages, options)
+        now = time.time()
+        with self._lock:
+            self._remember(key, (response, now))
+            self.counters["stores"] += 1
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, response, created_at, used_at) "
+                                 "VALUES (?, ?, ?, ?)", (key, response, now, now))
+                # Expired and least recently used rows are pruned now and then rather than on every write
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    self._prune(now)
+                self._db.commit()
+
+        if semantic and self.similarity > 0:
+            self._put_semantic(model, messages, options, key, response, now)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["exact_hits"] + self.counters["semantic_hits"] + self.counters["misses"]
+        hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+        return {**self.counters, "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "semantic": self.similarity > 0}
+
+    def _get_exact(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+
+            if entry is None:
+                return None
+            if now - entry[1] > self.ttl:
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            if self._db is not None:
+                self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            return entry[0]
+
+    def _remember(self, key: str, entry) -> None:
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _prune(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used_at DESC "
+                         "LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def _semantic_collection(self):
+        """Chroma collection of cached questions, created on first use."""
+        if self._collection is None:
+            embedder = get_embedder()
+            name = f"response_cache_{re.sub(r'[^a-zA-Z0-9._-]', '-', embedder.name)}"
+            self._collection = get_chroma_client().get_or_create_collection(
+                name=name, embedding_function=None, metadata={"hnsw:space": "cosine"})
+        return self._collection
+
+    @staticmethod
+    def _semantic_key(model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Optional[str]:
+        """
+        Hash of everything but the final user question, or None if the conversation doesn't end on one.
+        """
+        if not messages or messages[-1].get("role") != "user" or _is_observation(messages[-1]):
+            return None
+        return ResponseCache.key(model, messages[:-1], options)
+
+    def _get_semantic(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Optional[str]:
+        context_key = self._semantic_key(model, messages, options)
+        if context_key is None:
+            return None
+        try:
+            collection = self._semantic_collection()
+            results = collection.query(
+                query_embeddings=get_embedder().embed([messages[-1]["content"]]),
+                n_results=1,
+                where={"$and": [{"context": context_key}, {"created_at": {"$gte": time.time() - self.ttl}}]},
+            )
+        except Exception as e:
+            logger.warning("Semantic response cache lookup failed: %s", e)
+            return None
+
+        if not results.get("ids") or not results["ids"][0]:
+            return None
+        if 1.0 - results["distances"][0][0] < self.similarity:
+            return None
+        return results["documents"][0][0]
+
+    def _put_semantic(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any], key: str,
+                      response: str, now: float) -> None:
+        context_key = self._semantic_key(model, messages, options)
+        if context_key is None:
+            return
+        try:
+            collection = self._semantic_collection()
+            collection.upsert(ids=[key], documents=[response],
+                              embeddings=get_embedder().embed([messages[-1]["content"]]),
+                              metadatas=[{"context": context_key, "created_at": now}])
+            if self._puts % 100 == 0:
+                collection.delete(where={"created_at": {"$lt": now - self.ttl}})
+                overflow = collection.count() - self.max_entries
+                if overflow > 0:
+                    entries = collection.get(include=["metadatas"])
+                    oldest = sorted(zip(entries["ids"], entries["metadatas"]), key=lambda e: e[1]["created_at"])
+                    collection.delete(ids=[entry_id for entry_id, _ in oldest[:overflow]])
+        except Exception as e:
+            logger.warning("Semantic response cache store failed: %s", e)
+
+
+class ModelRouter:
+    """
+    Chooses the model of each ReAct step. A small draft model writes tool-selection steps; the large model
+    writes the Final Answer and takes over a step the draft couldn't format. With race=True both models
+    start every step and the first valid step wins.
+    """
+    def __init__(self, large: str, small: str = None, race: bool = False):
+        self.large = large
+        self.small = small or None
+        self.race = race
+        self.outcomes = {"drafts_accepted": 0, "escalated_answer": 0, "escalated_invalid": 0, "race_won_small": 0,
+                         "race_won_large": 0}
+        self.models: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def draft_model(self) -> Optional[str]:
+        """The model drafting steps, or None when routing is off."""
+        return self.small if self.small and self.small != self.large else None
+
+    def record(self, stats: Dict[str, Any]) -> None:
+        """Adds one call to the per-model counters."""
+        counters = self.models.setdefault(stats.get("model") or self.large,
+                                          {"calls": 0, "tokens": 0, "seconds": 0.0, "ttft_seconds": 0.0})
+        counters["calls"] += 1
+        counters["tokens"] += stats.get("tokens") or 0
+        counters["seconds"] += stats.get("duration") or 0.0
+        counters["ttft_seconds"] += stats.get("ttft") or 0.0
+
+    def count(self, outcome: str) -> None:
+        self.outcomes[outcome] += 1
+        tracer.metrics.increment("model_router_total", outcome=outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        models = {model: {"calls": c["calls"], "tokens": c["tokens"],
+                          "avg_ms": round(c["seconds"] / c["calls"] * 1000, 1),
+                          "avg_ttft_ms": round(c["ttft_seconds"] / c["calls"] * 1000, 1)}
+                  for model, c in self.models.items() if c["calls"]}
+        return {"large": self.large, "small": self.draft_model, "race": self.race, **self.outcomes, "models": models}
+
 
 class Brain:
     """
     Handles communication with the local Ollama LLM.
     """
-    def __init__(self, model_name: str = "llama3"):
+    def __init__(self, model_name: str = "llama3", num_ctx: int = None):
         self.model_name = model_name
+        # Context window size; kept constant so Ollama never reloads the model to resize it
+        self.num_ctx = num_ctx or int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+        # How long Ollama keeps a model loaded after a call, so alternating models don't reload weights
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        # Optional small model drafting tool-selection steps (OLLAMA_DRAFT_MODEL), raced against the large one
+        self.router = ModelRouter(model_name, os.getenv("OLLAMA_DRAFT_MODEL"), os.getenv("MODEL_RACE", "0") == "1")
+        # Stats and native tool calls of the most recent streamed call, per thread (drafts may run alongside)
+        self._local = threading.local()
+        # Process-wide cache of responses (None when RESPONSE_CACHE=0)
+        self.cache = get_response_cache()
+
+    @property
+    def client(self):
+        """Shared HTTP client, so sessions reuse the same connection pool (imported on first call)."""
+        return get_ollama_client()
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        return {"num_ctx": self.num_ctx}
+
+    @property
+    def last_stats(self) -> Dict[str, Any]:
+        """Timing and token counters of this thread's most recent streamed call."""
+        return getattr(self._local, "stats", {})
+
+    @property
+    def last_tool_calls(self) -> List[Dict[str, Any]]:
+        """Native tool calls requested in this thread's most recent streamed call."""
+        return getattr(self._local, "tool_calls", [])
+
+    def set_models(self, model_name: str, draft_model: str = None, race: bool = None) -> None:
+        """
+        Switches models for the next calls; the HTTP client, caches and everything built on them stay.
+        """
+        self.model_name = self.router.large = model_name
+        self.router.small = draft_model or None
+        if race is not None:
+            self.router.race = race
+        if os.getenv("OLLAMA_PRELOAD", "1") == "1":
+            self.preload([model for model in (model_name, self.router.draft_model) if model])
+
+    def preload(self, models: List[str], wait: bool = False) -> None:
+        """
+        Loads models into Ollama in the background (once per process), so the first step doesn't pay for it.
+        With wait, returns once they are loaded (or failed to load).
+        """
+        threads = []
+        for model in models:
+            with _preload_lock:
+                if model not in _preloaded:
+                    _preloaded[model] = threading.Thread(target=self._preload, args=(model,),
+                                                         name=f"preload-{model}", daemon=True)
+                    _preloaded[model].start()
+                threads.append(_preloaded[model])
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _preload(self, model: str) -> None:
+        with tracer.span("brain.preload", model=model):
+            try:
+                # An empty prompt only loads the weights
+                self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+            except Exception as e:
+                logger.warning("Could not preload %s: %s", model, e)
+                with _preload_lock:
+                    _preloaded.pop(model, None)
 
-    def chat(self, messages: List[Dict[str, str]]) -> str:
+    def prefill(self, messages: List[Dict[str, str]], model: str = None) -> Dict[str, Any]:
+        """
+        Has Ollama evaluate a prompt prefix ahead of the request that extends it, so that request finds it in
+        the prefix cache. A single token is generated and discarded. Returns Ollama's stats (error on failure).
+        """
+        model = model or self.model_name
+        with tracer.span("brain.prefill", model=model) as span:
+            try:
+                _note_prompt(model, messages)
+                response = self.client.chat(
+                    model=model,
+                    messages=messages,
+                    options={**self.options, "num_predict": 1},
+                    keep_alive=self.keep_alive,
+                )
+                stats = ollama_stats(response)
+                span.set(**{key: value for key, value in stats.items() if value is not None})
+                _note_prompt_rate(model, stats)
+                return stats
+            except Exception as e:
+                # Only a lost optimization: the request evaluates the prefix itself
+                logger.warning("Prefill on %s failed: %s", model, e)
+                span.set(error=repr(e))
+                return {"error": str(e)}
+
+    def uncached_tokens(self, messages: List[Dict[str, Any]], model: str = None) -> int:
+        """
+        Tokens of a prompt Ollama still has to evaluate, judging by the last prompt this process sent to the
+        model. Another process may have evicted that since, so this is a lower bound.
+        """
+        prompt = _prompt_text(messages)
+        with _sent_lock:
+            cached = len(os.path.commonprefix([prompt, _sent_prompts.get(model or self.model_name, "")]))
+        return estimate_tokens(prompt[cached:])
+
+    def eval_seconds(self, tokens: int, model: str = None) -> float:
+        """Rough time the model takes to evaluate that many prompt tokens, at its measured speed."""
+        with _sent_lock:
+            return tokens * _prompt_seconds_per_token.get(model or self.model_name, DEFAULT_PROMPT_SECONDS_PER_TOKEN)
+
+    def _use_cache(self, messages: List[Dict[str, str]], cache: bool) -> bool:
+        """Whether this call may read and write the response cache."""
+        if self.cache is None:
+            return False
+        if not cache or not self.cache.cacheable(messages):
+            self.cache.counters["bypassed"] += 1
+            return False
+        return True
+
+    def cache_response(self, messages: List[Dict[str, str]], response: str, model: str = None) -> None:
+        """
+        Stores a response the caller cut short on purpose (e.g. once a ReAct step was complete).
+        Full responses are stored by chat and chat_stream themselves.
+        """
+        if self.cache is not None and response and self.cache.cacheable(messages):
+            self.cache.put(model or self.model_name, messages, self.options, response,
+                           semantic=_is_direct_answer(response))
+
+    def chat(self, messages: List[Dict[str, str]], cache: bool = True) -> str:
         """
         Sends a conversation history to the model and returns the text response.
         """
-        try:
-            # Call local Ollama instance
-            response = ollama.chat(
-                model=self.model_name,
-                messages=messages,
-            )
-            return response.get('message', {}).get('content', '')
+        with tracer.span("brain.chat", model=self.model_name, stream=False) as span:
+            use_cache = self._use_cache(messages, cache)
+            if use_cache:
+                cached, level = self.cache.get(self.model_name, messages, self.options)
+                _record_cache_lookup(span, self.model_name, level)
+                if cached is not None:
+                    return cached
 
-        except Exception as e:
-            # Log error and return a safe fallback message
-            print(f"Brain Error: {e}")
-            return "Error: Could not reach the local LLM. Is Ollama running?"
+            try:
+                # Call local Ollama instance
+                _note_prompt(self.model_name, messages)
+                response = self.client.chat(
+                    model=self.model_name,
+                    messages=messages,
+                    options=self.options,
+                    keep_alive=self.keep_alive,
+                )
+                _record_llm_call(span, self.model_name, ollama_stats(response))
+                content = response.get('message', {}).get('content', '')
+                if use_cache and content:
+                    self.cache.put(self.model_name, messages, self.options, content)
+                return content
+
+            except Exception as e:
+                # Log error and return a safe fallback message
+                logger.error("Brain Error: %s", e)
+                span.set(error=repr(e))
+                return "Error: Could not reach the local LLM. Is Ollama running?"
+
+    def chat_stream(self, messages: List[Dict[str, str]], cache: bool = True, format: Dict[str, Any] = None,
+                    tools: List[Dict[str, Any]] = None, model: str = None) -> Iterator[str]:
+        """
+        Streams the model response token by token.
+        Closing the generator early aborts the request, so Ollama stops generating.
+        Cached responses are replayed in word-sized chunks without calling the model.
+        format constrains the output to a JSON schema; native tool calls end up in last_tool_calls.
+        model overrides the session's model for this call (e.g. a small draft model).
+        """
+        model = model or self.model_name
+        stats = {"model": model, "ttft": None, "tokens": 0, "duration": 0.0, "stopped_early": True,
+                 "cached": None, "error": None, **{field: None for field in OLLAMA_STAT_FIELDS}}
+        tool_calls = []
+        self._local.stats, self._local.tool_calls = stats, tool_calls
+        # Constrained and tool-calling requests are cached apart from plain ones, and only plain answers are
+        # reused for near-duplicate questions
+        plain = not (format or tools)
+        options = self.options if plain else {**self.options, "format": format, "tools": tools}
+        start = time.perf_counter()
+        stream = None
+
+        with tracer.span("brain.chat", model=model, stream=True) as span:
+            try:
+                use_cache = self._use_cache(messages, cache)
+                cached = None
+                if use_cache:
+                    # Near-duplicate questions may reuse a direct answer given on the same context
+                    cached, stats["cached"] = self.cache.get(model, messages, options,
+                                                             semantic=plain)
+                    _record_cache_lookup(span, model, stats["cached"])
+
+                if cached is not None:
+                    stats["stopped_early"] = False
+                    for token in REPLAY_PATTERN.findall(cached):
+                        if stats["ttft"] is None:
+                            stats["ttft"] = time.perf_counter() - start
+                        stats["tokens"] += 1
+                        yield token
+                    return
+
+                _note_prompt(model, messages)
+                stream = self.client.chat(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    options=self.options,
+                    keep_alive=self.keep_alive,
+                    format=format,
+                    tools=tools,
+                )
+                parts = []
+                for chunk in stream:
+                    message = chunk.get('message', {})
+                    token = message.get('content', '')
+                    for call in message.get('tool_calls') or []:
+                        tool_calls.append(
+                            {"function": {"name": call.function.name, "arguments": dict(call.function.arguments)}})
+                    if chunk.get('done'):
+                        stats["stopped_early"] = False
+                        stats.update(ollama_stats(chunk))
+                    if not token:
+                        continue
+
+                    if stats["ttft"] is None:
+                        stats["ttft"] = time.perf_counter() - start
+                    stats["tokens"] += 1
+                    parts.append(token)
+                    yield token
+
+                if use_cache and parts and not stats["stopped_early"] and not tool_calls:
+                    response = "".join(parts)
+                    self.cache.put(model, messages, options, response,
+                                   semantic=plain and _is_direct_answer(response))
+
+            except Exception as e:
+                # Log error and return a safe fallback message
+                logger.error("Brain Error: %s", e)
+                span.set(error=repr(e))
+                stats["stopped_early"] = False
+                stats["error"] = str(e)
+                # Set when the server answered with an error (e.g. 400 for a model without tool support)
+                stats["status_code"] = getattr(e, "status_code", None)
+                yield "Error: Could not reach the local LLM. Is Ollama running?"
+
+            finally:
+                # Release the HTTP stream if the caller stopped reading
+                if stream is not None and hasattr(stream, 'close'):
+                    stream.close()
+                stats["duration"] = time.perf_counter() - start
+                _record_llm_call(span, model, stats)
 
     def check_connection(self) -> bool:
         """
         Verifies if the specified model is pulled and available locally.
         """
         try:
-            models_info = ollama.list()
-            available_models = [m.get('name', '') for m in models_info.get('models', [])]
+            models_info = self.client.list()
+            # Newer clients report the name as 'model', older ones as 'name'
+            available_models = [m.get('model') or m.get('name') or '' for m in models_info.get('models', [])]
 
             # Match base name (e.g., 'llama3' matches 'llama3:latest')
             return any(self.model_name in  model for model in available_models)
 
         except Exception:
-            return False
\ No newline at end of file
+            return False
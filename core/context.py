@@ -0,0 +1,233 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import List, Dict, Any
+
+# Rough token estimate; good enough for budgeting without loading a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Share of num_ctx given to each prompt section (the rest is left for generation)
+DEFAULT_BUDGET_SHARES = {"persona": 0.15, "history": 0.40, "memories": 0.10, "observations": 0.25}
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an AI agent.
+Keep names, facts, decisions and open tasks. Answer with the updated summary only.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximates the number of tokens in a piece of text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _serialize(messages: List[Dict[str, str]]) -> str:
+    return "".join(f"{m['role']}:{m['content']}\n" for m in messages)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ContextManager:
+    """
+    Lays out the prompt so its prefix stays byte-identical between calls, letting Ollama reuse
+    the llama.cpp prefix KV cache, and keeps every section within a token budget.
+
+    Layout: persona -> rolling summary -> history -> memories -> query -> ReAct steps.
+    Everything up to the history only changes when old turns are compacted into the summary.
+    """
+    def __init__(self, brain, num_ctx: int = None, compact_threshold: int = None, keep_recent: int = 4,
+                 max_ledger: int = 256):
+        self.brain = brain
+        self.num_ctx = num_ctx or brain.num_ctx
+        self.budgets = {name: int(self.num_ctx * share) for name, share in DEFAULT_BUDGET_SHARES.items()}
+
+        # Compact the history once it grows past this many tokens, keeping the last few messages verbatim
+        self.compact_threshold = compact_threshold or int(
+            os.getenv("CONTEXT_COMPACT_THRESHOLD", self.budgets["history"]))
+        self.keep_recent = keep_recent
+
+        # Rolling summary of the compacted part of the history
+        self.summary = ""
+        self._summarized = 0
+        self._summarized_digest = None
+
+        # Exact messages sent for earlier turns, so the re-rendered history matches the cached prefix
+        self._ledger: OrderedDict = OrderedDict()
+        self._max_ledger = max_ledger
+        self._pending_turn = None
+
+        self._last_prompt = ""
+        self.stats = {"requests": 0, "prompt_chars": 0, "prefix_chars": 0, "measured_requests": 0,
+                      "prompt_tokens": 0, "prompt_eval_count": 0, "prompt_eval_ms": 0.0}
+
+    def build(self, system_prompt: str, chat_history: List[Dict[str, str]], memories: List[str],
+              user_query: str) -> List[Dict[str, str]]:
+        """
+        Assembles the message list for a new query.
+        """
+        return self.complete(self.prefix(system_prompt, chat_history), memories, user_query)
+
+    def prefix(self, system_prompt: str, chat_history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        The stable start of the next prompt (persona, summary, history). It doesn't depend on the query, so it
+        can be built, and evaluated by Ollama, while the query's memories are still being looked up.
+        """
+        messages = [{"role": "system", "content": self._fit(system_prompt, "persona")}]
+
+        history = self._compact(chat_history)
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        messages.extend(self._render_history(history))
+        return messages
+
+    def complete(self, prefix: List[Dict[str, str]], memories: List[str], user_query: str) -> List[Dict[str, str]]:
+        """
+        Appends the memories and the query to a prefix, giving the message list for the query.
+        """
+        messages = list(prefix)
+        # Volatile parts go last so they never invalidate the cached prefix
+        preamble = []
+        if memories:
+            preamble.append({"role": "system", "content": f"Relevant context from your memory: {memories}"})
+        messages.extend(preamble)
+        messages.append({"role": "user", "content": user_query})
+
+        self._pending_turn = (user_query, preamble)
+        return messages
+
+    def remember_turn(self, raw_response: str, final_answer: str) -> None:
+        """
+        Records what was actually sent for the finished turn, so the next prompt replays it verbatim.
+        """
+        if self._pending_turn is None:
+            return
+        user_query, preamble = self._pending_turn
+        self._pending_turn = None
+
+        self._remember(("user", user_query), preamble)
+        self._remember(("assistant", final_answer), raw_response)
+
+    def fit_memories(self, memories: List[str]) -> List[str]:
+        """
+        Keeps the most relevant memories that fit in the memory budget.
+        """
+        fitted, used = [], 0
+        for memory in memories:
+            used += estimate_tokens(memory)
+            if used > self.budgets["memories"]:
+                break
+            fitted.append(memory)
+        return fitted
+
+    def fit_observation(self, observation: str, parts: int = 1) -> str:
+        """
+        Truncates a tool observation to its share of the observation budget.
+        """
+        max_chars = self.budgets["observations"] * CHARS_PER_TOKEN // parts
+        if len(observation) <= max_chars:
+            return observation
+        return observation[:max_chars] + "\n... [truncated]"
+
+    def record_prefill(self, prefix: List[Dict[str, str]]) -> None:
+        """Notes a prefix evaluated ahead of its request; the request then reuses it."""
+        self._last_prompt = _serialize(prefix)
+
+    def record(self, messages: List[Dict[str, str]], stats: Dict[str, Any]) -> None:
+        """
+        Tracks prefix reuse between consecutive prompts and Ollama's prompt evaluation stats.
+        """
+        prompt = _serialize(messages)
+        common = os.path.commonprefix([prompt, self._last_prompt])
+        self._last_prompt = prompt
+
+        self.stats["requests"] += 1
+        self.stats["prompt_chars"] += len(prompt)
+        self.stats["prefix_chars"] += len(common)
+
+        # Ollama only reports prompt stats in the final chunk, which early-stopped streams never receive
+        prompt_eval_count = stats.get("prompt_eval_count")
+        if prompt_eval_count is not None:
+            prompt_tokens = estimate_tokens(prompt)
+            self.stats["measured_requests"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["prompt_eval_count"] += min(prompt_eval_count, prompt_tokens)
+            self.stats["prompt_eval_ms"] += (stats.get("prompt_eval_duration") or 0) / 1e6
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Summarizes cache efficiency for display.
+        """
+        s = self.stats
+        return {
+            "requests": s["requests"],
+            "prefix_reuse": round(s["prefix_chars"] / s["prompt_chars"], 3) if s["prompt_chars"] else 0.0,
+            "cache_hit_rate": round(1 - s["prompt_eval_count"] / s["prompt_tokens"], 3) if s["prompt_tokens"] else None,
+            "avg_prompt_eval_ms": round(s["prompt_eval_ms"] / s["measured_requests"], 1) if s["measured_requests"] else None,
+            "summarized_messages": self._summarized,
+            "num_ctx": self.num_ctx,
+        }
+
+    def _fit(self, text: str, section: str) -> str:
+        """Cuts text down to the token budget of a section."""
+        max_chars = self.budgets[section] * CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars] + "\n... [truncated]"
+
+    def _compact(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Folds old turns into the rolling summary once the history exceeds the threshold."""
+        # Start over if the history no longer begins with what the summary covers (e.g. chat cleared)
+        if self._summarized and (len(history) < self._summarized or
+                                 _digest(_serialize(history[:self._summarized])) != self._summarized_digest):
+            self.summary, self._summarized, self._summarized_digest = "", 0, None
+
+        recent = history[self._summarized:]
+        if estimate_tokens(_serialize(recent)) > self.compact_threshold and len(recent) > self.keep_recent:
+            cut = len(recent) - self.keep_recent
+            self.summary = self._summarize(recent[:cut])
+            self._summarized += cut
+            self._summarized_digest = _digest(_serialize(history[:self._summarized]))
+            recent = recent[cut:]
+
+        return recent
+
+    def _summarize(self, messages: List[Dict[str, str]]) -> str:
+        """Asks the model to merge messages into the running summary."""
+        transcript = "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+        summary = self.brain.chat([{
+            "role": "user",
+            "content": SUMMARY_PROMPT.format(summary=self.summary or "(empty)", transcript=transcript),
+        }])
+
+        if summary.startswith("Error:"):
+            # Keep going without the model; a truncated transcript is better than losing the turns
+            summary = f"{self.summary}\n{transcript}".strip()
+        return self._fit(summary, "history")
+
+    def _render_history(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Replays earlier turns exactly as they were sent."""
+        rendered = []
+        for message in history:
+            key = _digest(f"{message['role']}:{message['content']}")
+            sent = self._ledger.get(key)
+
+            if message["role"] == "user" and sent:
+                rendered.extend(sent)
+                rendered.append(message)
+            elif message["role"] == "assistant" and sent:
+                rendered.append({"role": "assistant", "content": sent})
+            else:
+                rendered.append(message)
+        return rendered
+
+    def _remember(self, message_key, value) -> None:
+        role, content = message_key
+        self._ledger[_digest(f"{role}:{content}")] = value
+        while len(self._ledger) > self._max_ledger:
+            self._ledger.popitem(last=False)
@@ -0,0 +1,348 @@
+"""
+Headless entry points for the agent: a JSONL batch runner and a small HTTP API, for nightly jobs and other
+services that can't go through the Streamlit app.
+
+    python -m core.headless batch [--concurrency 4] < queries.jsonl > results.jsonl
+    python -m core.headless serve [--port 8600] [--concurrency 4]
+
+A request is a JSON object with a "query" and optionally an "id", a "session_id" and the parameters of
+Agent.run (chat_history, max_iterations, user_name, user_info, agent_name, agent_role, agent_instructions).
+Requests of one session run in order on the same agent, which keeps the session's history unless the request
+brings its own chat_history.
+
+HTTP: POST /v1/run (add "stream": true for NDJSON tokens), GET /v1/stats, GET /healthz.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO
+
+from core.agent import Agent
+from core.brain import Brain
+from core.resources import start_warmup, tenant_for
+from core.tracing import configure_logging, logger, tracer
+
+RUN_PARAMS = ("chat_history", "max_iterations", "user_name", "user_info", "agent_name", "agent_role",
+              "agent_instructions")
+
+
+class RunnerBusy(Exception):
+    """Raised when more requests are waiting for a slot than the runner accepts."""
+
+
+def _run_params(request: Dict[str, Any]) -> Dict[str, Any]:
+    """The Agent.run parameters of a request, type-checked. Raises ValueError for a malformed one."""
+    params = {name: request[name] for name in RUN_PARAMS if request.get(name) is not None}
+    for name, value in params.items():
+        if name == "chat_history":
+            if not isinstance(value, list) or not all(
+                    isinstance(message, dict) and isinstance(message.get("role"), str)
+                    and isinstance(message.get("content"), str) for message in value):
+                raise ValueError("'chat_history' must be a list of {\"role\", \"content\"} string objects.")
+        elif name == "max_iterations":
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise ValueError("'max_iterations' must be a positive integer.")
+        elif not isinstance(value, str):
+            raise ValueError(f"'{name}' must be a string.")
+    return params
+
+
+class _Session:
+    def __init__(self, agent: Agent):
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.history: List[Dict[str, str]] = []
+
+
+class HeadlessRunner:
+    """
+    Runs agent requests for the batch and HTTP entry points: one Brain and the process-wide memory and tools
+    are shared, each session gets its own agent (idle ones are dropped beyond max_sessions), and at most
+    `concurrency` runs execute at once while up to max_pending more wait for a slot.
+    """
+    def __init__(self, model_name: str = "llama3", concurrency: int = 4, max_pending: int = 64,
+                 max_sessions: int = 1000):
+        self.model_name = model_name
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.max_sessions = max_sessions
+        self.brain = Brain(model_name=model_name)
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=10000)
+        self.counters = {"requests": 0, "errors": 0, "rejected": 0, "waiting": 0, "running": 0}
+        self.started_at: Optional[float] = None
+
+    def run(self, request: Dict[str, Any], on_token: Callable[[str], None] = None) -> Dict[str, Any]:
+        """
+        Answers one request and returns {"id", "session_id", "answer", "error", "seconds", "trace_id"}.
+        Raises ValueError for a malformed request and RunnerBusy under backpressure.
+        """
+        query = request.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("The request needs a non-empty 'query' string.")
+        params = _run_params(request)
+        session_id = str(request["session_id"]) if request.get("session_id") else None
+
+        # A request without a session is a one-off conversation on an agent of its own
+        session = self._session(session_id) if session_id else _Session(self._agent())
+        with self._lock:
+            if self.counters["waiting"] >= self.max_pending:
+                self.counters["rejected"] += 1
+                tracer.metrics.increment("headless_requests_total", status="rejected")
+                raise RunnerBusy(f"More than {self.max_pending} requests are waiting, try again shortly.")
+            self.counters["waiting"] += 1
+            if self.started_at is None:
+                self.started_at = time.time()
+
+        start = time.perf_counter()
+        # A session's requests take turns; waiting for the turn doesn't hold one of the slots
+        with session.lock, self._slots:
+            with self._lock:
+                self.counters["waiting"] -= 1
+                self.counters["running"] += 1
+            try:
+                answer, trace_id = self._answer(session, query, params, on_token)
+            finally:
+                with self._lock:
+                    self.counters["running"] -= 1
+
+        seconds = time.perf_counter() - start
+        error = answer if answer.startswith("Error") else None
+        with self._lock:
+            self.counters["requests"] += 1
+            self.counters["errors"] += error is not None
+            self._latencies.append(seconds * 1000)
+        tracer.metrics.observe("headless.request", seconds)
+        tracer.metrics.increment("headless_requests_total", status="error" if error else "ok")
+        return {"id": request.get("id"), "session_id": session_id, "answer": answer, "error": error,
+                "seconds": round(seconds, 3), "trace_id": trace_id}
+
+    def _answer(self, session: _Session, query: str, params: Dict[str, Any],
+                on_token: Callable[[str], None] = None):
+        agent = session.agent
+        agent.set_tenant(tenant_for(params.get("user_name", "User")))
+        # Without its own history, a request continues the session's conversation
+        own_history = "chat_history" in params
+        if not own_history:
+            params["chat_history"] = list(session.history)
+        tokens = []
+        for token in agent.stream(query, **params):
+            tokens.append(token)
+            if on_token is not None:
+                on_token(token)
+        answer = "".join(tokens)
+        if not own_history:
+            session.history += [{"role": "user", "content": query}, {"role": "assistant", "content": answer}]
+        return answer, agent.latest_trace_id
+
+    def _session(self, session_id: str) -> _Session:
+        """The session's agent, created on first use; the least recently used idle sessions are dropped."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self._agent())
+            self._sessions.move_to_end(session_id)
+            if len(self._sessions) > self.max_sessions:
+                idle = [key for key, other in self._sessions.items() if not other.lock.locked()]
+                for key in idle[:len(self._sessions) - self.max_sessions]:
+                    del self._sessions[key]
+            return session
+
+    def _agent(self) -> Agent:
+        return Agent(model_name=self.model_name, brain=self.brain)
+
+    def stats(self) -> Dict[str, Any]:
+        """Request counters, throughput since the first request and latency percentiles."""
+        from tools.search import percentile
+        with self._lock:
+            latencies = list(self._latencies)
+            counters = dict(self.counters)
+            sessions = len(self._sessions)
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        return {**counters, "sessions": sessions, "concurrency": self.concurrency,
+                "seconds": round(elapsed, 3),
+                "queries_per_sec": round(counters["requests"] / elapsed, 2) if elapsed else 0.0,
+                "latency_ms": {f"p{int(q * 100)}": round(percentile(latencies, q), 1) if latencies else None
+                               for q in (0.5, 0.95, 0.99)}}
+
+
+def run_batch(runner: HeadlessRunner, lines: Iterable[str], out: TextIO) -> Dict[str, Any]:
+    """
+    Answers JSONL requests with runner.concurrency workers, writing one JSON result per line as runs finish.
+    Input is read as it is consumed (at most twice the concurrency ahead), so batches of any size stream
+    through; requests of one session run in input order.
+    """
+    write_lock = threading.Lock()
+    read_ahead = threading.BoundedSemaphore(runner.concurrency * 2)
+    last_of_session: Dict[str, Future] = {}
+
+    def write(result: Dict[str, Any]) -> None:
+        with write_lock:
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+
+    def answer(request: Dict[str, Any], previous: Optional[Future]) -> None:
+        if previous is not None:
+            wait([previous])
+        try:
+            write(runner.run(request))
+        except Exception as e:
+            logger.error("Batch request %s failed: %s", request.get("id"), e)
+            write({"id": request.get("id"), "session_id": request.get("session_id"), "answer": None,
+                   "error": f"Error: {e}"})
+
+    with ThreadPoolExecutor(max_workers=runner.concurrency, thread_name_prefix="batch") as pool:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("each line must be a JSON object")
+            except ValueError as e:
+                write({"id": number, "answer": None, "error": f"Error: Invalid request on line {number}: {e}"})
+                continue
+            request.setdefault("id", number)
+
+            read_ahead.acquire()
+            session_id = request.get("session_id")
+            future = pool.submit(answer, request, last_of_session.get(session_id) if session_id else None)
+            future.add_done_callback(lambda _: read_ahead.release())
+            if session_id:
+                last_of_session[session_id] = future
+                if len(last_of_session) > runner.concurrency * 4:
+                    last_of_session = {key: f for key, f in last_of_session.items() if not f.done()}
+    return runner.stats()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    runner: HeadlessRunner = None
+    warmup = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/v1/stats":
+            self._json(self.runner.stats())
+        elif self.path == "/healthz":
+            status = self.warmup.status() if self.warmup is not None else {"state": "ready"}
+            self._json(status, 200 if status["state"] == "ready" else 503)
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if self.path != "/v1/run":
+            self._json({"error": "not found"}, 404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("the body must be a JSON object")
+            if request.get("stream"):
+                self._stream(request)
+            else:
+                self._json(self.runner.run(request))
+        except RunnerBusy as e:
+            self._json({"error": str(e)}, 429)
+        except ValueError as e:
+            self._json({"error": f"Invalid request: {e}"}, 400)
+        except Exception as e:
+            logger.error("Request to %s failed: %s", self.path, e)
+            self._json({"error": f"Error: {e}"}, 500)
+
+    def _stream(self, request: Dict[str, Any]) -> None:
+        """
+        Sends {"token": ...} lines as the answer is written, then the result with "done": true. A failure after
+        the first line ends the stream with an {"error": ...} line, since the status was already sent.
+        """
+        started = []
+
+        def send(payload: Dict[str, Any]) -> None:
+            if not started:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                started.append(True)
+            chunk = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            result = self.runner.run(request, on_token=lambda token: send({"token": token}))
+        except Exception as e:
+            if not started:
+                raise
+            logger.error("Streamed request failed: %s", e)
+            result = {"id": request.get("id"), "answer": None, "error": f"Error: {e}"}
+        send({**result, "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(runner: HeadlessRunner, host: str = "127.0.0.1", port: int = 8600) -> None:
+    """Serves the HTTP API until interrupted, then prints the runner's statistics."""
+    _Handler.runner = runner
+    _Handler.warmup = start_warmup(runner.model_name)
+    server = ThreadingHTTPServer((host, port), _Handler)
+    logger.info("Headless API listening on http://%s:%s", host, server.server_port)
+    print(f"Listening on http://{host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(runner.stats(), indent=2), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["batch", "serve"])
+    parser.add_argument("--model", default="llama3")
+    parser.add_argument("--concurrency", type=int, default=4, help="agent runs executing at once")
+    parser.add_argument("--max-pending", type=int, default=64, help="requests waiting for a slot before 429")
+    parser.add_argument("--input", help="JSONL requests (batch; default stdin)")
+    parser.add_argument("--output", help="JSONL results (batch; default stdout)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+
+    configure_logging()
+    runner = HeadlessRunner(args.model, args.concurrency, args.max_pending)
+    if args.command == "serve":
+        serve(runner, args.host, args.port)
+        return
+
+    source = open(args.input, "r", encoding="utf-8") if args.input else sys.stdin
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        report = run_batch(runner, source, out)
+    finally:
+        if args.input:
+            source.close()
+        if args.output:
+            out.close()
+    # Results go to stdout, so the report goes to stderr
+    print(json.dumps(report, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from core.tracing import logger, tracer
+
+FINISHED = ("done", "error", "cancelled")
+
+
+class JobRejected(Exception):
+    """Raised when the queue is full or the owner already has as many jobs as allowed."""
+
+
+class Job:
+    """
+    One agent run or tool call executed in the background. Progress is recorded as a list of events
+    ({"kind": "thought" | "observation" | "token", "text": ...}) that readers poll or wait on.
+    """
+    def __init__(self, owner: str, kind: str, description: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.kind = kind
+        self.description = description
+        self.status = "queued"
+        self.events: List[Dict[str, Any]] = []
+        # The streamed tokens so far (the answer of an agent run)
+        self.output = ""
+        self.result = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancelled = threading.Event()
+        self._cancel_callbacks: List[Callable[[], None]] = []
+        self._changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def emit(self, kind: str, text: str) -> None:
+        """Records a progress event and wakes up waiting readers."""
+        with self._changed:
+            self.events.append({"kind": kind, "text": text, "time": time.time()})
+            if kind == "token":
+                self.output += text
+            self._changed.notify_all()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Registers a callback that interrupts the work (called right away if already cancelled)."""
+        with self._changed:
+            self._cancel_callbacks.append(callback)
+        if self.cancelled:
+            callback()
+
+    def cancel(self) -> None:
+        """Asks the job to stop; a queued job never starts, a running one stops at its next checkpoint."""
+        self._cancelled.set()
+        with self._changed:
+            callbacks = list(self._cancel_callbacks)
+            self._changed.notify_all()
+        for callback in callbacks:
+            callback()
+
+    def wait(self, since: int = 0, timeout: float = None) -> List[Dict[str, Any]]:
+        """
+        Blocks until there are events after index `since` or the job finished, and returns the new events.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > since or self.done, timeout)
+            return self.events[since:]
+
+    def stream(self, poll: float = 1.0):
+        """Yields the progress events as they happen, until the job finished."""
+        seen = 0
+        while True:
+            events = self.wait(seen, poll)
+            seen += len(events)
+            yield from events
+            if self.done and seen == len(self.events):
+                return
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The job's state without its events, e.g. for a status table."""
+        end = self.finished_at or time.time()
+        return {"id": self.id, "owner": self.owner, "kind": self.kind, "description": self.description,
+                "status": self.status, "events": len(self.events), "error": self.error,
+                "wait_s": round((self.started_at or end) - self.created_at, 3),
+                "run_s": round(end - self.started_at, 3) if self.started_at else None}
+
+    def _set_status(self, status: str, result: Any = None, error: str = None) -> None:
+        with self._changed:
+            self.status = status
+            if status == "running":
+                self.started_at = time.time()
+            else:
+                self.result, self.error, self.finished_at = result, error, time.time()
+            self._changed.notify_all()
+
+
+class JobQueue:
+    """
+    Bounded worker pool for agent runs and long tool calls, so the Streamlit script thread never blocks on them.
+    At most max_queued jobs wait for a worker and each owner has at most per_user jobs queued or running;
+    further submissions are rejected (backpressure) instead of piling up.
+    """
+    def __init__(self, max_workers: int = 4, max_queued: int = 32, per_user: int = 2, keep_finished: int = 200):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.per_user = per_user
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "rejected": 0, "done": 0, "error": 0, "cancelled": 0}
+
+    def submit(self, owner: str, kind: str, target: Callable[[Job], Any], description: str = "") -> Job:
+        """
+        Queues target(job) for a worker and returns the job right away. Raises JobRejected under backpressure.
+        """
+        with self._lock:
+            active = [job for job in self._jobs.values() if not job.done]
+            reason = None
+            if sum(job.status == "queued" for job in active) >= self.max_queued:
+                reason = "queue_full"
+            elif sum(job.owner == owner for job in active) >= self.per_user:
+                reason = "user_limit"
+            if reason:
+                self.counters["rejected"] += 1
+                tracer.metrics.increment("jobs_rejected_total", reason=reason)
+                raise JobRejected("The job queue is full, try again shortly." if reason == "queue_full" else
+                                  f"At most {self.per_user} jobs per user can run at once.")
+
+            job = Job(owner, kind, description)
+            self._jobs[job.id] = job
+            self.counters["submitted"] += 1
+            self._prune()
+        self._executor.submit(self._run, job, target)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, owner: str = None) -> List[Job]:
+        """Recent jobs, oldest first, optionally of one owner."""
+        with self._lock:
+            return [job for job in self._jobs.values() if owner is None or job.owner == owner]
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job.cancel()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {"workers": self.max_workers, "max_queued": self.max_queued, "per_user": self.per_user,
+                "queued": statuses.count("queued"), "running": statuses.count("running"), **self.counters}
+
+    def _run(self, job: Job, target: Callable[[Job], Any]) -> None:
+        if job.cancelled:
+            self._finish(job, "cancelled")
+            return
+        job._set_status("running")
+        tracer.metrics.observe("job.wait", job.started_at - job.created_at)
+        try:
+            result = target(job)
+            self._finish(job, "cancelled" if job.cancelled else "done", result)
+        except Exception as e:
+            logger.error("Job %s (%s) failed: %s", job.id, job.kind, e)
+            self._finish(job, "error", error=f"Error: {e}")
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: str = None) -> None:
+        job._set_status(status, result, error)
+        if job.started_at:
+            tracer.metrics.observe("job.run", job.finished_at - job.started_at)
+        tracer.metrics.increment("jobs_total", kind=job.kind, status=status)
+        with self._lock:
+            self.counters[status] += 1
+
+    def _prune(self) -> None:
+        """Forgets the oldest finished jobs beyond keep_finished."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+
+def agent_run(agent, **run_args) -> Callable[[Job], str]:
+    """
+    Job target running agent.stream(**run_args): thoughts, observations and answer tokens become job events.
+    """
+    def run(job: Job) -> str:
+        agent.on_progress = job.emit
+        # The run's own cancel token: cancelling this job never touches a later run of the same agent
+        cancel = threading.Event()
+        job.on_cancel(lambda: agent.cancel(cancel))
+        tokens = agent.stream(**run_args, cancel=cancel)
+        try:
+            for token in tokens:
+                job.emit("token", token)
+                if job.cancelled:
+                    break
+        finally:
+            # Closing the generator aborts a model call that is still streaming
+            tokens.close()
+            agent.on_progress = None
+        return job.output
+
+    return run
+
+
+def tool_call(agent, action: str, action_input: str) -> Callable[[Job], str]:
+    """Job target running one tool (e.g. reading a large document) outside of a ReAct run."""
+    def run(job: Job) -> str:
+        observation = agent.call_tool(action, action_input)
+        job.emit("observation", f"🛠️ Tool Observation ({action}):\n{observation}")
+        return observation
+
+    return run
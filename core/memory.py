@@ -1,57 +1,820 @@
+import hashlib
+import heapq
+import math
 import os
-import chromadb
-from typing import List, Dict, Any
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict, defaultdict
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+from core.resources import get_chroma_client, get_embedder
+from core.tracing import logger, tracer
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before hashing, so trivially different spellings share a cache entry.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+# Words too common to tell memories apart
+STOPWORDS = frozenset("a about an and are as at be but by can could did do does for from had has have how i in is it its "
+                      "know me my of on or our please remember should so tell that the their them there these this "
+                      "to was we were what when where which who why will with would you your".split())
+
+# Words, keeping identifiers such as file paths, versions and IDs (report_v2.pdf, INV-4821) in one piece
+LEXICAL_TOKEN_PATTERN = re.compile(r"\w+(?:[./:-]\w+)*")
+IDENTIFIER_SEPARATORS = re.compile(r"[./:-]")
+
+
+def lexical_terms(text: str) -> List[str]:
+    """
+    Index terms of a text: lowercase words without stopwords. Identifiers are indexed whole, by every
+    tail (so 'docs/report_v2.pdf' also matches 'report_v2.pdf') and by their parts.
+    """
+    terms = []
+    for token in LEXICAL_TOKEN_PATTERN.findall(text.lower()):
+        tails = [token[separator.end():] for separator in IDENTIFIER_SEPARATORS.finditer(token)]
+        if not tails:
+            if token not in STOPWORDS:
+                terms.append(token)
+            continue
+        parts = IDENTIFIER_SEPARATORS.split(token)
+        terms.extend(dict.fromkeys([token, *tails, *(part for part in parts if part not in STOPWORDS)]))
+    return terms
+
+
+def memory_filter(user: str = None, source: str = None, since: float = None,
+                  until: float = None) -> Optional[Dict[str, Any]]:
+    """
+    Chroma `where` clause for the metadata filters that are set (timestamps are epoch seconds), or None.
+    """
+    clauses = []
+    if user is not None:
+        clauses.append({"user": user})
+    if source is not None:
+        clauses.append({"source": source})
+    if since is not None:
+        clauses.append({"created_at": {"$gte": since}})
+    if until is not None:
+        clauses.append({"created_at": {"$lt": until}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def metadata_matches(metadata: Optional[Dict[str, Any]], user: str = None, source: str = None, since: float = None,
+                     until: float = None) -> bool:
+    """The same filters as memory_filter, checked in Python on one memory's metadata."""
+    metadata = metadata or {}
+    if user is not None and metadata.get("user") != user:
+        return False
+    if source is not None and metadata.get("source") != source:
+        return False
+    created_at = metadata.get("created_at")
+    if since is not None and (created_at is None or created_at < since):
+        return False
+    if until is not None and (created_at is None or created_at >= until):
+        return False
+    return True
+
+
+def memory_id(text: str, user: str = None) -> str:
+    """Content-hash id: the same fact of the same user always gets the same id, whatever else is stored."""
+    return "mem_" + hashlib.sha1(f"{user or ''}\0{normalize_text(text)}".encode("utf-8")).hexdigest()[:20]
+
+
+def tenant_slug(tenant: str) -> str:
+    """Collection-safe name of a tenant: readable prefix plus a hash, so distinct names never collide."""
+    readable = re.sub(r"[^a-z0-9]+", "-", tenant.lower()).strip("-")[:24]
+    return f"{readable or 'tenant'}-{hashlib.sha1(tenant.encode('utf-8')).hexdigest()[:8]}"
+
+
+def cosine_similarity(a, b) -> float:
+    import numpy as np
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / norm if norm else 0.0
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Merges ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring, updated incrementally as memories are added.
+    Postings are compact arrays; removed documents are skipped until enough pile up to rebuild them.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75, common_ratio: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        # Terms found in more than this share of the documents add almost nothing but cost a full posting scan
+        self.common_ratio = common_ratio
+        # term -> (document numbers, term frequencies)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        # document number -> memory id, None once removed
+        self._ids: List[Optional[str]] = []
+        self._numbers: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._total_length = 0
+        self._removed = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def add(self, doc_id: str, text: str) -> None:
+        with self._lock:
+            if doc_id in self._numbers:
+                self.remove(doc_id)
+            number = len(self._ids)
+            self._ids.append(doc_id)
+            self._numbers[doc_id] = number
+            counts = Counter(lexical_terms(text))
+            length = sum(counts.values())
+            self._lengths.append(length)
+            self._total_length += length
+            for term, frequency in counts.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = (array("I"), array("H"))
+                posting[0].append(number)
+                posting[1].append(min(frequency, 65535))
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            number = self._numbers.pop(doc_id, None)
+            if number is None:
+                return
+            self._ids[number] = None
+            self._total_length -= self._lengths[number]
+            self._removed += 1
+            if self._removed > max(1000, len(self._ids) // 4):
+                self._compact()
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float, float]]:
+        """
+        Best matches as (id, score, share of the query terms the memory contains), highest score first.
+        """
+        terms = set(lexical_terms(query))
+        with self._lock:
+            count = len(self._numbers)
+            if not terms or not count:
+                return []
+            average_length = self._total_length / count or 1.0
+            postings = [(term, self._postings[term]) for term in terms if term in self._postings]
+            # Skip very common terms, unless nothing else is left
+            selective = [item for item in postings if len(item[1][0]) <= self.common_ratio * count]
+            scores, matched = defaultdict(float), defaultdict(int)
+            for term, (numbers, frequencies) in selective or postings:
+                frequency_in_docs = len(numbers)
+                idf = math.log(1 + (count - frequency_in_docs + 0.5) / (frequency_in_docs + 0.5))
+                for number, frequency in zip(numbers, frequencies):
+                    if self._ids[number] is None:
+                        continue
+                    length_norm = 1 - self.b + self.b * self._lengths[number] / average_length
+                    scores[number] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                    matched[number] += 1
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [(self._ids[number], score, matched[number] / len(terms)) for number, score in best]
+
+    def _compact(self) -> None:
+        """Drops removed documents from the postings and renumbers the rest."""
+        renumber = {}
+        ids, lengths = [], array("I")
+        for number, doc_id in enumerate(self._ids):
+            if doc_id is not None:
+                renumber[number] = len(ids)
+                ids.append(doc_id)
+                lengths.append(self._lengths[number])
+        postings = {}
+        for term, (numbers, frequencies) in self._postings.items():
+            kept = [(renumber[n], f) for n, f in zip(numbers, frequencies) if n in renumber]
+            if kept:
+                postings[term] = (array("I", (n for n, _ in kept)), array("H", (f for _, f in kept)))
+        self._ids, self._lengths, self._postings, self._removed = ids, lengths, postings, 0
+        self._numbers = {doc_id: number for number, doc_id in enumerate(ids)}
+
+
+class Embedder:
+    """
+    Base class for the models that turn text into vectors.
+    """
+    name = "base"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class DefaultEmbedder(Embedder):
+    """
+    Chroma's bundled ONNX all-MiniLM-L6-v2. Matches the vectors already stored by earlier versions.
+    """
+    name = "default"
+
+    def __init__(self):
+        from chromadb.utils import embedding_functions
+        self.function = embedding_functions.DefaultEmbeddingFunction()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [list(map(float, vector)) for vector in self.function(texts)]
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """
+    Any sentence-transformers model, e.g. 'all-MiniLM-L6-v2' or 'all-mpnet-base-v2'.
+    """
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+        self.name = f"st-{model_name}"
+        self.model = SentenceTransformer(model_name)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, normalize_embeddings=True).tolist()
+
+
+class OllamaEmbedder(Embedder):
+    """
+    Embeddings served by the local Ollama instance, e.g. 'nomic-embed-text'.
+    """
+    def __init__(self, model_name: str = "nomic-embed-text", client=None):
+        from core.resources import get_ollama_client
+        self.name = f"ollama-{model_name}"
+        self.model_name = model_name
+        self.client = client or get_ollama_client()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embed(model=self.model_name, input=texts)
+        return [list(vector) for vector in response["embeddings"]]
+
+
+class HashEmbedder(Embedder):
+    """
+    Dependency-free stand-in that hashes words into a fixed-size vector.
+    Deterministic and fast, for tests and benchmarks; not a semantic model.
+    """
+    def __init__(self, dimensions: int = 256):
+        self.name = f"hash-{dimensions}"
+        self.dimensions = dimensions
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in normalize_text(text).split():
+                bucket = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:4], "little")
+                vector[bucket % self.dimensions] += 1.0
+            norm = sum(v * v for v in vector) ** 0.5 or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+
+def create_embedder(spec: str = None) -> Embedder:
+    """
+    Builds an embedder from a spec such as 'default', 'hash', 'sentence-transformers:all-MiniLM-L6-v2'
+    or 'ollama:nomic-embed-text'.
+    """
+    spec = spec or os.getenv("MEMORY_EMBEDDER", "default")
+    kind, _, model_name = spec.partition(":")
+
+    if kind == "default":
+        return DefaultEmbedder()
+    elif kind == "hash":
+        return HashEmbedder(int(model_name or 256))
+    elif kind == "sentence-transformers":
+        return SentenceTransformerEmbedder(model_name or "all-MiniLM-L6-v2")
+    elif kind == "ollama":
+        return OllamaEmbedder(model_name or "nomic-embed-text")
+    raise ValueError(f"Unknown embedder '{spec}'.")
+
+
+class CachedEmbedder(Embedder):
+    """
+    Wraps an embedder with an in-memory LRU and an optional SQLite cache on disk.
+    Entries are keyed by a hash of the normalized text, and misses are embedded in batches.
+    The disk cache keeps at most max_disk_entries rows, dropping the oldest first.
+    """
+    def __init__(self, embedder: Embedder, max_entries: int = 10000, cache_path: Optional[str] = None,
+                 batch_size: int = 64, max_disk_entries: int = None):
+        self.embedder = embedder
+        self.name = embedder.name
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        # 0 for no limit
+        self.max_disk_entries = (int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "200000")) if max_disk_entries is None
+                                 else max_disk_entries)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            # Rows on disk (an upper bound between prunes, since a replaced row is counted again)
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(set(keys))
+
+        # Embed each distinct missing text once, in vectorized chunks
+        missing = list(OrderedDict((key, text) for key, text in zip(keys, texts) if key not in found).items())
+        for i in range(0, len(missing), self.batch_size):
+            chunk = missing[i:i + self.batch_size]
+            vectors = self.embedder.embed([text for _, text in chunk])
+            new_entries = {key: vector for (key, _), vector in zip(chunk, vectors)}
+            self._store(new_entries)
+            found.update(new_entries)
+
+        with self._lock:
+            self.stats["misses"] += len(missing)
+        return [found[key] for key in keys]
+
+    def hit_rate(self) -> float:
+        """Share of lookups answered from the memory or disk cache."""
+        total = sum(self.stats.values())
+        return (self.stats["memory_hits"] + self.stats["disk_hits"]) / total if total else 0.0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: set) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+            self.stats["memory_hits"] += len(found)
+
+            remaining = [key for key in keys if key not in found]
+            if self._db is not None and remaining:
+                placeholders = ",".join("?" * len(remaining))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", remaining).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                    self._remember(key, found[key])
+                self.stats["disk_hits"] += len(rows)
+        return found
+
+    def _store(self, entries: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for key, vector in entries.items():
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                     [(key, array("f", vector).tobytes()) for key, vector in entries.items()])
+                self._disk_rows += len(entries)
+                if self.max_disk_entries and self._disk_rows > self.max_disk_entries:
+                    self._prune_disk()
+                self._db.commit()
+
+    def _prune_disk(self) -> None:
+        """
+        Deletes the oldest rows (a written row gets the highest rowid), down to 90% of max_disk_entries so that
+        pruning runs once per many inserts rather than on each.
+        """
+        keep = self.max_disk_entries - self.max_disk_entries // 10
+        self._db.execute("DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid DESC "
+                         "LIMIT -1 OFFSET ?)", (keep,))
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
 
 class Memory:
     """
     Manages the Long-Term Memory of the agent using ChromaDB (Vector Store).
+    A tenant's memories live in a collection of their own, so its searches never scan other tenants' data.
     """
-    def __init__(self, db_path: str = os.getenv("CHROMA_DB_PATH", "./data/chroma_db"), collection_name: str = "agent_memory"):
-        # Initialize the local ChromaDB client. Data is saved to the db_path folder.
-        self.client = chromadb.PersistentClient(path=db_path)
+    def __init__(self, db_path: str = os.getenv("CHROMA_DB_PATH", "./data/chroma_db"), collection_name: str = "agent_memory",
+                 embedder: Embedder = None, tenant: str = None):
+        # Reuse the process-wide ChromaDB client. Data is saved to the db_path folder.
+        self.client = get_chroma_client(db_path)
+        self.embedder = embedder or get_embedder()
+        self.tenant = tenant
+        if tenant:
+            collection_name = f"{collection_name}_t-{tenant_slug(tenant)}"
+
+        # Vectors of different models don't mix, so non-default embedders get their own collection
+        if self.embedder.name != DefaultEmbedder.name:
+            collection_name = f"{collection_name}_{re.sub(r'[^a-zA-Z0-9._-]', '-', self.embedder.name)}"
+
+        # Get or create a collection; we always pass our own vectors
+        self.collection = self.client.get_or_create_collection(name=collection_name, embedding_function=None)
+
+        # Keyword index next to the collection, built from it on first use
+        self.index = BM25Index()
+        self._index_built = False
+        self._index_lock = threading.Lock()
+        # The dense query is skipped when the best keyword match contains every query term and
+        # outscores the runner-up by this factor (0 always runs it)
+        self.lexical_margin = float(os.getenv("MEMORY_LEXICAL_MARGIN", "1.5"))
+        self.stats = {"searches": 0, "dense_queries": 0, "dense_skipped": 0, "deduplicated": 0}
 
-        # Get or create a collection
-        self.collection = self.client.get_or_create_collection(name=collection_name)
+        # A new memory this similar (cosine) to a stored one of the same user is a repeat
+        self.dedupe_threshold = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.95"))
+        # Compaction merges clusters of memories at least this similar, expires memories unused for ttl_days
+        # (0 keeps them) and evicts the least recently used beyond max_items (0 for no limit)
+        self.merge_threshold = float(os.getenv("MEMORY_MERGE_THRESHOLD", "0.9"))
+        self.ttl_days = float(os.getenv("MEMORY_TTL_DAYS", "0"))
+        self.max_items = int(os.getenv("MEMORY_MAX_ITEMS", "100000"))
+        # A tenant's quota; going over it schedules a compaction that evicts down to it
+        if tenant:
+            self.max_items = int(os.getenv("TENANT_MEMORY_QUOTA", "5000"))
+        # New memories between background compactions (0 only compacts on demand)
+        self.compact_every = int(os.getenv("MEMORY_COMPACT_EVERY", "500"))
+        self.last_compaction: Optional[Dict[str, Any]] = None
+        self._inserts_since_compaction = 0
+        self.compaction_job = None
+        self._compact_lock = threading.Lock()
+        # Last recall time per memory, written to the store at the next compaction
+        self._last_used: Dict[str, float] = {}
 
-    def add_memory(self, text: str, metadata: Dict[str, Any] = None) -> None:
+    def add_memory(self, text: str, metadata: Dict[str, Any] = None, user: str = None, source: str = "chat") -> bool:
         """
         Saves a new memory (fact, preference, etc.) into the vector database.
+        Returns False if it repeated a memory that was already stored.
         """
-        if metadata is None:
-            metadata = {}
+        return self.add_memories([text], [metadata] if metadata else None, user=user, source=source) > 0
 
-        # Generate a simple unique ID based on the current item count
-        memory_id = f"mem_{self.collection.count() + 1}"
+    def add_memories(self, texts: List[str], metadatas: List[Dict[str, Any]] = None, batch_size: int = 64,
+                     user: str = None, source: str = "chat", dedupe: bool = True) -> int:
+        """
+        Saves many memories at once, embedding them in vectorized chunks. Returns how many were new.
+        Each memory is stamped with its source, creation time and (if given) user, for filtered searches.
+        With dedupe, a memory repeating one of the same user (same text, or a cosine similarity of at least
+        dedupe_threshold) only bumps the stored memory's `seen` count.
+        """
+        if metadatas is None:
+            metadatas = [None] * len(texts)
+        now = time.time()
+        stamp = {"source": source, "created_at": now, "last_used": now, "seen": 1}
+        if user is not None:
+            stamp["user"] = user
+        index = self._index()
+        added = 0
 
-        # ChromaDB automatically handles embedding (converting text to vectors)
-        self.collection.add(
-            documents=[text],
-            metadatas=[metadata],
-            ids=[memory_id],
-        )
+        for i in range(0, len(texts), batch_size):
+            # Ids are content hashes, so a repeat (even from a concurrent writer) lands on the same id
+            batch = OrderedDict()
+            for text, metadata in zip(texts[i:i + batch_size], metadatas[i:i + batch_size]):
+                metadata = {**stamp, **(metadata or {})}
+                batch.setdefault(memory_id(text, metadata.get("user")), (text, metadata))
+            ids = list(batch)
+            repeats = self.collection.get(ids=ids, include=[])["ids"] if dedupe else []
+            stored = set(repeats)
+            new_ids = [doc_id for doc_id in ids if doc_id not in stored]
+            embeddings = self.embedder.embed([batch[doc_id][0] for doc_id in new_ids]) if new_ids else []
+
+            if dedupe and new_ids and self.collection.count():
+                similar = self._find_similar(embeddings, [batch[doc_id][1] for doc_id in new_ids])
+                repeats += [match for match in similar if match]
+                keep = [j for j, match in enumerate(similar) if match is None]
+                new_ids, embeddings = [new_ids[j] for j in keep], [embeddings[j] for j in keep]
+            if repeats:
+                self._bump(repeats)
+                self.stats["deduplicated"] += len(repeats)
+            if not new_ids:
+                continue
 
-    def search_memory(self, query: str, n_results: int = 3) -> List[str]:
+            self.collection.upsert(
+                documents=[batch[doc_id][0] for doc_id in new_ids],
+                embeddings=embeddings,
+                metadatas=[batch[doc_id][1] for doc_id in new_ids],
+                ids=new_ids,
+            )
+            for doc_id in new_ids:
+                index.add(doc_id, batch[doc_id][0])
+            added += len(new_ids)
+
+        self._inserts_since_compaction += added
+        if ((self.compact_every and self._inserts_since_compaction >= self.compact_every)
+                or (added and self.max_items and self.collection.count() > self.max_items)):
+            self.schedule_compaction()
+        return added
+
+    def search_memory(self, query: str, n_results: int = 3, user: str = None, source: str = None,
+                      since: float = None, until: float = None, max_distance: float = None) -> List[str]:
         """
         Searches the database for memories most relevant to the user's query.
+        Keyword (BM25) and vector matches are merged with reciprocal rank fusion; optional filters
+        restrict the search to a user, a source or a time range. With max_distance, vector matches
+        farther than that from the query are dropped (only keyword matches may remain).
         """
+        ids, documents, dense = self._search(query, n_results, user, source, since, until, max_distance)
+        self.stats["searches"] += 1
+        self.stats["dense_queries" if dense else "dense_skipped"] += 1
+        # Recently recalled memories are the last to be evicted
+        now = time.time()
+        for doc_id in ids:
+            self._last_used[doc_id] = now
+        return [documents[doc_id] for doc_id in ids]
+
+    def _search(self, query: str, n_results: int, user: str = None, source: str = None, since: float = None,
+                until: float = None, max_distance: float = None) -> Tuple[List[str], Dict[str, str], bool]:
+        """The ids of the best matches, their texts, and whether the dense query ran."""
         # If the database is empty, return an empty list immediately
-        if self.collection.count() == 0:
-            return []
+        count = self.collection.count()
+        if count == 0:
+            return [], {}, False
+
+        where = memory_filter(user, source, since, until)
+        # Filters drop candidates, so look further down both rankings
+        pool = n_results * (20 if where else 4)
+
+        lexical = self._index().search(query, pool)
+        documents = {}
+        if lexical:
+            # Filtering the few candidates here is much cheaper than a `where` over the whole collection
+            found = self.collection.get(ids=[doc_id for doc_id, _, _ in lexical], include=["documents", "metadatas"])
+            documents = {doc_id: text for doc_id, text, metadata in zip(found["ids"], found["documents"],
+                                                                         found["metadatas"])
+                         if metadata_matches(metadata, user, source, since, until)}
+            lexical = [match for match in lexical if match[0] in documents]
+
+        if self._lexical_is_confident(lexical):
+            return [doc_id for doc_id, _, _ in lexical[:n_results]], documents, False
 
         # Perform a similarity search
         results = self.collection.query(
-            query_texts=[query],
-            n_results=min(n_results, self.collection.count()),
+            query_embeddings=self.embedder.embed([query]),
+            n_results=min(pool, count),
+            where=where,
+            include=["documents", "distances"] if max_distance is not None else ["documents"],
         )
+        dense_ids = results["ids"][0] if results and results.get("ids") else []
+        documents.update(zip(dense_ids, results["documents"][0] if dense_ids else []))
+        if max_distance is not None and dense_ids:
+            dense_ids = [doc_id for doc_id, distance in zip(dense_ids, results["distances"][0])
+                         if distance <= max_distance]
+
+        ranking = reciprocal_rank_fusion([[doc_id for doc_id, _, _ in lexical], dense_ids])
+        return ranking[:n_results], documents, True
 
-        # Extract and return the matching text documents
-        if results and results.get('documents'):
-            return results['documents'][0]
-        return []
+    def _lexical_is_confident(self, lexical: List[Tuple[str, float, float]]) -> bool:
+        """Whether the best keyword match is clear enough to answer without the dense query."""
+        if not lexical or not self.lexical_margin or lexical[0][2] < 1.0:
+            return False
+        return len(lexical) == 1 or lexical[0][1] >= self.lexical_margin * lexical[1][1]
+
+    def _index(self) -> BM25Index:
+        """The keyword index, filled from the collection the first time it is needed."""
+        if self._index_built:
+            return self.index
+        with self._index_lock:
+            if not self._index_built:
+                offset, page = 0, 5000
+                while True:
+                    batch = self.collection.get(include=["documents"], limit=page, offset=offset)
+                    for doc_id, text in zip(batch["ids"], batch["documents"]):
+                        self.index.add(doc_id, text or "")
+                    if len(batch["ids"]) < page:
+                        break
+                    offset += page
+                self._index_built = True
+        return self.index
+
+    def warm(self) -> None:
+        """
+        Loads what the first search would otherwise wait for: the embedding model, the keyword index and
+        the collection's vector index.
+        """
+        vector = self.embedder.embed(["warmup"])
+        self._index()
+        if self.collection.count():
+            self.collection.query(query_embeddings=vector, n_results=1, include=[])
+
+    def release(self) -> None:
+        """
+        Called when an idle tenant is unloaded: persists the recall times and drops the keyword index,
+        which is rebuilt from the collection if the tenant comes back.
+        """
+        # A running compaction flushes them itself
+        if self._compact_lock.acquire(blocking=False):
+            try:
+                self._flush_last_used()
+            finally:
+                self._compact_lock.release()
+        with self._index_lock:
+            self.index, self._index_built = BM25Index(), False
 
     def get_all_memories(self) -> Dict[str, Any]:
         """
         Retrieves all stored memories.
         Useful for the 'Under the Hood' UI page to show what the bot knows.
         """
-        return self.collection.get()
\ No newline at end of file
+        return self.collection.get()
+
+    def browse(self, limit: int = 20, offset: int = 0, user: str = None, source: str = None,
+               contains: str = None) -> Dict[str, Any]:
+        """
+        One page of stored memories, optionally filtered by user, source and a substring of the text, without
+        loading the whole collection. `has_more` tells whether a next page exists.
+        """
+        page = self.collection.get(where=memory_filter(user, source), limit=limit + 1, offset=offset,
+                                   where_document={"$contains": contains} if contains else None,
+                                   include=["documents", "metadatas"])
+        return {"ids": page["ids"][:limit], "documents": page["documents"][:limit],
+                "metadatas": page["metadatas"][:limit], "offset": offset, "has_more": len(page["ids"]) > limit}
+
+    def _find_similar(self, embeddings: List[List[float]], metadatas: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """For each new memory, the id of a stored near-duplicate of the same user, or None."""
+        # One query per user, filtered to that user's memories, so other users' can't take the nearest slots.
+        # Memories without a user can't be filtered on (Chroma has no "field missing" clause) and are checked below
+        by_user: Dict[Optional[str], List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            by_user.setdefault(metadata.get("user"), []).append(i)
+        n_results = min(3, self.collection.count())
+        matches: List[Optional[str]] = [None] * len(embeddings)
+        for user, positions in by_user.items():
+            results = self.collection.query(query_embeddings=[embeddings[i] for i in positions], n_results=n_results,
+                                            where=memory_filter(user), include=["embeddings", "metadatas"])
+            for i, ids, vectors, stored in zip(positions, results["ids"], results["embeddings"],
+                                               results["metadatas"]):
+                matches[i] = next((doc_id for doc_id, other, other_metadata in zip(ids, vectors, stored)
+                                   if (other_metadata or {}).get("user") == user
+                                   and cosine_similarity(embeddings[i], other) >= self.dedupe_threshold), None)
+        return matches
+
+    def _bump(self, ids: List[str]) -> None:
+        """Records that these memories were saved again."""
+        found = self.collection.get(ids=list(dict.fromkeys(ids)), include=["metadatas"])
+        now = time.time()
+        metadatas = [{**(metadata or {}), "seen": (metadata or {}).get("seen", 1) + ids.count(doc_id), "last_used": now}
+                     for doc_id, metadata in zip(found["ids"], found["metadatas"])]
+        if found["ids"]:
+            self.collection.update(ids=found["ids"], metadatas=metadatas)
+
+    def schedule_compaction(self):
+        """Runs compact() on the background job queue, unless a compaction is already queued or running."""
+        from core.jobs import JobRejected
+        from core.resources import get_job_queue
+        if self.compaction_job is not None and not self.compaction_job.done:
+            return self.compaction_job
+        self._inserts_since_compaction = 0
+        try:
+            # Each tenant's compaction counts against its own per-owner job limit
+            owner = f"maintenance:{self.tenant}" if self.tenant else "maintenance"
+            self.compaction_job = get_job_queue().submit(owner, "memory_compaction",
+                                                          lambda job: self.compact(job.emit), "Memory compaction")
+        except JobRejected as e:
+            logger.warning("Memory compaction not scheduled: %s", e)
+            return None
+        return self.compaction_job
+
+    def compact(self, progress: Callable[[str, str], None] = None) -> Dict[str, Any]:
+        """
+        Merges clusters of near-duplicate memories of the same user into their most repeated member, expires
+        memories unused for ttl_days and evicts the least recently used beyond max_items.
+        Returns store size, duplicate ratio and query latency before and after.
+        """
+        def report(message: str) -> None:
+            logger.info("Memory compaction: %s", message)
+            if progress is not None:
+                progress("progress", message)
+
+        with self._compact_lock, tracer.span("memory.compact") as span:
+            start = time.perf_counter()
+            self._flush_last_used()
+            items, pairs = self._scan()
+            before = self._report(items, pairs)
+            report(f"{before['count']} memories, duplicate ratio {before['duplicate_ratio']:.1%}")
+
+            # Merge each cluster of near-duplicates into the member saved most often (then most recently used)
+            parent = {doc_id: doc_id for pair in pairs for doc_id in pair}
+
+            def root(doc_id: str) -> str:
+                while parent[doc_id] != doc_id:
+                    parent[doc_id] = parent[parent[doc_id]]
+                    doc_id = parent[doc_id]
+                return doc_id
+
+            for a, b in pairs:
+                parent[root(a)] = root(b)
+            clusters = defaultdict(list)
+            for doc_id in parent:
+                clusters[root(doc_id)].append(doc_id)
+
+            merged, updates = [], {}
+            for members in clusters.values():
+                members.sort(key=lambda doc_id: (items[doc_id].get("seen", 1), _recency(items[doc_id])),
+                             reverse=True)
+                keep, rest = members[0], members[1:]
+                updates[keep] = {**items[keep],
+                                 "seen": sum(items[doc_id].get("seen", 1) for doc_id in members),
+                                 "created_at": min(items[doc_id].get("created_at", time.time()) for doc_id in members),
+                                 "last_used": max(_recency(items[doc_id]) for doc_id in members)}
+                merged += rest
+            if updates:
+                self.collection.update(ids=list(updates), metadatas=list(updates.values()))
+            self._delete(merged)
+            report(f"merged {len(merged)} near-duplicates into {len(clusters)} memories")
+
+            merged_set = set(merged)
+            remaining = {doc_id: updates.get(doc_id, metadata) for doc_id, metadata in items.items()
+                         if doc_id not in merged_set}
+            expired = []
+            if self.ttl_days:
+                cutoff = time.time() - self.ttl_days * 86400
+                expired = [doc_id for doc_id, metadata in remaining.items() if _recency(metadata) < cutoff]
+            evicted = []
+            survivors = len(remaining) - len(expired)
+            if self.max_items and survivors > self.max_items:
+                expired_set = set(expired)
+                by_age = sorted((doc_id for doc_id in remaining if doc_id not in expired_set),
+                                key=lambda doc_id: _recency(remaining[doc_id]))
+                evicted = by_age[:survivors - self.max_items]
+            self._delete(expired + evicted)
+            report(f"expired {len(expired)}, evicted {len(evicted)} least recently used")
+
+            after = self._report(*self._scan())
+            result = {"before": before, "after": after, "merged": len(merged), "expired": len(expired),
+                      "evicted": len(evicted), "seconds": round(time.perf_counter() - start, 2),
+                      "finished_at": time.time()}
+            span.set(merged=len(merged), expired=len(expired), evicted=len(evicted))
+            self.last_compaction = result
+            return result
+
+    def _scan(self, page: int = 2000) -> Tuple[Dict[str, Dict[str, Any]], List[Tuple[str, str]]]:
+        """All memories' metadata, and the pairs of the same user at least merge_threshold similar."""
+        items, vectors = {}, {}
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["embeddings", "metadatas"], limit=page, offset=offset)
+            for doc_id, vector, metadata in zip(batch["ids"], batch["embeddings"], batch["metadatas"]):
+                items[doc_id], vectors[doc_id] = metadata or {}, vector
+            if len(batch["ids"]) < page:
+                break
+            offset += page
+
+        pairs = []
+        ids = list(vectors)
+        for i in range(0, len(ids), page):
+            chunk = ids[i:i + page]
+            results = self.collection.query(query_embeddings=[vectors[doc_id] for doc_id in chunk],
+                                            n_results=min(4, len(ids)), include=[])
+            for doc_id, neighbours in zip(chunk, results["ids"]):
+                for other in neighbours:
+                    if (other != doc_id and doc_id < other and other in items
+                            and items[other].get("user") == items[doc_id].get("user")
+                            and cosine_similarity(vectors[doc_id], vectors[other]) >= self.merge_threshold):
+                        pairs.append((doc_id, other))
+        return items, pairs
+
+    def _report(self, items: Dict[str, Dict[str, Any]], pairs: List[Tuple[str, str]],
+                samples: int = 20) -> Dict[str, Any]:
+        """Store size, share of memories with a near-duplicate, and search latency over stored texts."""
+        duplicates = {doc_id for pair in pairs for doc_id in pair}
+        ids = list(items)[::max(1, len(items) // samples)][:samples]
+        texts = self.collection.get(ids=ids, include=["documents"])["documents"] if ids else []
+        latencies = []
+        for text in texts:
+            start = time.perf_counter()
+            self._search(text or "", 3)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return {"count": len(items), "duplicate_ratio": round(len(duplicates) / len(items), 4) if items else 0.0,
+                "query_p50_ms": round(latencies[len(latencies) // 2], 2) if latencies else None}
+
+    def _delete(self, ids: List[str], batch_size: int = 5000) -> None:
+        for i in range(0, len(ids), batch_size):
+            self.collection.delete(ids=ids[i:i + batch_size])
+        for doc_id in ids:
+            self.index.remove(doc_id)
+            self._last_used.pop(doc_id, None)
+
+    def _flush_last_used(self) -> None:
+        """Writes the recall times collected by searches into the memories' metadata."""
+        last_used, self._last_used = self._last_used, {}
+        if not last_used:
+            return
+        found = self.collection.get(ids=list(last_used), include=["metadatas"])
+        if found["ids"]:
+            self.collection.update(ids=found["ids"], metadatas=[{**(metadata or {}), "last_used": last_used[doc_id]}
+                                                               for doc_id, metadata in zip(found["ids"],
+                                                                                           found["metadatas"])])
+
+
+def _recency(metadata: Dict[str, Any]) -> float:
+    """When a memory was last saved or recalled; memories from before these fields count as just used."""
+    return metadata.get("last_used") or metadata.get("created_at") or time.time()
@@ -0,0 +1,191 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from core.context import CHARS_PER_TOKEN, estimate_tokens
+from core.memory import BM25Index, cosine_similarity, reciprocal_rank_fusion
+
+# Tool outputs split into blocks (search results, passages, paragraphs), and long blocks into sentences
+BLOCK_SEPARATOR = re.compile(r"\n-{3,}\n|\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Citation or label a block starts with, e.g. "[p. 3]" from read_file, repeated on extracts of its sentences
+BLOCK_LABEL = re.compile(r"^\[[^\]\n]{1,40}\]")
+HANDLE_PATTERN = re.compile(r"\bobs-\d+\b")
+
+SCORERS = ("bm25", "embedding", "hybrid")
+
+
+def split_chunks(text: str, max_tokens: int) -> List[Tuple[int, str]]:
+    """
+    Splits a tool output into (block number, text) chunks: whole blocks when they are short, otherwise
+    their sentences.
+    """
+    chunks = []
+    for number, block in enumerate(part.strip() for part in BLOCK_SEPARATOR.split(text)):
+        # Separator lines left over between blank lines carry nothing
+        if not block.strip("-"):
+            continue
+        if estimate_tokens(block) <= max_tokens:
+            chunks.append((number, block))
+        else:
+            chunks.extend((number, sentence) for sentence in SENTENCE_END.split(block) if sentence.strip())
+    return chunks
+
+
+class ObservationCompressor:
+    """
+    Shrinks long tool outputs to the parts relevant to the question before they enter the context, where they
+    would be re-sent with every later step of the run. Chunks are ranked against the query (BM25, embeddings
+    or both) and kept, in their original order, up to the tool's token budget. The raw output stays available
+    by handle (see expand()).
+    """
+    def __init__(self, scorer: str = None, max_outputs: int = 32):
+        self.scorer = scorer or os.getenv("OBSERVATION_SCORER", "bm25")
+        if self.scorer not in SCORERS:
+            raise ValueError(f"Unknown observation scorer '{self.scorer}', expected one of {', '.join(SCORERS)}.")
+        # Raw outputs by handle, most recent last
+        self._outputs: "OrderedDict[str, str]" = OrderedDict()
+        self._max_outputs = max_outputs
+        self._counter = 0
+        # Tools of one step run concurrently
+        self._lock = threading.Lock()
+        self.counters = {"observations": 0, "compressed": 0, "expanded": 0, "raw_tokens": 0, "kept_tokens": 0}
+
+    def compress(self, observation: str, query: str, budget: int) -> str:
+        """
+        Returns the observation itself if it fits the budget (in tokens), otherwise an extract of its most
+        relevant chunks ending with the handle of the full output.
+        """
+        raw_tokens = estimate_tokens(observation)
+        if raw_tokens <= budget or observation.startswith("Error"):
+            self._count(raw_tokens, raw_tokens, compressed=False)
+            return observation
+
+        chunks = split_chunks(observation, max(16, budget // 4))
+        if not chunks:
+            # Only whitespace and separators: nothing to rank, and nothing worth the budget
+            truncated = observation[:budget * CHARS_PER_TOKEN]
+            self._count(raw_tokens, estimate_tokens(truncated), compressed=True)
+            return truncated
+        scores = self._scores(query, [text for _, text in chunks])
+        ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+
+        # A heading such as "Most relevant passages from '...':" says what the rest is
+        heading = {0} if chunks[0][1].endswith(":") and estimate_tokens(chunks[0][1]) <= budget // 4 else set()
+        kept, used = set(), sum(estimate_tokens(chunks[i][1]) for i in heading)
+        relevant_only = scores[ranked[0]] > 0
+        for i in ranked:
+            # Once something matched the query, the chunks that don't are left out rather than filling the budget
+            if relevant_only and scores[i] <= 0:
+                break
+            tokens = estimate_tokens(chunks[i][1])
+            if i not in heading and used + tokens <= budget:
+                kept.add(i)
+                used += tokens
+        if not kept:
+            # Not even the best chunk fits on its own
+            best = ranked[0]
+            chunks[best] = (chunks[best][0], chunks[best][1][:(budget - used) * CHARS_PER_TOKEN] + " ...")
+            kept.add(best)
+
+        handle = self._keep(observation)
+        extract = self._render(chunks, kept | heading)
+        kept_tokens = estimate_tokens(extract)
+        self._count(raw_tokens, kept_tokens, compressed=True)
+        return (f"{extract}\n[Extract: {len(kept)} of {len(chunks)} parts, ~{kept_tokens} of {raw_tokens} tokens. "
+                f"Full output: expand_observation {handle}]")
+
+    def expand(self, request: str, page_tokens: int) -> str:
+        """
+        Returns a page of a raw output, for a request such as 'obs-3' or 'obs-3 2' (page 2).
+        """
+        handle = HANDLE_PATTERN.search(request)
+        with self._lock:
+            raw = self._outputs.get(handle.group(0)) if handle else None
+        if raw is None:
+            known = ", ".join(self._outputs) or "none"
+            return f"Error: Unknown observation handle '{request.strip()}'. Known handles: {known}."
+
+        page_chars = max(1, page_tokens) * CHARS_PER_TOKEN
+        pages = max(1, -(-len(raw) // page_chars))
+        numbers = re.findall(r"\d+", request[handle.end():])
+        page = min(max(1, int(numbers[0])), pages) if numbers else 1
+        self._count(0, 0, compressed=False, expanded=True)
+        text = raw[(page - 1) * page_chars:page * page_chars]
+        more = f"\n[Next page: expand_observation {handle.group(0)} {page + 1}]" if page < pages else ""
+        return f"Full output of {handle.group(0)} (page {page} of {pages}):\n{text}{more}"
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Share of tool-output tokens kept out of the context, and how often the model asked for a full output.
+        """
+        c = self.counters
+        return {**c, "scorer": self.scorer,
+                "token_savings": round(1 - c["kept_tokens"] / c["raw_tokens"], 3) if c["raw_tokens"] else 0.0}
+
+    def _scores(self, query: str, texts: List[str]) -> List[float]:
+        """Relevance of each chunk to the query; higher is better (ranks, when two scorers are fused)."""
+        lexical = [0.0] * len(texts)
+        if self.scorer in ("bm25", "hybrid"):
+            index = BM25Index()
+            for i, text in enumerate(texts):
+                index.add(str(i), text)
+            for doc_id, score, _ in index.search(query, limit=len(texts)):
+                lexical[int(doc_id)] = score
+            if self.scorer == "bm25":
+                return lexical
+
+        from core.resources import get_embedder
+        vectors = get_embedder().embed([query] + texts)
+        dense = [cosine_similarity(vectors[0], vector) for vector in vectors[1:]]
+        if self.scorer == "embedding":
+            return dense
+
+        by_score = lambda scores: [str(i) for i in sorted(range(len(texts)), key=lambda i: -scores[i])]
+        fused = reciprocal_rank_fusion([by_score(lexical), by_score(dense)])
+        return [len(texts) - fused.index(str(i)) for i in range(len(texts))]
+
+    @staticmethod
+    def _render(chunks: List[Tuple[int, str]], kept: set) -> str:
+        """The kept chunks in their original order; sentences of a block stay together under its label."""
+        blocks: "OrderedDict[int, List[Tuple[str, bool]]]" = OrderedDict()
+        for i, (block, text) in enumerate(chunks):
+            blocks.setdefault(block, []).append((text, i in kept))
+
+        rendered = []
+        for parts in blocks.values():
+            if not any(keep for _, keep in parts):
+                continue
+            words = []
+            label = BLOCK_LABEL.match(parts[0][0])
+            if label and not parts[0][1]:
+                words.append(label.group(0))
+            for text, keep in parts:
+                # One ellipsis per run of dropped sentences
+                if keep:
+                    words.append(text)
+                elif not words or words[-1] != "...":
+                    words.append("...")
+            rendered.append(" ".join(words))
+        return "\n\n".join(rendered)
+
+    def _keep(self, observation: str) -> str:
+        with self._lock:
+            self._counter += 1
+            handle = f"obs-{self._counter}"
+            self._outputs[handle] = observation
+            while len(self._outputs) > self._max_outputs:
+                self._outputs.popitem(last=False)
+        return handle
+
+    def _count(self, raw_tokens: int, kept_tokens: int, compressed: bool, expanded: bool = False) -> None:
+        with self._lock:
+            if expanded:
+                self.counters["expanded"] += 1
+                return
+            self.counters["observations"] += 1
+            self.counters["compressed"] += compressed
+            self.counters["raw_tokens"] += raw_tokens
+            self.counters["kept_tokens"] += kept_tokens
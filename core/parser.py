@@ -0,0 +1,186 @@
+import json
+import re
+from typing import List, Optional, Tuple
+
+# A complete tool call: both lines present and the input line terminated by a newline
+ACTION_PATTERN = re.compile(r"Action:[ \t]*\S.*\n\s*Action Input:[ \t]*\S.*\n")
+ACTION_PAIR_PATTERN = re.compile(r"Action:[ \t]*(.+?)[ \t]*\n\s*Action Input:[ \t]*(.+)")
+FINAL_MARKER = "Final Answer:"
+OBSERVATION_MARKER = "Observation:"
+
+# Structured (JSON) steps: start of the answer string, and an "actions" list with at least one item
+JSON_ANSWER_PATTERN = re.compile(r'"final_answer"\s*:\s*"')
+JSON_ACTIONS_PATTERN = re.compile(r'"actions"\s*:\s*\[\s*[^\]\s]')
+JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class ReActStreamParser:
+    """
+    Incrementally parses a streamed ReAct completion.
+    Tells the caller when generation can be cut off and releases Final Answer text as it arrives.
+    """
+    def __init__(self, max_actions: int = 1):
+        self.max_actions = max_actions
+        self.text = ""
+        self.done = False
+        self.final_answer: Optional[str] = None
+        self._answer_start: Optional[int] = None
+        self._emitted = 0
+
+    @property
+    def answering(self) -> bool:
+        """True once the model has started writing a Final Answer."""
+        return self._answer_start is not None
+
+    def feed(self, token: str) -> str:
+        """
+        Adds a streamed token. Returns any new Final Answer text that is safe to show to the user.
+        """
+        self.text += token
+
+        if self._answer_start is None:
+            marker_index = self.text.find(FINAL_MARKER)
+            if marker_index == -1:
+                self._check_action_complete()
+                return ""
+            self._answer_start = marker_index + len(FINAL_MARKER)
+
+        return self._drain()
+
+    def finish(self) -> str:
+        """
+        Flushes the remaining Final Answer text once the stream has ended.
+        """
+        if self._answer_start is None:
+            return ""
+        tail = self._drain()
+        self.final_answer = self.text[self._answer_start:].strip()
+        return tail
+
+    def _check_action_complete(self) -> None:
+        """Stops generation after the allowed number of Action/Action Input pairs or a hallucinated Observation."""
+        observation_index = self.text.find(OBSERVATION_MARKER)
+        # An Observation after a complete tool call is the model inventing the tool output; drop it. Without a
+        # tool call before it, the model is restating an earlier observation and may still give a Final Answer
+        if observation_index != -1 and ACTION_PATTERN.search(self.text, 0, observation_index):
+            self.text = self.text[:observation_index]
+            self.done = True
+        elif len(ACTION_PATTERN.findall(self.text)) >= self.max_actions:
+            self.done = True
+
+    def _drain(self) -> str:
+        """Returns answer text not yet emitted, holding back trailing whitespace."""
+        answer = self.text[self._answer_start:]
+        if self._emitted == 0:
+            # Skip the whitespace right after the marker
+            stripped = answer.lstrip()
+            self._answer_start += len(answer) - len(stripped)
+            answer = stripped
+
+        # Trailing whitespace is only emitted once more text follows it
+        end = len(answer.rstrip())
+        chunk = answer[self._emitted:end]
+        self._emitted = max(self._emitted, end)
+        return chunk
+
+
+def parse_actions(text: str, max_actions: int = 1) -> List[Tuple[str, str]]:
+    """
+    Extracts the (action, action input) pairs requested in a ReAct step.
+    """
+    pairs = ACTION_PAIR_PATTERN.findall(text)
+    if not pairs:
+        # Tolerate models that put something between the two lines
+        action_match = re.search(r"Action:\s*(.+)", text)
+        input_match = re.search(r"Action Input:\s*(.+)", text)
+        if not (action_match and input_match):
+            return []
+        pairs = [(action_match.group(1), input_match.group(1))]
+
+    # Clean up the brackets copied from the format instructions
+    return [(action.strip().strip("[]"), action_input.strip().strip("[]"))
+            for action, action_input in pairs[:max_actions]]
+
+
+class JsonStepStreamer:
+    """
+    Incrementally reads a streamed structured (JSON) step.
+    Releases the "final_answer" string as it arrives, decoding JSON escapes on the fly,
+    unless the step requested tools first.
+    """
+    def __init__(self):
+        self.text = ""
+        self.emitted = False
+        self._position: Optional[int] = None
+        self._closed = False
+
+    @property
+    def answering(self) -> bool:
+        """True once the model has started writing a final answer (with no tools requested)."""
+        return self._position is not None
+
+    def feed(self, token: str) -> str:
+        """
+        Adds a streamed token. Returns any new Final Answer text.
+        """
+        self.text += token
+        if self._closed:
+            return ""
+
+        if self._position is None:
+            match = JSON_ANSWER_PATTERN.search(self.text)
+            if match is None:
+                return ""
+            # An answer written next to tool calls is not shown; the tools run instead
+            if JSON_ACTIONS_PATTERN.search(self.text, 0, match.start()):
+                self._closed = True
+                return ""
+            self._position = match.end()
+
+        chunk, index, text = [], self._position, self.text
+        while index < len(text):
+            char = text[index]
+            if char == '"':
+                self._closed = True
+                break
+            if char != "\\":
+                chunk.append(char)
+                index += 1
+                continue
+
+            # Hold back escape sequences until they are complete
+            if index + 1 >= len(text) or (text[index + 1] == "u" and index + 6 > len(text)):
+                break
+            if text[index + 1] == "u":
+                try:
+                    chunk.append(chr(int(text[index + 2:index + 6], 16)))
+                except ValueError:
+                    pass
+                index += 6
+            else:
+                chunk.append(JSON_ESCAPES.get(text[index + 1], text[index + 1]))
+                index += 2
+
+        self._position = index
+        self.emitted = self.emitted or bool(chunk)
+        return "".join(chunk)
+
+
+def parse_json_step(text: str, max_actions: int = 1) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+    """
+    Reads a structured step: returns (final answer, []) or (None, actions).
+    Raises ValueError if the text is not a JSON object with either of them.
+    """
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+
+    actions = [(str(action.get("tool", "")).strip(), str(action.get("input", "")).strip())
+               for action in data.get("actions") or [] if isinstance(action, dict)]
+    if actions:
+        return None, actions[:max_actions]
+
+    answer = data.get("final_answer")
+    if isinstance(answer, str) and answer.strip():
+        return answer.strip(), []
+    raise ValueError("neither actions nor a final answer")
@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+# Process-wide registry of heavy objects shared by every session (Streamlit reruns, pages, workers)
+_resources: Dict[str, Any] = {}
+_build_stats: Dict[str, Dict[str, Any]] = {}
+_lock = threading.RLock()
+
+# Per-tenant objects, least recently used first; idle tenants are evicted beyond TENANT_CACHE_SIZE
+_tenant_resources: "OrderedDict[tuple, Any]" = OrderedDict()
+_tenant_stats = {"loaded": 0, "evicted": 0, "hits": 0}
+# Tenants being built; other callers asking for the same one wait on its future instead of building it again
+_tenant_building: Dict[tuple, Future] = {}
+
+
+def current_rss_mb() -> Optional[float]:
+    """
+    Returns the resident memory of this process in MB, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def measure(factory: Callable[[], Any]) -> Dict[str, Any]:
+    """
+    Builds an object and reports how long it took and how much resident memory it added.
+    """
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    value = factory()
+    rss_after = current_rss_mb()
+
+    return {
+        "value": value,
+        "seconds": round(time.perf_counter() - start, 3),
+        "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+    }
+
+
+def shared(key: str, factory: Callable[[], Any]) -> Any:
+    """
+    Returns the shared instance registered under key, building it on first use.
+    """
+    resource = _resources.get(key)
+    if resource is not None:
+        return resource
+
+    with _lock:
+        # Another thread may have built it while we were waiting
+        if key not in _resources:
+            result = measure(factory)
+            _resources[key] = result.pop("value")
+            _build_stats[key] = result
+        return _resources[key]
+
+
+def tenant_shared(key: str, tenant: str, factory: Callable[[], Any],
+                  on_evict: Callable[[Any], None] = None) -> Any:
+    """
+    Returns the instance registered under key for one tenant, building it on first use.
+    Only the TENANT_CACHE_SIZE most recently used tenants stay loaded; on_evict releases an idle one.
+    """
+    slot = (key, tenant)
+    with _lock:
+        resource = _tenant_resources.get(slot)
+        if resource is not None:
+            _tenant_resources.move_to_end(slot)
+            _tenant_stats["hits"] += 1
+            return resource
+
+        building = _tenant_building.get(slot)
+        if building is None:
+            building = _tenant_building[slot] = Future()
+            builder = True
+        else:
+            builder = False
+    if not builder:
+        return building.result()
+
+    # Built outside the lock (a cold tenant may rebuild its keyword index), so loaded tenants are served meanwhile
+    try:
+        resource = factory()
+    except BaseException as e:
+        with _lock:
+            del _tenant_building[slot]
+        building.set_exception(e)
+        raise
+
+    with _lock:
+        del _tenant_building[slot]
+        _tenant_resources[slot] = resource
+        _tenant_stats["loaded"] += 1
+        evicted = []
+        while len(_tenant_resources) > int(os.getenv("TENANT_CACHE_SIZE", "32")):
+            evicted.append(_tenant_resources.popitem(last=False)[1])
+            _tenant_stats["evicted"] += 1
+
+    building.set_result(resource)
+    for idle in evicted:
+        if on_evict is not None:
+            on_evict(idle)
+    return resource
+
+
+def tenant_stats() -> Dict[str, Any]:
+    """
+    How many tenants are loaded, and how often they were reused, loaded and evicted.
+    """
+    with _lock:
+        return {"resident": len(_tenant_resources), **_tenant_stats}
+
+
+def resource_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Cold-start cost of every shared resource built so far.
+    """
+    with _lock:
+        return {key: dict(stats) for key, stats in _build_stats.items()}
+
+
+def get_ollama_client():
+    """One HTTP client (and connection pool) to the Ollama server per process."""
+    import ollama
+    host = os.getenv("OLLAMA_HOST")
+    return shared(f"ollama:{host}", lambda: ollama.Client(host=host))
+
+
+def get_chroma_client(db_path: str = None):
+    """
+    One persistent Chroma client per database folder. With CHROMA_MEMORY_LIMIT_MB set, Chroma keeps the
+    vector indexes of the most recently used collections (tenants) in memory and unloads the others.
+    """
+    import chromadb
+    from chromadb.config import Settings
+    db_path = db_path or os.getenv("CHROMA_DB_PATH", "./data/chroma_db")
+    settings = Settings()
+    memory_limit_mb = int(os.getenv("CHROMA_MEMORY_LIMIT_MB", "0"))
+    if memory_limit_mb:
+        settings = Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=memory_limit_mb * 1024 * 1024)
+    return shared(f"chroma:{db_path}", lambda: chromadb.PersistentClient(path=db_path, settings=settings))
+
+
+def get_embedder():
+    """One cached embedding model per process (MEMORY_EMBEDDER picks the backend)."""
+    from core.memory import CachedEmbedder, create_embedder
+    cache_path = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite")
+    return shared("embedder", lambda: CachedEmbedder(create_embedder(), cache_path=cache_path))
+
+
+def tenant_for(user_name: str) -> Optional[str]:
+    """The tenant a user's memory and tasks are scoped to, or None to share them (TENANT_ISOLATION=0)."""
+    if os.getenv("TENANT_ISOLATION", "1") == "0":
+        return None
+    return (user_name or "").strip() or None
+
+
+def get_memory(tenant: str = None):
+    """
+    The long-term memory store of a tenant (user), in its own collection and keyword index.
+    Without a tenant, the store shared by all sessions.
+    """
+    from core.memory import Memory
+    if not tenant:
+        return shared("memory", Memory)
+    return tenant_shared("memory", tenant, lambda: Memory(tenant=tenant), on_evict=Memory.release)
+
+
+def get_todo_manager():
+    """The task list shared by all sessions; tenants see their own tasks through the owner column."""
+    from tools.todo import TodoManager
+    return shared("todo_manager", TodoManager)
+
+
+def get_search_tool():
+    """The web search tool shared by all sessions."""
+    from tools.search import SearchTool
+    return shared("search_tool", SearchTool)
+
+
+def get_document_reader():
+    """The document reader shared by all sessions."""
+    from tools.reader import DocumentReader
+    return shared("document_reader", DocumentReader)
+
+
+def get_response_cache():
+    """The LLM response cache shared by all sessions, or None if RESPONSE_CACHE=0."""
+    from core.brain import ResponseCache
+    if os.getenv("RESPONSE_CACHE", "1") == "0":
+        return None
+    return shared("response_cache", lambda: ResponseCache(
+        path=os.getenv("RESPONSE_CACHE_PATH", "./data/response_cache.sqlite"),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+        similarity=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0")),
+    ))
+
+
+def get_job_queue():
+    """The background worker pool for agent runs and long tool calls, shared by all sessions."""
+    from core.jobs import JobQueue
+    return shared("job_queue", lambda: JobQueue(
+        max_workers=int(os.getenv("JOB_WORKERS", "4")),
+        max_queued=int(os.getenv("JOB_QUEUE_SIZE", "32")),
+        per_user=int(os.getenv("JOB_PER_USER", "2")),
+    ))
+
+
+def start_warmup(model_name: str, draft_model: str = None, tenant: str = None):
+    """
+    Starts the background warmup of the model, memory and tools once per process, and returns it for its
+    readiness status (None if WARMUP=0, in which case everything loads on first use).
+    """
+    from core.warmup import Warmup
+    if os.getenv("WARMUP", "1") == "0":
+        return None
+    return shared("warmup", lambda: Warmup(model_name, draft_model or None, tenant).start())
@@ -0,0 +1,102 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple, Any
+
+# One event loop and one worker pool per process, shared by every agent. A tool that timed out keeps its
+# worker until it returns, so tools get a pool of their own
+_loop = None
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
+_loop_lock = threading.Lock()
+
+# Startup stages of a run (memory lookup, prefix prefill) never queue behind tool calls
+_stage_executor = ThreadPoolExecutor(max_workers=int(os.getenv("PIPELINE_WORKERS", "4")), thread_name_prefix="stage")
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Starts the background event loop on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="tool-runtime", daemon=True).start()
+        return _loop
+
+
+def submit(fn: Callable[..., Any], *args) -> Future:
+    """
+    Runs a startup stage fn(*args) on the stage pool, in a copy of the caller's context (so its spans nest under
+    the caller's), e.g. to overlap independent work before a model call.
+    """
+    return _stage_executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def submit_tool(fn: Callable[..., Any], *args) -> Future:
+    """Like submit(), for a tool call started outside of a batch (e.g. prefetched): it runs on the tool pool."""
+    return _executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class ToolRuntime:
+    """
+    Executes a batch of tool calls requested in a single ReAct step.
+    Read-only tools run concurrently; a tool with side effects runs once the tools requested before it have
+    finished, and the ones after it wait for it (so e.g. a save_memory is visible to a later search_memory).
+    """
+    def __init__(self, execute: Callable[[str, str], str], specs: Dict[str, Dict[str, Any]],
+                 default_timeout: float = 30.0):
+        self.execute = execute
+        self.specs = specs
+        self.default_timeout = default_timeout
+        self._future = None
+
+    def run_batch(self, actions: List[Tuple[str, str]]) -> List[str]:
+        """
+        Runs the actions and returns their observations in the same order.
+        """
+        # Tools run on other threads; hand them the caller's context so their spans nest under this step
+        context = contextvars.copy_context()
+        self._future = asyncio.run_coroutine_threadsafe(self._run_batch(actions, context), _get_loop())
+        try:
+            return self._future.result()
+        except CancelledError:
+            return [f"Error executing '{action}': cancelled." for action, _ in actions]
+        finally:
+            self._future = None
+
+    def cancel(self) -> None:
+        """
+        Cancels the batch that is currently running, if any.
+        Tools already running in a worker thread finish in the background; their results are dropped.
+        """
+        if self._future is not None:
+            self._future.cancel()
+
+    async def _run_batch(self, actions: List[Tuple[str, str]], context: contextvars.Context) -> List[str]:
+        results = [""] * len(actions)
+
+        async def run_single(index: int) -> None:
+            results[index] = await self._run_tool(*actions[index], context)
+
+        # Runs of consecutive read-only tools go together; each side-effect tool is a barrier between them
+        group: List[int] = []
+        for index, (action, _) in enumerate(actions):
+            if self.specs.get(action, {}).get("concurrent"):
+                group.append(index)
+                continue
+            await asyncio.gather(*(run_single(i) for i in group))
+            group = []
+            await run_single(index)
+        await asyncio.gather(*(run_single(i) for i in group))
+        return results
+
+    async def _run_tool(self, action: str, action_input: str, context: contextvars.Context) -> str:
+        timeout = self.specs.get(action, {}).get("timeout", self.default_timeout)
+        loop = asyncio.get_running_loop()
+        try:
+            # Each tool gets its own copy, since one context can't be entered by two threads at once
+            call = loop.run_in_executor(_executor, context.copy().run, self.execute, action, action_input)
+            return await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            return f"Error executing '{action}': timed out after {timeout:g}s."
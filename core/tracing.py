@@ -0,0 +1,213 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+logger = logging.getLogger("openclaw")
+
+
+def configure_logging(log_dir: str = None) -> None:
+    """
+    Sends warnings and errors of the agent to logs/agent.log (once per process).
+    """
+    if logger.handlers:
+        return
+    log_dir = log_dir or os.getenv("LOG_DIR", "./logs")
+    os.makedirs(log_dir, exist_ok=True)
+    handler = logging.FileHandler(os.path.join(log_dir, "agent.log"), encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+class Span:
+    """
+    One timed operation of a run (the run itself, an iteration, an LLM call, a tool call).
+    """
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = 0.0
+
+    def set(self, **attrs) -> None:
+        """Adds attributes discovered while the span is running."""
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "start": self.start, "duration_ms": round(self.duration * 1000, 2),
+                **self.attrs}
+
+
+class Metrics:
+    """
+    Latency histograms per span name and token counters, rendered in the Prometheus text format.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0})
+        self._counters: Dict[tuple, float] = defaultdict(float)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms[name]
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+
+    def increment(self, name: str, value: float = 1.0, **labels) -> None:
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def render(self) -> str:
+        lines = ["# TYPE openclaw_span_duration_seconds histogram"]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(BUCKETS, histogram["buckets"]):
+                    lines.append(f'openclaw_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'openclaw_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'openclaw_span_duration_seconds_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+                lines.append(f'openclaw_span_duration_seconds_count{{span="{name}"}} {histogram["count"]}')
+            for (name, labels), value in sorted(self._counters.items()):
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"openclaw_{name}{{{label_text}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """
+    Records nested spans, appends them as JSON lines to logs/traces.jsonl and keeps the recent ones in memory.
+    The file rolls over at max_mb (to traces.jsonl.1, .2, ...), keeping the last `backups` files.
+    """
+    def __init__(self, path: str = None, keep: int = 5000, max_mb: float = None, backups: int = None):
+        self.path = path or os.getenv("TRACE_LOG_PATH", "./logs/traces.jsonl")
+        max_mb = max_mb if max_mb is not None else float(os.getenv("TRACE_LOG_MAX_MB", "50"))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.backups = backups if backups is not None else int(os.getenv("TRACE_LOG_BACKUPS", "3"))
+        self.metrics = Metrics()
+        self._recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._file = None
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        """
+        Times the enclosed block as a child of the current span.
+        """
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else uuid.uuid4().hex[:16], parent.span_id if parent else None,
+                    attrs)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.set(error=repr(e))
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # A generator holding the span was finished from another context
+                pass
+            self._finish(span)
+
+    def current(self) -> Optional[Span]:
+        """The innermost running span of this context, if any."""
+        return _current_span.get()
+
+    def trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """All recent spans of one trace, in the order they finished."""
+        with self._lock:
+            return [span for span in self._recent if span["trace_id"] == trace_id]
+
+    def _finish(self, span: Span) -> None:
+        record = span.to_dict()
+        self.metrics.observe(span.name, span.duration)
+        with self._lock:
+            self._recent.append(record)
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+                self._file.write(json.dumps(record, default=str) + "\n")
+                if self.max_bytes and self._file.tell() >= self.max_bytes:
+                    self._rollover()
+            except OSError as e:
+                logger.warning("Could not write trace: %s", e)
+
+    def _rollover(self) -> None:
+        """Moves the full trace file to .1 (shifting older ones up, dropping the oldest); the next span starts anew."""
+        self._file.close()
+        self._file = None
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+tracer = Tracer()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = tracer.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of stderr
+        pass
+
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = None) -> bool:
+    """
+    Serves /metrics for Prometheus if METRICS_PORT (or port) is set. Safe to call on every rerun.
+    """
+    global _metrics_server
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return False
+
+    with _metrics_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                logger.warning("Metrics endpoint not started on port %s: %s", port, e)
+                return False
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+    return True
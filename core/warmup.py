@@ -0,0 +1,96 @@
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from core.tracing import logger, tracer
+
+STAGES = ("model", "memory", "tools")
+
+
+class Warmup:
+    """
+    Boots the heavy backends in the background, so the UI can render while they load: checks that the model is
+    available and loads it into Ollama, primes the embedding model and the memory indexes, and imports and
+    builds the tools. Each stage records its status and duration; `ready` is set once all of them finished.
+    """
+    def __init__(self, model_name: str, draft_model: str = None, tenant: str = None):
+        self.model_name = model_name
+        self.draft_model = draft_model
+        self.tenant = tenant
+        self.stages: Dict[str, Dict[str, Any]] = {name: {"status": "pending", "seconds": None, "error": None}
+                                                  for name in STAGES}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._ready = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def healthy(self) -> bool:
+        """Finished without errors (e.g. Ollama reachable and the model pulled)."""
+        return self.ready and all(stage["status"] == "ok" for stage in self.stages.values())
+
+    def wait(self, timeout: float = None) -> bool:
+        """Blocks until every stage finished; returns whether it did within the timeout."""
+        return self._ready.wait(timeout)
+
+    def start(self) -> "Warmup":
+        self.started_at = time.time()
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+        return self
+
+    def status(self) -> Dict[str, Any]:
+        """Overall state ("warming", "ready" or "degraded"), per-stage results and total boot time."""
+        state = "warming" if not self.ready else "ready" if self.healthy else "degraded"
+        end = self.finished_at or time.time()
+        return {"state": state, "model": self.model_name, "stages": {name: dict(stage) for name, stage in
+                                                                    self.stages.items()},
+                "seconds": round(end - self.started_at, 3) if self.started_at else None}
+
+    def _run(self) -> None:
+        with tracer.span("warmup", model=self.model_name):
+            # Loading the model is waiting on Ollama, so it runs alongside the imports of the other stages
+            model = threading.Thread(target=contextvars.copy_context().run,
+                                     args=(self._stage, "model", self._warm_model), name="warmup-model", daemon=True)
+            model.start()
+            self._stage("memory", self._warm_memory)
+            self._stage("tools", self._warm_tools)
+            model.join()
+        self.finished_at = time.time()
+        self._ready.set()
+
+    def _stage(self, name: str, step: Callable[[], None]) -> None:
+        """Runs one stage, recording its status, error and duration."""
+        stage = self.stages[name]
+        stage["status"] = "running"
+        start = time.perf_counter()
+        with tracer.span(f"warmup.{name}") as span:
+            try:
+                step()
+                stage["status"] = "ok"
+            except Exception as e:
+                logger.warning("Warmup of %s failed: %s", name, e)
+                stage["status"], stage["error"] = "error", str(e)
+                span.set(error=str(e)[:200])
+        stage["seconds"] = round(time.perf_counter() - start, 3)
+
+    def _warm_model(self) -> None:
+        from core.brain import Brain
+        brain = Brain(model_name=self.model_name)
+        if not brain.check_connection():
+            raise RuntimeError(f"Model '{self.model_name}' is not available. Is Ollama running and the model pulled?")
+        # Loads the weights and keeps them loaded for OLLAMA_KEEP_ALIVE
+        brain.preload([model for model in (self.model_name, self.draft_model) if model], wait=True)
+
+    def _warm_memory(self) -> None:
+        from core.resources import get_memory
+        get_memory(self.tenant).warm()
+
+    def _warm_tools(self) -> None:
+        from core.resources import get_document_reader, get_search_tool, get_todo_manager
+        get_search_tool()
+        get_todo_manager()
+        get_document_reader()
@@ -1,6 +1,9 @@
+import os
+
 import streamlit as st
-from core.memory import Memory
-from tools.todo import TodoManager
+from core.resources import (get_memory, get_todo_manager, get_search_tool, get_response_cache, get_job_queue,
+                            resource_stats, tenant_stats, start_warmup, current_rss_mb)
+from core.tracing import tracer
 
 # 1. Page Configuration
 st.set_page_config(
@@ -9,21 +12,46 @@ st.set_page_config(
     layout="wide"
 )
 
+# Rows per page of the memory and task tables, and history messages shown before "show all"
+PAGE_SIZE = int(os.getenv("INSPECTOR_PAGE_SIZE", "50"))
+HISTORY_WINDOW = int(os.getenv("CHAT_WINDOW", "20"))
+
+
+def turn_page(key: str, step: int = None) -> None:
+    """Moves a paged view forward or back (or, without a step, back to its first page)."""
+    st.session_state[key] = 0 if step is None else max(0, st.session_state.get(key, 0) + step)
+
+
+def page_buttons(key: str, page: int, has_more: bool, caption: str) -> None:
+    prev_col, page_col, next_col = st.columns([1, 4, 1])
+    prev_col.button("◀ Previous", key=f"{key}_prev", disabled=page == 0, on_click=turn_page, args=(key, -1))
+    page_col.caption(caption)
+    next_col.button("Next ▶", key=f"{key}_next", disabled=not has_more, on_click=turn_page, args=(key, 1))
+
+
 st.title("🔍 Under the Hood")
 st.write("Inspect the agent's internal state, including its long-term vector memory and persistent task list.")
 
-# Initialize the components to read the data
-# We don't need the LLM here, just the storage managers
-memory = Memory()
-todo_manager = TodoManager()
+# Reuse the process-wide storage managers instead of opening new ones on every rerun
+# We don't need the LLM here, just the storage managers, scoped to the chat's current user
+tenant = getattr(st.session_state.get("agent"), "tenant", None)
+memory = get_memory(tenant)
+todo_manager = get_todo_manager()
+st.caption(f"👤 Showing the memory and tasks of **{tenant}**." if tenant else
+           "👤 Showing the shared memory and tasks.")
 
 st.header("⚙️ Working Memory (Context Window)")
 st.write("Raw messages currently stored in the agent's short-term memory (Session State).")
 
 # Display the raw chat history if it exists
 if "agent_history" in st.session_state and st.session_state.agent_history:
+    history = st.session_state.agent_history
+    # Long conversations show their latest messages unless asked for all of them
+    if len(history) > HISTORY_WINDOW and not st.toggle(f"Show all {len(history)} messages"):
+        st.caption(f"Latest {HISTORY_WINDOW} of {len(history)} messages.")
+        history = history[-HISTORY_WINDOW:]
     # st.json automatically formats dictionaries into a nice, readable block
-    st.json(st.session_state.agent_history)
+    st.json(history)
 else:
     st.info("The short-term memory is empty. Start a conversation in the chat!")
 
@@ -31,47 +59,247 @@ else:
 st.divider()
 st.header("🧠 Long-Term Memory (ChromaDB)")
 st.write("Facts and details the agent has learned about you across sessions.")
+memory_count = memory.collection.count()
+if memory.max_items:
+    st.progress(min(1.0, memory_count / memory.max_items), text=f"{memory_count} of {memory.max_items} memories")
+
+# Hybrid retrieval: how often the keyword index answered without a vector query
+st.caption(f"Searches: {memory.stats['searches']} · vector queries: {memory.stats['dense_queries']} · "
+           f"answered by keywords alone: {memory.stats['dense_skipped']}")
+
+# Maintenance: near-duplicates are merged and stale memories expired on the background job queue
+maintenance_col, report_col = st.columns([1, 3])
+with maintenance_col:
+    if st.button("🧹 Compact memory"):
+        if memory.schedule_compaction() is None:
+            st.warning("The job queue is busy, try again shortly.")
+with report_col:
+    if memory.last_compaction:
+        st.json(memory.last_compaction, expanded=False)
+    elif memory.compaction_job is not None and not memory.compaction_job.done:
+        st.caption("⏳ Compaction running...")
+
+
+@st.fragment
+def show_memory_inspector():
+    """
+    Pages through the stored memories with filters, reading one page per rerun (of this section only)
+    instead of the whole collection.
+    """
+    user_col, source_col, text_col = st.columns(3)
+    reset = {"on_change": turn_page, "args": ("memory_page", None)}
+    user = user_col.text_input("User", key="memory_user", **reset).strip() or None
+    source = source_col.text_input("Source", key="memory_source", placeholder="e.g. chat", **reset).strip() or None
+    contains = text_col.text_input("Text contains", key="memory_contains", **reset).strip() or None
+
+    page = st.session_state.get("memory_page", 0)
+    memories_data = memory.browse(limit=PAGE_SIZE, offset=page * PAGE_SIZE, user=user, source=source,
+                                  contains=contains)
+
+    if memories_data['documents']:
+        formatted_memory = []
+        for i in range(len(memories_data['ids'])):
+            formatted_memory.append({
+                "ID": memories_data['ids'][i],
+                "Memory Content": memories_data['documents'][i],
+                "Metadata": memories_data['metadatas'][i]
+            })
+
+        # Display as an interactive dataframe
+        st.dataframe(formatted_memory, use_container_width=True)
+        first = page * PAGE_SIZE + 1
+        page_buttons("memory_page", page, memories_data['has_more'],
+                     f"Memories {first}-{first + len(formatted_memory) - 1}")
+    elif page > 0:
+        st.info("No more memories.")
+        page_buttons("memory_page", page, False, "")
+    elif user or source or contains:
+        st.info("No memories match these filters.")
+    else:
+        st.info("The agent's memory is currently empty. Ask it to 'remember' something in the chat!")
 
-# Fetch all data from ChromaDB
-memories_data = memory.get_all_memories()
-
-# Check if the database has any documents stored
-if memories_data and memories_data.get('documents') and len(memories_data['documents']) > 0:
-    formatted_memory = []
-    for i in range(len(memories_data['ids'])):
-        formatted_memory.append({
-            "ID": memories_data['ids'][i],
-            "Memory Content": memories_data['documents'][i],
-            "Metadata": memories_data['metadatas'][i]
-        })
-
-    # Display as an interactive dataframe
-    st.dataframe(formatted_memory, use_container_width=True)
-else:
-    st.info("The agent's memory is currently empty. Ask it to 'remember' something in the chat!")
+
+show_memory_inspector()
 
 # 3. To-Do List Section
 st.divider()
-st.header("✅ Persistent To-Do List (JSON)")
-st.write("Tasks managed by the agent, saved in a local JSON file.")
+st.header("✅ Persistent To-Do List (SQLite)")
+st.write("Tasks managed by the agent, saved in a local SQLite database.")
 
-# Fetch tasks from the JSON file
-tasks = todo_manager.get_tasks()
 
-if tasks:
-    st.dataframe(tasks, use_container_width=True)
-else:
-    st.info("The to-do list is empty. Ask the agent to 'add a task' in the chat!")
+@st.fragment
+def show_tasks():
+    """One page of the task table at a time (each page cached until the database changes)."""
+    total = todo_manager.count_tasks(owner=tenant)
+    page = min(st.session_state.get("tasks_page", 0), max(0, -(-total // PAGE_SIZE) - 1))
+    tasks = todo_manager.get_tasks(owner=tenant, limit=PAGE_SIZE, offset=page * PAGE_SIZE)
+
+    if tasks:
+        st.dataframe(tasks, use_container_width=True)
+        if total > PAGE_SIZE:
+            page_buttons("tasks_page", page, (page + 1) * PAGE_SIZE < total,
+                         f"Tasks {page * PAGE_SIZE + 1}-{page * PAGE_SIZE + len(tasks)} of {total}")
+    else:
+        st.info("The to-do list is empty. Ask the agent to 'add a task' in the chat!")
+
+
+show_tasks()
 
 # 4. Internal Monologue
 st.divider()
 st.header("💭 Internal Monologue")
 st.write("A log showing the agent's step-by-step 'Thought process' for the LAST query.")
 
-if "agent" in st.session_state and hasattr(st.session_state.agent, 'latest_monologue') and st.session_state.agent.latest_monologue:
-    # Print each step of the monologue
-    for step in st.session_state.agent.latest_monologue:
-        with st.container(border=True):
-            st.markdown(step)
+
+@st.fragment(run_every=1.0)
+def show_monologue():
+    """Re-reads the monologue every second, so a run on a background worker shows up step by step."""
+    if "agent" in st.session_state and hasattr(st.session_state.agent, 'latest_monologue') and st.session_state.agent.latest_monologue:
+        job = get_job_queue().get(st.session_state.get("active_job") or "")
+        if job is not None and not job.done:
+            st.caption(f"⏳ Run {job.status}...")
+        # Print each step of the monologue
+        for step in list(st.session_state.agent.latest_monologue):
+            with st.container(border=True):
+                st.markdown(step)
+    else:
+        st.info("No internal monologue recorded yet. Ask the agent a complex question that requires tools!")
+
+
+show_monologue()
+
+# 5. Streaming Metrics
+st.divider()
+st.header("⏱️ Step Metrics")
+st.write("Time-to-first-token and tokens generated for each LLM step of the LAST query, and how its start "
+         "was spent (memory lookup, prefix prefill, prefetched tools).")
+
+if "agent" in st.session_state and getattr(st.session_state.agent, 'latest_metrics', None):
+    st.dataframe(st.session_state.agent.latest_metrics, use_container_width=True)
+    st.json(st.session_state.agent.latest_startup)
+else:
+    st.info("No metrics recorded yet. Ask the agent something in the chat!")
+
+# 6. Context Window
+st.divider()
+st.header("📐 Context Window")
+st.write("Prefix reuse between prompts, Ollama prompt-cache hit rate, tool output compression, and the rolling "
+         "summary of compacted turns.")
+
+if "agent" in st.session_state and hasattr(st.session_state.agent, 'context'):
+    context = st.session_state.agent.context
+    st.json(context.report())
+    # Tool outputs are sent as query-relevant extracts; the model can ask for a full one by its handle
+    st.write("Tool output compression:")
+    st.json(st.session_state.agent.observations.stats())
+    if context.summary:
+        st.markdown(f"**Rolling summary:**\n\n{context.summary}")
+else:
+    st.info("No context statistics yet. Ask the agent something in the chat!")
+
+# 7. Shared Resources
+st.divider()
+st.header("🧩 Shared Resources")
+st.write("Heavy objects built once per process and shared by all sessions, with their cold-start cost.")
+
+st.metric("Process RSS (MB)", f"{current_rss_mb():.0f}" if current_rss_mb() is not None else "n/a")
+st.dataframe([{"Resource": key, **stats} for key, stats in resource_stats().items()], use_container_width=True)
+# Per-tenant stores stay loaded while in use; idle tenants are unloaded beyond TENANT_CACHE_SIZE
+st.json(tenant_stats())
+
+# Boot: what the background warmup loaded before the first question, and how long each stage took
+if "agent" in st.session_state:
+    agent = st.session_state.agent
+    warmup = start_warmup(agent.brain.model_name, agent.brain.router.small, agent.tenant)
+    if warmup is not None:
+        st.write("Background warmup:")
+        st.json(warmup.status())
+
+if "agent_build_stats" in st.session_state:
+    st.write("Cost of building this session's agent:")
+    st.json(st.session_state.agent_build_stats)
+
+# 8. Search Cache
+st.divider()
+st.header("🌐 Search Cache")
+st.write("Hit rate of the persistent search cache and latency of recent web searches.")
+st.json(get_search_tool().stats())
+
+# 9. Response Cache
+st.divider()
+st.header("♻️ LLM Response Cache")
+st.write("Model responses reused for repeated prompts (exact) and near-duplicate questions (semantic).")
+
+response_cache = get_response_cache()
+if response_cache is not None:
+    cache_stats = response_cache.stats()
+    st.metric("Hit rate", f"{cache_stats['hit_rate']:.0%}")
+    st.json(cache_stats)
+else:
+    st.info("The response cache is disabled (RESPONSE_CACHE=0).")
+
+# 10. Model Router
+st.divider()
+st.header("🔀 Model Router")
+st.write("Steps drafted by the small model, escalations to the large model, and per-model latency.")
+
+if "agent" in st.session_state:
+    router_stats = st.session_state.agent.brain.router.stats()
+    if router_stats["small"]:
+        drafted = router_stats["drafts_accepted"] + router_stats["escalated_answer"] + router_stats["escalated_invalid"]
+        st.metric("Drafts accepted", f"{router_stats['drafts_accepted'] / drafted:.0%}" if drafted else "n/a")
+    st.json(router_stats)
+else:
+    st.info("No agent yet. Open the chat page first.")
+
+# 11. Background Jobs
+st.divider()
+st.header("🧵 Background Jobs")
+st.write("Agent runs and tool calls executing on the shared worker pool, and the queue's backpressure counters.")
+
+job_queue = get_job_queue()
+st.json(job_queue.stats())
+session_jobs = job_queue.jobs(owner=st.session_state.get("session_id"))
+if session_jobs:
+    st.dataframe([job.snapshot() for job in reversed(session_jobs)], use_container_width=True)
+else:
+    st.info("This session hasn't started any jobs yet.")
+
+# 12. Latency Breakdown
+st.divider()
+st.header("🧭 Latency Breakdown")
+st.write("Where the time of the LAST query went: prompt evaluation, generation, memory, documents and web search.")
+
+trace_id = getattr(st.session_state.get("agent"), 'latest_trace_id', None)
+spans = tracer.trace(trace_id) if trace_id else []
+
+if spans:
+    run_span = next((span for span in spans if span["name"] == "agent.run"), None)
+    if run_span:
+        st.metric("Total run time (ms)", f"{run_span['duration_ms']:.0f}")
+
+    # Leaf stages only (spans no other span is the parent of), so nested spans aren't counted twice
+    parents = {span["parent_id"] for span in spans}
+    breakdown = {}
+    for span in spans:
+        if span["span_id"] in parents:
+            continue
+        breakdown[span["name"]] = breakdown.get(span["name"], 0.0) + span["duration_ms"]
+
+    # Split LLM time into prompt evaluation and generation where Ollama reported it
+    llm_spans = [span for span in spans if span["name"] == "brain.chat"]
+    prompt_eval_ms = sum((span.get("prompt_eval_duration") or 0) / 1e6 for span in llm_spans)
+    eval_ms = sum((span.get("eval_duration") or 0) / 1e6 for span in llm_spans)
+    if prompt_eval_ms or eval_ms:
+        breakdown["brain.chat"] = max(0.0, breakdown.get("brain.chat", 0.0) - prompt_eval_ms - eval_ms)
+        breakdown["llm.prompt_eval"] = prompt_eval_ms
+        breakdown["llm.generation"] = eval_ms
+
+    st.bar_chart({"ms": breakdown})
+    if run_span and sum(breakdown.values()) > run_span["duration_ms"]:
+        st.caption("Stages running side by side (e.g. parallel tool calls) overlap, so they add up to more than "
+                   "the run time.")
+    with st.expander("All spans"):
+        st.dataframe(spans, use_container_width=True)
 else:
-    st.info("No internal monologue recorded yet. Ask the agent a complex question that requires tools!")
\ No newline at end of file
+    st.info("No trace recorded yet. Ask the agent something in the chat!")
@@ -0,0 +1,79 @@
+import re
+import uuid
+
+import chromadb
+
+import core.brain
+from core.brain import Brain, ResponseCache
+from core.tracing import tracer
+
+QUESTION = "What is the capital of France?"
+ANSWER = "Thought: I know this.\nFinal Answer: Paris."
+
+
+class WordEmbedder:
+    """Bag-of-words vectors, so questions differing only in case and punctuation embed the same."""
+    VOCABULARY = ["what", "is", "the", "capital", "of", "france", "spain", "weather"]
+
+    def __init__(self):
+        self.name = f"words-{uuid.uuid4().hex[:8]}"
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            words = re.findall(r"[a-z]+", text.lower())
+            vectors.append([float(words.count(word)) + 0.01 for word in self.VOCABULARY])
+        return vectors
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        return iter([{"message": {"content": ANSWER}}, {"message": {"content": ""}, "done": True}])
+
+
+def make_brain(monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE", "0")
+    embedder, client = WordEmbedder(), FakeClient()
+    chroma = chromadb.EphemeralClient()
+    monkeypatch.setattr(core.brain, "get_embedder", lambda: embedder)
+    monkeypatch.setattr(core.brain, "get_chroma_client", lambda: chroma)
+    monkeypatch.setattr(core.brain, "get_ollama_client", lambda: client)
+    brain = Brain("fake-model")
+    brain.cache = ResponseCache(similarity=0.95)
+    return brain, client
+
+
+def ask(brain, question, **kwargs):
+    messages = [{"role": "system", "content": "You are helpful."}, {"role": "user", "content": question}]
+    return "".join(brain.chat_stream(messages, **kwargs))
+
+
+def test_chat_stream_reuses_answers_to_near_duplicate_questions(monkeypatch):
+    brain, client = make_brain(monkeypatch)
+    assert ask(brain, QUESTION) == ANSWER
+    assert ask(brain, "what is the capital of france") == ANSWER
+    assert brain.last_stats["cached"] == "semantic"
+    assert client.calls == 1
+
+
+def test_chat_stream_keeps_constrained_answers_out_of_the_semantic_level(monkeypatch):
+    brain, client = make_brain(monkeypatch)
+    schema = {"type": "object"}
+    ask(brain, QUESTION, format=schema)
+    ask(brain, "what is the capital of france", format=schema)
+    assert brain.last_stats["cached"] is None
+    assert client.calls == 2
+
+
+def test_cached_replays_are_not_counted_as_model_requests(monkeypatch):
+    brain, client = make_brain(monkeypatch)
+    requests = ("llm_requests_total", (("model", "fake-model"),))
+    before = tracer.metrics._counters[requests]
+    ask(brain, QUESTION)
+    ask(brain, QUESTION)
+    assert brain.last_stats["cached"] == "exact"
+    assert tracer.metrics._counters[requests] - before == client.calls == 1
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from tools.extract import ExtractionCache
+
+
+def test_put_round_trips_segments(tmp_path):
+    cache = ExtractionCache(cache_dir=str(tmp_path))
+    document = cache.put("abc", [("p. 1", "First page."), ("p. 2", "Second page.")])
+    assert document is not None
+    assert cache.get("abc") is not None
+
+
+def test_failed_extraction_leaves_no_temporary_files(tmp_path):
+    cache = ExtractionCache(cache_dir=str(tmp_path))
+
+    def segments():
+        yield "p. 1", "First page."
+        raise ValueError("corrupt page")
+
+    with pytest.raises(ValueError):
+        cache.put("abc", segments())
+    assert os.listdir(tmp_path) == []
+    assert cache.get("abc") is None
@@ -0,0 +1,55 @@
+import chromadb
+
+import tools.ingest
+from core.memory import Embedder
+from tools.ingest import DocumentIndex
+
+
+class LengthEmbedder(Embedder):
+    name = "length"
+
+    def embed(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def make_index(monkeypatch, max_documents):
+    client, embedder = chromadb.EphemeralClient(), LengthEmbedder()
+    for collection in client.list_collections():
+        client.delete_collection(collection.name)
+    monkeypatch.setattr(tools.ingest, "get_chroma_client", lambda: client)
+    monkeypatch.setattr(tools.ingest, "get_embedder", lambda: embedder)
+    return DocumentIndex(max_documents=max_documents), client
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def ingest(index, path):
+    return index.ingest(path, lambda: [("p. 1", open(path, encoding="utf-8").read())])
+
+
+def documents(client):
+    return sorted(collection.metadata["path"] for collection in client.list_collections())
+
+
+def test_least_recently_read_documents_are_evicted(monkeypatch, tmp_path):
+    index, client = make_index(monkeypatch, max_documents=2)
+    paths = [write(tmp_path, f"{i}.txt", f"Document number {i}.") for i in range(3)]
+    for path in paths:
+        ingest(index, path)
+    assert documents(client) == paths[1:]
+
+
+def test_collections_of_deleted_and_changed_files_are_dropped(monkeypatch, tmp_path):
+    index, client = make_index(monkeypatch, max_documents=10)
+    gone, changed = write(tmp_path, "gone.txt", "Soon deleted."), write(tmp_path, "changed.txt", "First version.")
+    ingest(index, gone)
+    ingest(index, changed)
+    (tmp_path / "gone.txt").unlink()
+    write(tmp_path, "changed.txt", "Second version, longer.")
+    collection = ingest(index, changed)
+    assert documents(client) == [changed]
+    assert collection.get()["documents"] == ["Second version, longer."]
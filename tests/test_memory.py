@@ -0,0 +1,54 @@
+from core.memory import CachedEmbedder, Embedder, Memory
+
+
+class TableEmbedder(Embedder):
+    """Looks vectors up by text, so tests choose exactly how similar memories are."""
+    name = "table"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed(self, texts):
+        return [self.vectors[text] for text in texts]
+
+
+def test_dedupe_finds_a_near_duplicate_of_the_same_user_among_other_users(tmp_path):
+    vectors = {"Alice likes green tea.": [1.0, 0.1, 0.0], "Alice really likes green tea.": [1.0, 0.0, 0.0]}
+    others = [f"User {i} likes green tea." for i in range(5)]
+    # Other users' memories are even closer to the new one, so they'd fill an unfiltered top 3
+    vectors.update({text: [1.0, 0.0, 0.0] for text in others})
+    memory = Memory(db_path=str(tmp_path), embedder=TableEmbedder(vectors))
+
+    assert memory.add_memories(["Alice likes green tea."], user="alice") == 1
+    for i, text in enumerate(others):
+        memory.add_memories([text], user=f"user{i}")
+    assert memory.add_memories(["Alice really likes green tea."], user="alice") == 0
+    assert memory.stats["deduplicated"] == 1
+
+
+class CountingEmbedder(Embedder):
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_embedding_disk_cache_keeps_the_newest_rows(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cached = CachedEmbedder(CountingEmbedder(), cache_path=path, max_disk_entries=10)
+    for i in range(25):
+        cached.embed([f"text {i}"])
+    rows = cached._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert rows <= 10
+
+    # A restarted process finds the newest texts on disk and embeds the pruned ones again
+    embedder = CountingEmbedder()
+    restarted = CachedEmbedder(embedder, cache_path=path, max_disk_entries=10)
+    restarted.embed(["text 24"])
+    assert embedder.calls == 0
+    restarted.embed(["text 0"])
+    assert embedder.calls == 1
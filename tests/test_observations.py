@@ -0,0 +1,68 @@
+from core.context import CHARS_PER_TOKEN
+from core.observations import ObservationCompressor, split_chunks
+
+FILLER = "The weather report mentions clouds and wind over the hills."
+
+
+def test_split_chunks_keeps_short_blocks_whole():
+    text = "First block.\n\nSecond block.\n---\nThird block."
+    assert split_chunks(text, 50) == [(0, "First block."), (1, "Second block."), (2, "Third block.")]
+
+
+def test_split_chunks_splits_long_blocks_into_sentences():
+    text = "Heading:\n\n" + " ".join(f"Sentence number {i} is here." for i in range(3))
+    chunks = split_chunks(text, 5)
+    assert chunks[0] == (0, "Heading:")
+    assert chunks[1:] == [(1, f"Sentence number {i} is here.") for i in range(3)]
+
+
+def test_split_chunks_skips_empty_blocks():
+    assert split_chunks("\n\n   \n---\n\n", 10) == []
+
+
+def test_compress_returns_short_and_error_outputs_unchanged():
+    compressor = ObservationCompressor(scorer="bm25")
+    assert compressor.compress("Short output.", "query", 50) == "Short output."
+    error = "Error: " + "x" * 1000
+    assert compressor.compress(error, "query", 10) == error
+
+
+def test_compress_handles_outputs_without_chunks():
+    compressor = ObservationCompressor(scorer="bm25")
+    extract = compressor.compress(" " * 4000, "q", 50)
+    assert len(extract) <= 50 * CHARS_PER_TOKEN
+    assert compressor.compress("\n---\n" * 400, "q", 50) == ("\n---\n" * 400)[:50 * CHARS_PER_TOKEN]
+
+
+def test_compress_keeps_the_relevant_block_and_a_handle():
+    compressor = ObservationCompressor(scorer="bm25")
+    blocks = [FILLER] * 30
+    blocks[17] = "The zeppelin budget was approved on Tuesday."
+    extract = compressor.compress("\n\n".join(blocks), "zeppelin budget", 40)
+    assert "The zeppelin budget was approved on Tuesday." in extract
+    assert FILLER not in extract
+    assert extract.endswith("Full output: expand_observation obs-1]")
+    assert compressor.stats()["compressed"] == 1
+
+
+def test_expand_pages_through_the_raw_output():
+    compressor = ObservationCompressor(scorer="bm25")
+    raw = "\n\n".join(f"{FILLER} ({i})" for i in range(40))
+    compressor.compress(raw, "weather", 20)
+    page_tokens = 100
+    page_chars = page_tokens * CHARS_PER_TOKEN
+    pages = -(-len(raw) // page_chars)
+
+    first = compressor.expand("obs-1", page_tokens)
+    assert first.startswith(f"Full output of obs-1 (page 1 of {pages}):\n{raw[:page_chars]}")
+    assert first.endswith("[Next page: expand_observation obs-1 2]")
+
+    last = compressor.expand("obs-1 99", page_tokens)
+    assert f"(page {pages} of {pages})" in last
+    assert last.endswith(raw[(pages - 1) * page_chars:])
+    assert compressor.stats()["expanded"] == 2
+
+
+def test_expand_rejects_unknown_handles():
+    compressor = ObservationCompressor(scorer="bm25")
+    assert compressor.expand("obs-7", 100).startswith("Error: Unknown observation handle 'obs-7'")
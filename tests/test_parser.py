@@ -0,0 +1,28 @@
+from core.parser import ReActStreamParser, parse_actions
+
+
+def stream(text, max_actions=1):
+    parser = ReActStreamParser(max_actions)
+    answer = ""
+    for index in range(0, len(text), 3):
+        answer += parser.feed(text[index:index + 3])
+        if parser.done:
+            break
+    answer += parser.finish()
+    return parser, answer
+
+
+def test_restated_observation_keeps_the_final_answer():
+    parser, answer = stream("Thought: The Observation: it is 21 degrees.\nFinal Answer: It is 21 degrees.")
+    assert not parser.done
+    assert parser.final_answer == "It is 21 degrees."
+    assert answer == "It is 21 degrees."
+
+
+def test_observation_after_a_tool_call_is_dropped():
+    parser, _ = stream("Thought: I need two lookups.\nAction: search\nAction Input: weather\n"
+                       "Observation: sunny\nFinal Answer: Sunny.", max_actions=2)
+    assert parser.done
+    assert parser.final_answer is None
+    assert "Observation" not in parser.text
+    assert parse_actions(parser.text, 2) == [("search", "weather")]
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from core.resources import tenant_shared
+
+
+def test_tenant_shared_builds_each_tenant_once():
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.1)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tenant_shared("single-flight", "alice", build)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(set(map(id, results))) == 1
+
+
+def test_cold_tenant_does_not_block_loaded_tenants():
+    loaded = tenant_shared("cold-build", "bob", object)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_build():
+        started.set()
+        release.wait(5)
+        return object()
+
+    builder = threading.Thread(target=tenant_shared, args=("cold-build", "carol", slow_build))
+    builder.start()
+    try:
+        assert started.wait(5)
+        start = time.perf_counter()
+        assert tenant_shared("cold-build", "bob", object) is loaded
+        assert time.perf_counter() - start < 1
+    finally:
+        release.set()
+        builder.join()
+
+
+def test_failed_build_is_retried():
+    def fail():
+        raise RuntimeError("collection unavailable")
+
+    try:
+        tenant_shared("retry", "dave", fail)
+    except RuntimeError:
+        pass
+    value = object()
+    assert tenant_shared("retry", "dave", lambda: value) is value
@@ -0,0 +1,33 @@
+import threading
+import time
+
+from core.runtime import ToolRuntime
+
+SPECS = {"save": {"concurrent": False}, "search": {"concurrent": True}}
+
+
+def test_side_effect_tools_finish_before_later_reads():
+    saved, log = [], []
+
+    def execute(action, action_input):
+        if action == "save":
+            time.sleep(0.1)
+            saved.append(action_input)
+            return "saved"
+        log.append((action_input, list(saved)))
+        return ",".join(saved)
+
+    results = ToolRuntime(execute, SPECS).run_batch([("search", "before"), ("save", "x"), ("search", "after")])
+    assert results == ["", "saved", "x"]
+    assert log == [("before", []), ("after", ["x"])]
+
+
+def test_consecutive_reads_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def execute(action, action_input):
+        barrier.wait()
+        return action_input
+
+    runtime = ToolRuntime(execute, SPECS)
+    assert runtime.run_batch([("search", "a"), ("search", "b"), ("search", "c")]) == ["a", "b", "c"]
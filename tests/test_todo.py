@@ -0,0 +1,30 @@
+import json
+
+from tools.todo import TodoManager
+
+
+def make_manager(tmp_path, legacy):
+    path = tmp_path / "todo.json"
+    path.write_text(json.dumps(legacy), encoding="utf-8")
+    return TodoManager(file_path=str(path), db_path=str(tmp_path / "todo.db"))
+
+
+def test_import_keeps_tasks_with_colliding_ids(tmp_path):
+    manager = make_manager(tmp_path, [{"id": 1, "task": "first"}, {"id": 2, "task": "second", "status": "done"},
+                                      {"id": 1, "task": "first again"}, {"task": "no id"}])
+    tasks = {task["task"]: task for task in manager.get_tasks()}
+    assert set(tasks) == {"first", "second", "first again", "no id"}
+    assert tasks["first"]["id"] == 1 and tasks["second"]["id"] == 2
+    assert tasks["second"]["status"] == "done"
+    assert tasks["first again"]["id"] > 2 and tasks["no id"]["id"] > 2
+
+
+def test_import_skips_malformed_entries(tmp_path):
+    manager = make_manager(tmp_path, [{"id": 1, "task": "kept"}, {"id": 2}, "not a task", {"task": ""}])
+    assert [task["task"] for task in manager.get_tasks()] == ["kept"]
+
+
+def test_import_ignores_a_file_that_is_not_a_list(tmp_path):
+    manager = make_manager(tmp_path, {"tasks": []})
+    assert manager.get_tasks() == []
+    assert manager.add_task("new").endswith("with ID 1.")
@@ -0,0 +1,34 @@
+import json
+import os
+
+from core.tracing import Tracer
+
+
+def test_trace_file_rolls_over_and_keeps_the_last_backups(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(path=path, max_mb=1 / 1024, backups=2)
+    for i in range(100):
+        with tracer.span("step", index=i, padding="x" * 50):
+            pass
+
+    # The current file only reappears with the next span after a rollover
+    assert {"traces.jsonl.1", "traces.jsonl.2"} <= set(os.listdir(tmp_path)) <= {
+        "traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"}
+    for name in os.listdir(tmp_path):
+        assert os.path.getsize(tmp_path / name) < 1024 + 200
+    with open(path + ".1", encoding="utf-8") as f:
+        older = [json.loads(line)["index"] for line in f]
+    with open(path + ".2", encoding="utf-8") as f:
+        oldest = [json.loads(line)["index"] for line in f]
+    assert oldest[-1] + 1 == older[0]
+    assert tracer.trace(tracer._recent[-1]["trace_id"])[0]["index"] == 99
+
+
+def test_trace_file_without_backups_starts_over(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(path=path, max_mb=1 / 1024, backups=0)
+    for i in range(100):
+        with tracer.span("step", index=i, padding="x" * 50):
+            pass
+    assert set(os.listdir(tmp_path)) <= {"traces.jsonl"}
+    assert not os.path.exists(path) or os.path.getsize(path) < 1024
@@ -0,0 +1,197 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.tracing import tracer
+
+# Using try-except for imports ensures the app won't crash
+# if a specific document library is missing on another machine.
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    import docx
+except ImportError:
+    docx = None
+
+Segment = Tuple[str, str]
+
+# Documents shorter than this are extracted in-process; the pool is not worth its overhead
+MIN_PAGES_FOR_POOL = 16
+
+_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pool_lock = threading.Lock()
+
+
+def file_sha256(file_path: str) -> str:
+    """
+    Hashes a file in blocks, remembering the result until its size or mtime changes.
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Worker: extracts the text of pages [start, stop) of a PDF."""
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """One extraction pool per process (and worker count), created on first use."""
+    with _pool_lock:
+        if workers not in _pools:
+            # 'spawn' is safe next to the threads started by Streamlit and Chroma
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                                  mp_context=multiprocessing.get_context("spawn"))
+        return _pools[workers]
+
+
+class CachedDocument:
+    """
+    Extracted text of a document, memory-mapped from disk.
+    Pages are sliced out by byte offset, so reading any page range costs no parsing.
+    """
+    def __init__(self, text_path: str, offsets: array, labels: List[str]):
+        self.labels = labels
+        self._offsets = offsets
+        self._mmap = None
+        if offsets[-1] > 0:
+            with open(text_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def page(self, index: int) -> str:
+        """Returns the text of one page (or paragraph block)."""
+        if self._mmap is None:
+            return ""
+        return self._mmap[self._offsets[index]:self._offsets[index + 1]].decode("utf-8")
+
+    def iter_pages(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Segment]:
+        """Streams (location, text) segments for a page range, skipping empty pages."""
+        for index in range(start, min(stop if stop is not None else len(self), len(self))):
+            text = self.page(index)
+            if text:
+                yield self.labels[index], text
+
+
+class ExtractionCache:
+    """
+    Persistent cache of extracted document text under data/, keyed by content hash.
+    Each entry is a UTF-8 text file plus an index of page offsets and page labels.
+    """
+    def __init__(self, cache_dir: str = None, workers: int = None):
+        self.cache_dir = cache_dir or os.getenv("EXTRACTION_CACHE_DIR", "./data/extraction_cache")
+        self.workers = workers or int(os.getenv("EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def document(self, file_path: str) -> CachedDocument:
+        """
+        Returns the cached text of a PDF or DOCX file, extracting it first if needed.
+        """
+        sha256 = file_sha256(file_path)
+        cached = self.get(sha256)
+        if cached is not None:
+            return cached
+
+        _, ext = os.path.splitext(file_path)
+        with tracer.span("document.extract", path=file_path, workers=self.workers):
+            if ext.lower() == ".pdf":
+                segments = self._extract_pdf(file_path)
+            else:
+                segments = self._extract_docx(file_path)
+            return self.put(sha256, segments)
+
+    def get(self, sha256: str) -> Optional[CachedDocument]:
+        """Opens a cache entry, or returns None if the document was never extracted."""
+        base = os.path.join(self.cache_dir, sha256)
+        # The index is written last, so its presence means the entry is complete
+        if not os.path.exists(base + ".idx"):
+            return None
+
+        offsets = array("Q")
+        with open(base + ".idx", "rb") as f:
+            offsets.frombytes(f.read())
+        with open(base + ".labels", "r", encoding="utf-8") as f:
+            labels = f.read().split("\n") if len(offsets) > 1 else []
+        return CachedDocument(base + ".txt", offsets, labels)
+
+    def put(self, sha256: str, segments: Iterable[Segment]) -> CachedDocument:
+        """Writes extracted segments to the cache as they are produced."""
+        base = os.path.join(self.cache_dir, sha256)
+        suffix = f".tmp{os.getpid()}-{threading.get_ident()}"
+        offsets, labels = array("Q", [0]), []
+
+        try:
+            with open(base + ".txt" + suffix, "wb") as f:
+                for label, text in segments:
+                    f.write(text.encode("utf-8"))
+                    offsets.append(f.tell())
+                    labels.append(label)
+            with open(base + ".labels" + suffix, "w", encoding="utf-8") as f:
+                f.write("\n".join(labels))
+            with open(base + ".idx" + suffix, "wb") as f:
+                f.write(offsets.tobytes())
+
+            for ext in (".txt", ".labels", ".idx"):
+                os.replace(base + ext + suffix, base + ext)
+        except BaseException:
+            # A failed extraction or write leaves no temporary files behind in the cache
+            for ext in (".txt", ".labels", ".idx"):
+                try:
+                    os.unlink(base + ext + suffix)
+                except FileNotFoundError:
+                    pass
+            raise
+        return self.get(sha256)
+
+    def _extract_pdf(self, file_path: str) -> Iterator[Segment]:
+        """Extracts PDF pages, spreading page ranges over worker processes for long documents."""
+        if PdfReader is None:
+            raise ImportError("'pypdf' library is not installed.")
+
+        page_count = len(PdfReader(file_path).pages)
+        if self.workers <= 1 or page_count < MIN_PAGES_FOR_POOL:
+            page_texts = _extract_page_range(file_path, 0, page_count)
+            for number, text in enumerate(page_texts, 1):
+                yield f"p. {number}", text
+            return
+
+        # A few ranges per worker keeps them all busy when pages differ in cost
+        range_size = max(1, page_count // (self.workers * 4))
+        starts = list(range(0, page_count, range_size))
+        stops = [min(start + range_size, page_count) for start in starts]
+
+        pool = _get_pool(self.workers)
+        number = 0
+        for page_texts in pool.map(_extract_page_range, [file_path] * len(starts), starts, stops):
+            for text in page_texts:
+                number += 1
+                yield f"p. {number}", text
+
+    def _extract_docx(self, file_path: str) -> Iterator[Segment]:
+        """Extracts DOCX paragraphs; a single XML document, so this stays in-process."""
+        if docx is None:
+            raise ImportError("'python-docx' library is not installed.")
+
+        for number, paragraph in enumerate(docx.Document(file_path).paragraphs, 1):
+            yield f"para {number}", paragraph.text
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from core.resources import get_chroma_client, get_embedder
+from core.tracing import tracer
+# A segment is a piece of a document with the location it came from, e.g. ("p. 3", "text...")
+from tools.extract import Segment, file_sha256
+
+
+def chunk_segments(segments: Iterable[Segment], chunk_size: int = 1000, overlap: int = 200) -> Iterator[Dict[str, str]]:
+    """
+    Streams overlapping chunks of about chunk_size characters out of a sequence of segments.
+    Each chunk remembers which locations (pages, paragraphs) it spans.
+    """
+    words: List[Tuple[str, str]] = []
+    size = 0
+    # Whether words were added since the last chunk was emitted
+    pending = False
+
+    def make_chunk() -> Dict[str, str]:
+        first, last = words[0][1], words[-1][1]
+        citation = first if first == last else f"{first} - {last}"
+        return {"text": " ".join(word for word, _ in words), "citation": citation}
+
+    for location, text in segments:
+        for word in text.split():
+            words.append((word, location))
+            size += len(word) + 1
+            pending = True
+            if size < chunk_size:
+                continue
+
+            yield make_chunk()
+            pending = False
+
+            # Carry the tail of this chunk over into the next one
+            kept, kept_size = [], 0
+            for item in reversed(words):
+                if kept_size + len(item[0]) + 1 > overlap:
+                    break
+                kept.append(item)
+                kept_size += len(item[0]) + 1
+            words, size = list(reversed(kept)), kept_size
+
+    if pending:
+        yield make_chunk()
+
+
+# How stale a collection's recorded last read may get before it is refreshed (a metadata write)
+USED_AT_RESOLUTION = 600.0
+
+
+class DocumentIndex:
+    """
+    Chunks documents into a per-document Chroma collection and retrieves the passages relevant to a question.
+    Ingestion is incremental: a file is only parsed again when its modification time and content hash change.
+    Collections of deleted files or of another embedding model are dropped, and the least recently read
+    beyond max_documents are evicted, whenever a document is ingested.
+    """
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200, batch_size: int = 64, max_documents: int = None):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        # Documents kept in the shared store (0 for no limit)
+        self.max_documents = (int(os.getenv("DOCUMENT_INDEX_MAX_DOCS", "200")) if max_documents is None
+                              else max_documents)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def search(self, file_path: str, segments: Callable[[], Iterable[Segment]], question: str,
+               top_k: int = 4) -> List[Dict[str, str]]:
+        """
+        Returns the top_k chunks most relevant to the question, in document order.
+        Documents with only a few chunks are returned whole.
+        """
+        collection = self.ingest(file_path, segments)
+        total = collection.count()
+        if total == 0:
+            return []
+
+        if total <= top_k:
+            results = collection.get(include=["documents", "metadatas"])
+            ids, documents, metadatas = results["ids"], results["documents"], results["metadatas"]
+        else:
+            with tracer.span("document.query"):
+                results = collection.query(query_embeddings=get_embedder().embed([question]), n_results=top_k,
+                                           include=["documents", "metadatas"])
+            ids, documents, metadatas = results["ids"][0], results["documents"][0], results["metadatas"][0]
+
+        chunks = sorted(zip(ids, documents, metadatas), key=lambda item: item[2]["position"])
+        return [{"text": document, "citation": metadata["citation"]} for _, document, metadata in chunks]
+
+    def ingest(self, file_path: str, segments: Callable[[], Iterable[Segment]]):
+        """
+        Makes sure the document's collection is up to date and returns it.
+        """
+        file_path = os.path.abspath(file_path)
+        with self._lock_for(file_path):
+            embedder = get_embedder()
+            client = get_chroma_client()
+            name = "doc_" + hashlib.sha1(f"{embedder.name}\0{file_path}".encode("utf-8")).hexdigest()[:24]
+
+            stat = os.stat(file_path)
+            mtime = str(stat.st_mtime_ns)
+            now = time.time()
+            collection = client.get_or_create_collection(name=name, embedding_function=None)
+            metadata = collection.metadata or {}
+
+            # Fast path: same file, untouched since the last ingestion
+            if metadata.get("mtime") == mtime and metadata.get("complete"):
+                if now - metadata.get("used_at", 0) > USED_AT_RESOLUTION:
+                    collection.modify(metadata={**metadata, "used_at": now})
+                return collection
+
+            # Touched but identical content: only refresh the stored mtime
+            sha256 = file_sha256(file_path)
+            if metadata.get("sha256") == sha256 and metadata.get("complete"):
+                collection.modify(metadata={**metadata, "mtime": mtime, "used_at": now})
+                return collection
+
+            # New or changed content: the stale chunks go with the old collection
+            client.delete_collection(name)
+            metadata = {"path": file_path, "mtime": mtime, "sha256": sha256, "embedder": embedder.name, "used_at": now}
+            collection = client.create_collection(name=name, embedding_function=None, metadata=metadata)
+            with tracer.span("document.ingest", path=file_path):
+                self._upsert_chunks(collection, segments())
+
+            # Only mark the collection complete once every chunk is stored
+            collection.modify(metadata={**metadata, "complete": True})
+        self._evict(client, keep=name)
+        return collection
+
+    def _evict(self, client, keep: str) -> None:
+        """
+        Drops the collections of deleted files and of other embedding models, then the least recently read
+        documents beyond max_documents. Documents being ingested right now are left alone.
+        """
+        embedder_name = get_embedder().name
+        stale, live = [], []
+        for collection in client.list_collections():
+            if not collection.name.startswith("doc_") or collection.name == keep:
+                continue
+            metadata = collection.metadata or {}
+            path = metadata.get("path")
+            with self._locks_guard:
+                lock = self._locks.get(path)
+            if lock is not None and lock.locked():
+                continue
+            if not path or not os.path.exists(path) or metadata.get("embedder") != embedder_name:
+                stale.append((collection.name, path))
+            else:
+                live.append((metadata.get("used_at", 0), collection.name, path))
+        if self.max_documents:
+            live.sort()
+            # The document just read counts too
+            stale += [(name, path) for _, name, path in live[:max(0, len(live) + 1 - self.max_documents)]]
+
+        for name, path in stale:
+            try:
+                client.delete_collection(name)
+            except Exception:
+                # Already dropped by another process
+                continue
+            with self._locks_guard:
+                lock = self._locks.get(path)
+                if lock is not None and not lock.locked():
+                    del self._locks[path]
+        if stale:
+            tracer.metrics.increment("document_collections_evicted_total", len(stale))
+
+    def _upsert_chunks(self, collection, segments: Iterable[Segment]) -> None:
+        """Embeds and stores chunks in batches as the document is read."""
+        embedder = get_embedder()
+        batch = []
+
+        def flush() -> None:
+            collection.upsert(
+                ids=[f"chunk_{position}" for position, _ in batch],
+                documents=[chunk["text"] for _, chunk in batch],
+                embeddings=embedder.embed([chunk["text"] for _, chunk in batch]),
+                metadatas=[{"position": position, "citation": chunk["citation"]} for position, chunk in batch],
+            )
+            batch.clear()
+
+        for position, chunk in enumerate(chunk_segments(segments, self.chunk_size, self.overlap)):
+            batch.append((position, chunk))
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+    def _lock_for(self, file_path: str) -> threading.Lock:
+        # Concurrent sessions reading the same file ingest it only once
+        with self._locks_guard:
+            return self._locks.setdefault(file_path, threading.Lock())
@@ -1,28 +1,25 @@
 import os
+from typing import Iterator
 
-# Using try-except for imports ensures the app won't crash
-# if a specific document library is missing on another machine.
-try:
-    from pypdf import PdfReader
-except ImportError:
-    PdfReader = None
-
-try:
-    import docx
-except ImportError:
-    docx = None
+from tools.extract import ExtractionCache, PdfReader, docx
+from tools.ingest import DocumentIndex, Segment
 
 class DocumentReader:
     """
     Reads text from various document formats (.txt, .pdf, .docx).
     Acts as the 'Document Eyes' for the agent.
     """
-    def __init__(self):
-        pass
+    def __init__(self, top_k: int = 4):
+        # Number of passages returned when reading a document to answer a question
+        self.top_k = top_k
+        self.index = DocumentIndex()
+        # Extracted PDF/DOCX text is cached on disk, so each file is only parsed once
+        self.extraction_cache = ExtractionCache()
 
-    def read_file(self, file_path: str) -> str:
+    def read_file(self, file_path: str, question: str = None) -> str:
         """
         Detects the file type based on its extension and extracts text from it.
+        With a question, returns only the most relevant passages with their page citations.
         Returns the extracted text or an error message.
         """
         if not os.path.exists(file_path):
@@ -32,45 +29,65 @@ class DocumentReader:
         _, ext = os.path.splitext(file_path)
         ext = ext.lower()
 
+        if ext not in ['.txt', '.pdf', '.doc', '.docx']:
+            return f"Error: Unsupported file extension '{ext}'. Only .txt, .pdf, and .docx are supported."
+
         try:
-            if ext == '.txt':
-                return self._read_txt(file_path)
-            elif ext == '.pdf':
-                return self._read_pdf(file_path)
-            elif ext in ['.doc', '.docx']:
-                return self._read_docx(file_path)
-            else:
-                return f"Error: Unsupported file extension '{ext}'. Only .txt, .pdf, and .docx are supported."
+            if ext == '.pdf' and PdfReader is None:
+                return "Error: 'pypdf' library is not installed."
+            if ext in ['.doc', '.docx'] and docx is None:
+                return "Error: 'python-docx' library is not installed."
+
+            if question is None:
+                return "\n".join(text for _, text in self.iter_segments(file_path)).strip()
+
+            passages = self.index.search(file_path, lambda: self.iter_segments(file_path), question, self.top_k)
+            if not passages:
+                return f"The document '{file_path}' contains no extractable text."
+
+            blocks = [f"[{passage['citation']}] {passage['text']}" for passage in passages]
+            return f"Most relevant passages from '{file_path}':\n\n" + "\n\n".join(blocks)
 
         except Exception as e:
             return f"Error reading file '{file_path}': {str(e)}"
 
-    def _read_txt(self, file_path: str) -> str:
-        """Reads plain text files."""
+    def iter_segments(self, file_path: str) -> Iterator[Segment]:
+        """
+        Streams (location, text) pieces of a document without building the whole text in memory.
+        """
+        _, ext = os.path.splitext(file_path)
+        ext = ext.lower()
+
+        if ext == '.txt':
+            return self._read_txt(file_path)
+        elif ext == '.pdf':
+            return self._read_pdf(file_path)
+        return self._read_docx(file_path)
+
+    def _read_txt(self, file_path: str) -> Iterator[Segment]:
+        """Reads plain text files, one paragraph at a time."""
         with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
-
-    def _read_pdf(self, file_path: str) -> str:
-        """Reads PDF files using pypdf."""
-        if PdfReader is None:
-            return "Error: 'pypdf' library is not installed."
-
-        reader = PdfReader(file_path)
-        text = ""
-        # Iterate through all pages and concatenate the text
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-
-        return text.strip()
-
-    def _read_docx(self, file_path: str) -> str:
-        """Reads Microsoft Word documents using python-docx."""
-        if docx is None:
-            return "Error: 'python-docx' library is not installed."
-
-        doc = docx.Document(file_path)
-        # Extract text from each paragraph and join with newlines
-        text = [paragraph.text for paragraph in doc.paragraphs]
-        return "\n".join(text).strip()
\ No newline at end of file
+            paragraph, number = [], 1
+            for line in f:
+                if line.strip():
+                    paragraph.append(line)
+                elif paragraph:
+                    yield f"para {number}", "".join(paragraph)
+                    paragraph, number = [], number + 1
+            if paragraph:
+                yield f"para {number}", "".join(paragraph)
+
+    def _read_pdf(self, file_path: str) -> Iterator[Segment]:
+        """Reads PDF files using pypdf, one page at a time (long files in parallel)."""
+        return self.extraction_cache.document(file_path).iter_pages()
+
+    def _read_docx(self, file_path: str) -> Iterator[Segment]:
+        """Reads Microsoft Word documents using python-docx, one paragraph at a time."""
+        return self.extraction_cache.document(file_path).iter_pages()
+
+    def read_pages(self, file_path: str, first: int, last: int) -> str:
+        """
+        Returns the text of pages first..last (1-based, inclusive) of a PDF, straight from the extraction cache.
+        """
+        pages = self.extraction_cache.document(file_path).iter_pages(first - 1, last)
+        return "\n".join(f"[{label}] {text}" for label, text in pages)
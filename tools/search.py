@@ -1,40 +1,258 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional
+
 from duckduckgo_search import DDGS
 
+from core.tracing import tracer
+
+
+def normalize_query(query: str) -> str:
+    """
+    Lowercases a query and drops punctuation and extra spaces, so near-identical queries share a cache entry.
+    """
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", query.lower())).strip()
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SearchBackend:
+    """
+    Interface of the services SearchTool can query.
+    """
+    name = "base"
+
+    def text(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        """Returns result dicts with 'title', 'body' and 'href' keys."""
+        raise NotImplementedError
+
+
+class DuckDuckGoBackend(SearchBackend):
+    """
+    DuckDuckGo search. Each thread keeps one DDGS session open, so its HTTP connections are reused.
+    """
+    name = "duckduckgo"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def text(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            ddgs = self._local.ddgs = DDGS()
+        try:
+            return list(ddgs.text(query, max_results=max_results))
+        except Exception:
+            # Start a fresh session next time in case this one is broken
+            self._local.ddgs = None
+            raise
+
+
+class FixtureBackend(SearchBackend):
+    """
+    Offline backend answering from fixtures, for tests and benchmarks.
+    Unknown queries get deterministic placeholder results.
+    """
+    name = "fixture"
+
+    def __init__(self, fixtures: Dict[str, List[Dict[str, str]]] = None, path: str = None, latency: float = 0.0):
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                fixtures = json.load(f)
+        self.fixtures = {normalize_query(q): results for q, results in (fixtures or {}).items()}
+        self.latency = latency
+        self.calls = 0
+
+    def text(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        results = self.fixtures.get(normalize_query(query))
+        if results is None:
+            results = [{"title": f"{query} ({i})", "body": f"Placeholder result {i} about {query}.",
+                        "href": f"https://example.com/{i}"} for i in range(1, max_results + 1)]
+        return results[:max_results]
+
+
+def create_backend(spec: str = None) -> SearchBackend:
+    """
+    Builds a backend from a spec: 'duckduckgo' or 'fixture[:path/to/fixtures.json]'.
+    """
+    spec = spec or os.getenv("SEARCH_BACKEND", "duckduckgo")
+    kind, _, path = spec.partition(":")
+    if kind == "duckduckgo":
+        return DuckDuckGoBackend()
+    elif kind == "fixture":
+        return FixtureBackend(path=path or None)
+    raise ValueError(f"Unknown search backend '{spec}'.")
+
+
+class SearchCache:
+    """
+    TTL + LRU cache of search results, persisted to SQLite so it survives restarts.
+    """
+    def __init__(self, path: Optional[str] = None, ttl: float = 3600.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS search_cache "
+                             "(key TEXT PRIMARY KEY, results TEXT, created_at REAL)")
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT results, created_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+                if row:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(key, entry)
+
+            if entry is None:
+                return None
+            if now - entry[1] > self.ttl:
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, results: List[Dict[str, str]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, (results, now))
+            if self._db is None:
+                return
+            self._db.execute("INSERT OR REPLACE INTO search_cache (key, results, created_at) VALUES (?, ?, ?)",
+                             (key, json.dumps(results), now))
+
+            # Expired rows are pruned now and then rather than on every write
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._db.execute("DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl,))
+            self._db.commit()
+
+    def _remember(self, key: str, entry) -> None:
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+
 class SearchTool:
     """
     Provides internet search capabilities for the agent using DuckDuckGo.
+    Results are cached, and concurrent identical queries share a single backend call.
     """
-    def __init__(self, max_results: int = 3):
+    def __init__(self, max_results: int = 3, backend: SearchBackend = None, cache: SearchCache = None):
         # Limit the number of results to save token space in the LLM context
         self.max_results = max_results
+        self.backend = backend or create_backend()
+        self.cache = cache or SearchCache(
+            path=os.getenv("SEARCH_CACHE_PATH", "./data/search_cache.sqlite"),
+            ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+        )
+
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.counters = {"hits": 0, "misses": 0, "shared": 0, "errors": 0}
 
     def search(self, query: str) -> str:
         """
         Searches the web for the given query and returns a formatted summary of the top results.
         """
+        start = time.perf_counter()
         try:
-            # Initialize the DuckDuckGo search client
-            with DDGS() as ddgs:
-                # Perform the search and get a limited number of results
-                results = list(ddgs.text(query, max_results=self.max_results))
+            return self._format(query, self._results(query))
+
+        except Exception as e:
+            self.counters["errors"] += 1
+            return f"Error performing search: {str(e)}"
+
+        finally:
+            self._latencies.append(time.perf_counter() - start)
 
-            # Handle the case where the search engine returns nothing
-            if not results:
-                return f"No results found for query: '{query}'."
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache hit rate and p50/p95 latency of recent searches.
+        """
+        latencies = list(self._latencies)
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["shared"]
+        p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+        return {
+            **self.counters,
+            "backend": self.backend.name,
+            "hit_rate": round((self.counters["hits"] + self.counters["shared"]) / lookups, 3) if lookups else 0.0,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
 
-            # Format the results into a readable string for the LLM
-            formatted_results = []
-            for i, res in enumerate(results, 1):
-                title = res.get('title', 'No Title')
-                body = res.get('body', 'No Description')
-                link = res.get('href', 'No Link')
+    def _results(self, query: str) -> List[Dict[str, str]]:
+        """Returns results from the cache, from an identical in-flight search, or from the backend."""
+        key = f"{self.max_results}:{normalize_query(query)}"
+        results = self.cache.get(key)
+        if results is not None:
+            self.counters["hits"] += 1
+            return results
 
-                # Build a structured block for each search result
-                result_block = f"Result {i}:\nTitle: {title}\nSummary: {body}\nLink: {link}\n"
-                formatted_results.append(result_block)
+        # Single-flight: only the first caller queries the backend, the others wait for its answer
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
 
-            # Join all formatted blocks with a separator line
-            return "\n---\n".join(formatted_results)
+        if not owner:
+            self.counters["shared"] += 1
+            return future.result()
 
+        self.counters["misses"] += 1
+        try:
+            with tracer.span("search.backend", backend=self.backend.name):
+                results = self.backend.text(query, self.max_results)
+            self.cache.put(key, results)
+            future.set_result(results)
+            return results
         except Exception as e:
-            return f"Error performing search: {str(e)}"
\ No newline at end of file
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _format(self, query: str, results: List[Dict[str, str]]) -> str:
+        """Formats the results into a readable string for the LLM."""
+        # Handle the case where the search engine returns nothing
+        if not results:
+            return f"No results found for query: '{query}'."
+
+        formatted_results = []
+        for i, res in enumerate(results, 1):
+            title = res.get('title', 'No Title')
+            body = res.get('body', 'No Description')
+            link = res.get('href', 'No Link')
+
+            # Build a structured block for each search result
+            result_block = f"Result {i}:\nTitle: {title}\nSummary: {body}\nLink: {link}\n"
+            formatted_results.append(result_block)
+
+        # Join all formatted blocks with a separator line
+        return "\n---\n".join(formatted_results)
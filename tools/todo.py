@@ -1,74 +1,261 @@
 import json
 import os
-from typing import List, Dict, Any
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from core.tracing import logger
+
 
 class TodoManager:
     """
-    Manages a persistent To-Do list for the agent using a JSON file.
+    Manages a persistent To-Do list for the agent using SQLite in WAL mode.
+    Writes are atomic, IDs are monotonic across sessions, and reads are cached until the database changes.
+    Each task has an owner (tenant); an owner only sees and completes its own tasks.
     """
-    def __init__(self, file_path: str = None):
-        # Fetch path from environment variable or use default
+    def __init__(self, file_path: str = None, db_path: str = None):
+        # Legacy JSON task list; imported into the database on first start
         self.file_path = file_path or os.getenv("TODO_FILE_PATH", "./data/todo.json")
-        self._ensure_file_exists()
+        self.db_path = db_path or os.getenv("TODO_DB_PATH") or os.path.splitext(self.file_path)[0] + ".db"
+
+        # SQLite connections can't be shared between threads, so each thread gets its own
+        self._local = threading.local()
+        # Recently read task lists, bounded so that many tenants don't grow it without limit
+        self._cache: "OrderedDict[Any, Any]" = OrderedDict()
+        self._cache_entries = int(os.getenv("TODO_CACHE_ENTRIES", "256"))
+        self._cache_version = None
+        self._cache_lock = threading.Lock()
+        # Pending tasks allowed per tenant (0 for no limit); the shared list ('' owner) has none
+        self.max_pending = int(os.getenv("TENANT_MAX_TASKS", "200"))
 
-    def _ensure_file_exists(self) -> None:
+        self._ensure_schema()
+        self._import_json()
+
+    def _connection(self) -> sqlite3.Connection:
         """
-        Creates the JSON file with an empty list if it doesn't exist.
+        Returns this thread's connection, opening it on first use.
         """
-        if not os.path.exists(self.file_path):
-            # Create the 'data' directory if it's missing
-            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-            with open(self.file_path, "w", encoding='utf-8') as f:
-                json.dump([], f)
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
 
-    def add_task(self, task_name: str) -> str:
+    def _ensure_schema(self) -> None:
+        """
+        Creates the tables and indexes if they don't exist.
+        """
+        # Create the 'data' directory if it's missing
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+            CREATE INDEX IF NOT EXISTS idx_tasks_owner_status ON tasks (owner, status);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    def _import_json(self) -> None:
+        """
+        Imports the legacy todo.json once, keeping the original task IDs. Tasks whose ID was already taken (the
+        JSON list could hand out an ID twice) get a fresh one; malformed entries are skipped.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if connection.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone() is None:
+                tasks = []
+                if os.path.exists(self.file_path):
+                    try:
+                        with open(self.file_path, "r", encoding='utf-8') as f:
+                            tasks = json.load(f)
+                    except json.JSONDecodeError:
+                        tasks = []
+                if not isinstance(tasks, list):
+                    logger.warning("Skipping the import of %s: expected a list of tasks", self.file_path)
+                    tasks = []
+
+                now = time.time()
+                kept, renumbered, skipped = [], [], 0
+                seen_ids = set()
+                for t in tasks:
+                    if not isinstance(t, dict) or not isinstance(t.get("task"), str) or not t["task"].strip():
+                        skipped += 1
+                        continue
+                    row = (t["task"], str(t.get("status") or "pending"), str(t.get("owner") or ""), now, now)
+                    task_id = t.get("id")
+                    if isinstance(task_id, int) and not isinstance(task_id, bool) and task_id not in seen_ids:
+                        seen_ids.add(task_id)
+                        kept.append((task_id, *row))
+                    else:
+                        renumbered.append(row)
+                if skipped:
+                    logger.warning("Skipped %d malformed tasks in %s", skipped, self.file_path)
+
+                connection.executemany(
+                    "INSERT INTO tasks (id, task, status, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    kept)
+                # After the original IDs, so the fresh ones can't take one of them
+                connection.executemany(
+                    "INSERT INTO tasks (task, status, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    renumbered)
+                connection.execute("INSERT INTO meta (key, value) VALUES ('json_imported', ?)",
+                                   (str(len(kept) + len(renumbered)),))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def add_task(self, task_name: str, owner: str = "") -> str:
         """
         Adds a new pending task to the list.
         Returns a status message for the agent's observation.
         """
-        tasks = self.get_tasks()
+        connection = self._connection()
+        now = time.time()
+        # The quota check and the insert are one transaction, so concurrent adds can't overshoot it
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            pending = connection.execute("SELECT COUNT(*) FROM tasks WHERE owner = ? AND status = 'pending'",
+                                         (owner,)).fetchone()[0]
+            if owner and self.max_pending and pending >= self.max_pending:
+                connection.execute("ROLLBACK")
+                return (f"Error: The to-do list already has {pending} pending tasks (limit {self.max_pending}). "
+                        "Mark some as done first.")
+            cursor = connection.execute(
+                "INSERT INTO tasks (task, status, owner, created_at, updated_at) VALUES (?, 'pending', ?, ?, ?)",
+                (task_name, owner, now, now))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        self._invalidate()
 
-        new_task = {
-            "id": len(tasks) + 1,
-            "task": task_name,
-            "status": "pending",
-        }
+        return f"Task '{task_name}' added successfully with ID {cursor.lastrowid}."
 
-        tasks.append(new_task)
-        self._save_tasks(tasks)
+    def mark_done(self, task_id: int, owner: str = None) -> str:
+        """
+        Marks a specific task as done using its ID. With an owner, tasks of other owners count as not found.
+        """
+        connection = self._connection()
+        if owner is None:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = 'done', updated_at = ? WHERE id = ? AND status != 'done'",
+                (time.time(), task_id))
+        else:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = 'done', updated_at = ? WHERE id = ? AND owner = ? AND status != 'done'",
+                (time.time(), task_id, owner))
 
-        return f"Task '{task_name}' added successfully with ID {new_task['id']}."
+        if cursor.rowcount:
+            self._invalidate()
+            return f"Task {task_id} marked as done."
+        if self.get_task(task_id, owner) is not None:
+            return f"Task {task_id} is already marked as done."
+        return f"Error: Task with ID {task_id} not found."
 
-    def mark_done(self, task_id: int) -> str:
+    def get_task(self, task_id: int, owner: str = None) -> Optional[Dict[str, Any]]:
         """
-        Marks a specific task as done using its ID.
+        Returns a single task by ID, or None if it doesn't exist (or belongs to another owner).
         """
-        tasks = self.get_tasks()
+        row = self._connection().execute(
+            "SELECT id, task, status, owner FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is None or (owner is not None and row["owner"] != owner):
+            return None
+        return dict(row)
 
-        for t in tasks:
-            if t["id"] == task_id:
-                if t["status"] == "done":
-                    return f"Task {task_id} is already marked as done."
+    def get_tasks(self, status: str = None, owner: str = None, limit: int = None,
+                  offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Returns the list of all tasks, optionally filtered by status and owner.
+        With a limit, returns one page of it (in ID order, starting at offset).
+        """
+        def load() -> List[Dict[str, Any]]:
+            where, params = self._where(status, owner)
+            page = " LIMIT ? OFFSET ?" if limit is not None else ""
+            rows = self._connection().execute(
+                f"SELECT id, task, status, owner FROM tasks {where} ORDER BY id{page}",
+                params + ([limit, offset] if limit is not None else [])).fetchall()
+            return [dict(row) for row in rows]
 
-                t["status"] = "done"
-                self._save_tasks(tasks)
-                return f"Task {task_id} marked as done."
+        tasks = self._cached(("tasks", status, owner, limit, offset if limit is not None else 0), load)
+        return [dict(t) for t in tasks]
 
-        return f"Error: Task with ID {task_id} not found."
+    def count_tasks(self, status: str = None, owner: str = None) -> int:
+        """
+        Returns how many tasks match, e.g. to page through them with get_tasks.
+        """
+        def load() -> int:
+            where, params = self._where(status, owner)
+            return self._connection().execute(f"SELECT COUNT(*) FROM tasks {where}", params).fetchone()[0]
+
+        return self._cached(("count", status, owner), load)
 
-    def get_tasks(self) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _where(status: str = None, owner: str = None):
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if owner is not None:
+            conditions.append("owner = ?")
+            params.append(owner)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def _cached(self, key, load):
         """
-        Returns the list of all tasks.
+        Returns load()'s result, reusing it until the database changes.
         """
-        try:
-            with open(self.file_path, "r", encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return []
+        version = self._version()
+        with self._cache_lock:
+            if version != self._cache_version:
+                self._cache, self._cache_version = OrderedDict(), version
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        value = load()
+
+        with self._cache_lock:
+            if version == self._cache_version:
+                self._cache[key] = value
+                while len(self._cache) > self._cache_entries:
+                    self._cache.popitem(last=False)
+        return value
+
+    def version(self):
+        """
+        Changes whenever the task list may have changed, e.g. so a view only reloads it then.
+        """
+        return self._version()
+
+    def _version(self):
+        """
+        Changes whenever any process writes to the database (main file or write-ahead log).
+        """
+        version = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
 
-    def _save_tasks(self, tasks: List[Dict[str, Any]]) -> None:
+    def _invalidate(self) -> None:
         """
-        Internal method to save the updated tasks list back to the file.
+        Drops cached reads after our own writes, even if the file timestamps didn't move.
         """
-        with open(self.file_path, "w", encoding='utf-8') as f:
-            json.dump(tasks, f, indent=4, ensure_ascii=False)
\ No newline at end of file
+        with self._cache_lock:
+            self._cache, self._cache_version = OrderedDict(), None